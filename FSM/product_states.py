@@ -7,3 +7,4 @@ class ProductManagementStates(StatesGroup):
     waiting_for_account_selection = State()  # Выбор магазина
     waiting_for_article_selection = State()  # Выбор артикула
     waiting_for_new_name = State()  # Ввод нового названия
+    waiting_for_search_query = State()  # Ввод строки поиска товара
@@ -0,0 +1,72 @@
+"""Add product daily stats and funnel backfill checkpoints
+
+Revision ID: 3b8e1f2c7a41
+Revises: 9997bfbc462f
+Create Date: 2026-10-19 10:12:31.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3b8e1f2c7a41'
+down_revision: Union[str, Sequence[str], None] = '9997bfbc462f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицы могли быть уже созданы через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('product_daily_stats'):
+        op.create_table(
+            'product_daily_stats',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=False, comment='Артикул WB'),
+            sa.Column('supplier_article', sa.String(length=100), nullable=True, comment='Артикул поставщика'),
+            sa.Column('stat_date', sa.Date(), nullable=False, comment='День статистики'),
+            sa.Column('views', sa.Integer(), nullable=False),
+            sa.Column('carts', sa.Integer(), nullable=False),
+            sa.Column('orders', sa.Integer(), nullable=False),
+            sa.Column('order_sum', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('buyouts', sa.Integer(), nullable=False),
+            sa.Column('buyout_sum', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_product_daily_stat', 'product_daily_stats',
+                        ['seller_account_id', 'nm_id', 'stat_date'], unique=True)
+        op.create_index('ix_product_daily_stats_account_date', 'product_daily_stats',
+                        ['seller_account_id', 'stat_date'], unique=False)
+
+    if not inspector.has_table('funnel_backfill_checkpoints'):
+        op.create_table(
+            'funnel_backfill_checkpoints',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False),
+            sa.Column('oldest_date', sa.Date(), nullable=True),
+            sa.Column('newest_date', sa.Date(), nullable=True),
+            sa.Column('window_start', sa.Date(), nullable=True),
+            sa.Column('window_end', sa.Date(), nullable=True),
+            sa.Column('last_nm_id', sa.BigInteger(), nullable=True),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('seller_account_id')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('funnel_backfill_checkpoints')
+    op.drop_index('ix_product_daily_stats_account_date', table_name='product_daily_stats')
+    op.drop_index('ix_unique_product_daily_stat', table_name='product_daily_stats')
+    op.drop_table('product_daily_stats')
@@ -0,0 +1,96 @@
+"""Add realization report rows and sync states
+
+Revision ID: 5d27c9a0e6b3
+Revises: 3b8e1f2c7a41
+Create Date: 2026-10-19 11:40:07.532911
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '5d27c9a0e6b3'
+down_revision: Union[str, Sequence[str], None] = '3b8e1f2c7a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицы могли быть уже созданы через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('realization_report_rows'):
+        money = dict(precision=14, scale=2)
+        op.create_table(
+            'realization_report_rows',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('rrd_id', sa.BigInteger(), nullable=False, comment='ID строки отчета'),
+            sa.Column('realizationreport_id', sa.BigInteger(), nullable=True, comment='ID отчета'),
+            sa.Column('report_date_from', sa.Date(), nullable=True, comment='Начало периода отчета'),
+            sa.Column('report_date_to', sa.Date(), nullable=True, comment='Конец периода отчета'),
+            sa.Column('rr_dt', sa.Date(), nullable=True, comment='Дата операции'),
+            sa.Column('sale_dt', sa.DateTime(), nullable=True, comment='Дата продажи'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=True, comment='Артикул WB'),
+            sa.Column('sa_name', sa.String(length=100), nullable=True, comment='Артикул поставщика'),
+            sa.Column('subject_name', sa.String(length=150), nullable=True),
+            sa.Column('brand_name', sa.String(length=150), nullable=True),
+            sa.Column('doc_type_name', sa.String(length=50), nullable=True, comment='Тип документа'),
+            sa.Column('supplier_oper_name', sa.String(length=100), nullable=True, comment='Обоснование оплаты'),
+            sa.Column('srid', sa.String(length=100), nullable=True, comment='Уникальный ID заказа'),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('retail_price_withdisc_rub', sa.Numeric(**money), nullable=False),
+            sa.Column('retail_amount', sa.Numeric(**money), nullable=False),
+            sa.Column('ppvz_for_pay', sa.Numeric(**money), nullable=False, comment='К перечислению продавцу'),
+            sa.Column('ppvz_sales_commission', sa.Numeric(**money), nullable=False),
+            sa.Column('ppvz_vw', sa.Numeric(**money), nullable=False, comment='Вознаграждение WB без НДС'),
+            sa.Column('ppvz_vw_nds', sa.Numeric(**money), nullable=False),
+            sa.Column('acquiring_fee', sa.Numeric(**money), nullable=False),
+            sa.Column('delivery_amount', sa.Integer(), nullable=False),
+            sa.Column('return_amount', sa.Integer(), nullable=False),
+            sa.Column('delivery_rub', sa.Numeric(**money), nullable=False, comment='Стоимость логистики'),
+            sa.Column('storage_fee', sa.Numeric(**money), nullable=False),
+            sa.Column('penalty', sa.Numeric(**money), nullable=False),
+            sa.Column('deduction', sa.Numeric(**money), nullable=False),
+            sa.Column('acceptance', sa.Numeric(**money), nullable=False),
+            sa.Column('additional_payment', sa.Numeric(**money), nullable=False),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_realization_rrd', 'realization_report_rows',
+                        ['seller_account_id', 'rrd_id'], unique=True)
+        op.create_index('ix_realization_account_period', 'realization_report_rows',
+                        ['seller_account_id', 'report_date_from', 'report_date_to'], unique=False)
+
+    if not inspector.has_table('realization_sync_states'):
+        op.create_table(
+            'realization_sync_states',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False),
+            sa.Column('date_from', sa.Date(), nullable=False),
+            sa.Column('date_to', sa.Date(), nullable=False),
+            sa.Column('period', sa.String(length=10), nullable=False),
+            sa.Column('last_rrd_id', sa.BigInteger(), nullable=False),
+            sa.Column('rows_loaded', sa.Integer(), nullable=False),
+            sa.Column('completed', sa.Boolean(), nullable=False),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_realization_sync_period', 'realization_sync_states',
+                        ['seller_account_id', 'date_from', 'date_to', 'period'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_unique_realization_sync_period', table_name='realization_sync_states')
+    op.drop_table('realization_sync_states')
+    op.drop_index('ix_realization_account_period', table_name='realization_report_rows')
+    op.drop_index('ix_unique_realization_rrd', table_name='realization_report_rows')
+    op.drop_table('realization_report_rows')
@@ -0,0 +1,43 @@
+"""Add weekly pnl deliveries
+
+Revision ID: 7e3b9c0d5a12
+Revises: d4a7e2c91f36
+Create Date: 2026-10-20 10:48:31.517302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '7e3b9c0d5a12'
+down_revision: Union[str, Sequence[str], None] = 'd4a7e2c91f36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('weekly_pnl_deliveries'):
+        op.create_table(
+            'weekly_pnl_deliveries',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('week_start', sa.Date(), nullable=False, comment='Понедельник недели'),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_weekly_pnl_delivery', 'weekly_pnl_deliveries',
+                        ['seller_account_id', 'week_start'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_unique_weekly_pnl_delivery', table_name='weekly_pnl_deliveries')
+    op.drop_table('weekly_pnl_deliveries')
@@ -0,0 +1,58 @@
+"""Add weekly article pnl
+
+Revision ID: 8a4c6e1d2f90
+Revises: 5d27c9a0e6b3
+Create Date: 2026-10-19 14:02:51.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '8a4c6e1d2f90'
+down_revision: Union[str, Sequence[str], None] = '5d27c9a0e6b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('weekly_article_pnl'):
+        money = dict(precision=14, scale=2)
+        op.create_table(
+            'weekly_article_pnl',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('week_start', sa.Date(), nullable=False, comment='Понедельник недели'),
+            sa.Column('week_end', sa.Date(), nullable=False, comment='Воскресенье недели'),
+            sa.Column('article', sa.String(length=100), nullable=False,
+                      comment='Артикул поставщика (пусто - операции без артикула)'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=True, comment='Артикул WB'),
+            sa.Column('sold_quantity', sa.Integer(), nullable=False),
+            sa.Column('returned_quantity', sa.Integer(), nullable=False),
+            sa.Column('revenue', sa.Numeric(**money), nullable=False),
+            sa.Column('returns', sa.Numeric(**money), nullable=False),
+            sa.Column('commission', sa.Numeric(**money), nullable=False),
+            sa.Column('logistics', sa.Numeric(**money), nullable=False),
+            sa.Column('storage', sa.Numeric(**money), nullable=False),
+            sa.Column('penalties', sa.Numeric(**money), nullable=False),
+            sa.Column('other_deductions', sa.Numeric(**money), nullable=False),
+            sa.Column('payout', sa.Numeric(**money), nullable=False, comment='Итого к перечислению продавцу'),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_weekly_article_pnl', 'weekly_article_pnl',
+                        ['seller_account_id', 'week_start', 'article'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_unique_weekly_article_pnl', table_name='weekly_article_pnl')
+    op.drop_table('weekly_article_pnl')
@@ -0,0 +1,42 @@
+"""Add product search indexes
+
+Revision ID: a6f2d8c41b97
+Revises: e29d4a7c8b15
+Create Date: 2026-10-19 18:05:37.216843
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a6f2d8c41b97'
+down_revision: Union[str, Sequence[str], None] = 'e29d4a7c8b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Индексы могли быть уже созданы через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+    existing = {index['name'] for index in inspector.get_indexes('products')}
+
+    # Поиск по началу артикула без учета регистра: lower(supplier_article) LIKE 'abc%'
+    if 'ix_products_article_prefix' not in existing:
+        op.create_index('ix_products_article_prefix', 'products',
+                        [sa.text('lower(supplier_article) text_pattern_ops')])
+
+    # Поиск по подстроке названия без учета регистра: custom_name ILIKE '%abc%'
+    if 'ix_products_custom_name_trgm' not in existing:
+        op.create_index('ix_products_custom_name_trgm', 'products', ['custom_name'],
+                        postgresql_using='gin', postgresql_ops={'custom_name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_custom_name_trgm', table_name='products')
+    op.drop_index('ix_products_article_prefix', table_name='products')
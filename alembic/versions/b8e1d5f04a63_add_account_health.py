@@ -0,0 +1,49 @@
+"""Add account health
+
+Revision ID: b8e1d5f04a63
+Revises: f3c9a1e7b052
+Create Date: 2026-10-19 21:02:37.415920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b8e1d5f04a63'
+down_revision: Union[str, Sequence[str], None] = 'f3c9a1e7b052'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('account_health'):
+        op.create_table(
+            'account_health',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('state', sa.String(length=20), nullable=False),
+            sa.Column('reason', sa.String(length=20), nullable=True),
+            sa.Column('failures', sa.Integer(), nullable=False, comment='Временных ошибок подряд'),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('opened_at', sa.DateTime(), nullable=True),
+            sa.Column('retry_at', sa.DateTime(), nullable=True, comment='Время пробного запроса'),
+            sa.Column('cooldown', sa.Integer(), nullable=False, comment='Текущая пауза до пробного запроса, сек.'),
+            sa.Column('key_hash', sa.String(length=64), nullable=True,
+                      comment='Хэш отклоненного ключа (новый ключ снимает блокировку)'),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('seller_account_id')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('account_health')
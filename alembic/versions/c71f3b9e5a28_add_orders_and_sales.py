@@ -0,0 +1,110 @@
+"""Add orders and sales
+
+Revision ID: c71f3b9e5a28
+Revises: 8a4c6e1d2f90
+Create Date: 2026-10-19 15:27:44.610392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c71f3b9e5a28'
+down_revision: Union[str, Sequence[str], None] = '8a4c6e1d2f90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицы могли быть уже созданы через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+    money = dict(precision=14, scale=2)
+
+    if not inspector.has_table('orders'):
+        op.create_table(
+            'orders',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('srid', sa.String(length=100), nullable=False, comment='Уникальный ID заказа'),
+            sa.Column('g_number', sa.String(length=100), nullable=True, comment='ID корзины покупателя'),
+            sa.Column('order_date', sa.DateTime(), nullable=False, comment='Дата и время заказа'),
+            sa.Column('last_change_date', sa.DateTime(), nullable=False, comment='Дата и время обновления в WB'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=True, comment='Артикул WB'),
+            sa.Column('supplier_article', sa.String(length=100), nullable=True, comment='Артикул поставщика'),
+            sa.Column('warehouse_name', sa.String(length=100), nullable=True),
+            sa.Column('region_name', sa.String(length=100), nullable=True),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('total_price', sa.Numeric(**money), nullable=False),
+            sa.Column('discount_percent', sa.Integer(), nullable=False),
+            sa.Column('price_with_disc', sa.Numeric(**money), nullable=False),
+            sa.Column('finished_price', sa.Numeric(**money), nullable=False),
+            sa.Column('is_cancel', sa.Boolean(), nullable=False),
+            sa.Column('cancel_date', sa.DateTime(), nullable=True),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_order_srid', 'orders', ['seller_account_id', 'srid'], unique=True)
+        op.create_index('ix_orders_account_date', 'orders', ['seller_account_id', 'order_date'], unique=False)
+        op.create_index('ix_orders_account_last_change', 'orders',
+                        ['seller_account_id', 'last_change_date'], unique=False)
+
+    if not inspector.has_table('sales'):
+        op.create_table(
+            'sales',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('srid', sa.String(length=100), nullable=False, comment='Уникальный ID заказа'),
+            sa.Column('sale_id', sa.String(length=50), nullable=False, comment='ID продажи или возврата'),
+            sa.Column('sale_date', sa.DateTime(), nullable=False, comment='Дата и время продажи'),
+            sa.Column('last_change_date', sa.DateTime(), nullable=False, comment='Дата и время обновления в WB'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=True, comment='Артикул WB'),
+            sa.Column('supplier_article', sa.String(length=100), nullable=True, comment='Артикул поставщика'),
+            sa.Column('warehouse_name', sa.String(length=100), nullable=True),
+            sa.Column('region_name', sa.String(length=100), nullable=True),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('total_price', sa.Numeric(**money), nullable=False),
+            sa.Column('price_with_disc', sa.Numeric(**money), nullable=False),
+            sa.Column('finished_price', sa.Numeric(**money), nullable=False),
+            sa.Column('for_pay', sa.Numeric(**money), nullable=False, comment='К перечислению продавцу'),
+            sa.Column('is_realization', sa.Boolean(), nullable=False),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_sale_srid', 'sales', ['seller_account_id', 'srid', 'sale_id'], unique=True)
+        op.create_index('ix_sales_account_date', 'sales', ['seller_account_id', 'sale_date'], unique=False)
+        op.create_index('ix_sales_account_last_change', 'sales',
+                        ['seller_account_id', 'last_change_date'], unique=False)
+
+    if not inspector.has_table('orders_sync_states'):
+        op.create_table(
+            'orders_sync_states',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('orders_synced_at', sa.DateTime(), nullable=True),
+            sa.Column('sales_synced_at', sa.DateTime(), nullable=True),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('seller_account_id')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('orders_sync_states')
+    op.drop_index('ix_sales_account_last_change', table_name='sales')
+    op.drop_index('ix_sales_account_date', table_name='sales')
+    op.drop_index('ix_unique_sale_srid', table_name='sales')
+    op.drop_table('sales')
+    op.drop_index('ix_orders_account_last_change', table_name='orders')
+    op.drop_index('ix_orders_account_date', table_name='orders')
+    op.drop_index('ix_unique_order_srid', table_name='orders')
+    op.drop_table('orders')
@@ -0,0 +1,33 @@
+"""Add report job waiters
+
+Revision ID: d4a7e2c91f36
+Revises: b8e1d5f04a63
+Create Date: 2026-10-20 10:12:08.204517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd4a7e2c91f36'
+down_revision: Union[str, Sequence[str], None] = 'b8e1d5f04a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Колонка могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('report_jobs')}
+
+    if 'waiters' not in columns:
+        op.add_column('report_jobs', sa.Column('waiters', sa.Integer(), server_default='0', nullable=False,
+                                               comment='Сколько отчетов ждут результат задания'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('report_jobs', 'waiters')
@@ -0,0 +1,49 @@
+"""Add stock snapshots
+
+Revision ID: e29d4a7c8b15
+Revises: c71f3b9e5a28
+Create Date: 2026-10-19 16:48:12.904517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e29d4a7c8b15'
+down_revision: Union[str, Sequence[str], None] = 'c71f3b9e5a28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('stock_snapshots'):
+        op.create_table(
+            'stock_snapshots',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('snapshot_date', sa.Date(), nullable=False, comment='День снимка'),
+            sa.Column('nm_id', sa.BigInteger(), nullable=False, comment='Артикул WB'),
+            sa.Column('supplier_article', sa.String(length=100), nullable=True, comment='Артикул поставщика'),
+            sa.Column('warehouse_name', sa.String(length=100), nullable=False, comment='Склад'),
+            sa.Column('quantity', sa.Integer(), nullable=False, comment='Доступно для продажи (сумма по размерам)'),
+            sa.Column('in_way_to_client', sa.Integer(), nullable=False),
+            sa.Column('in_way_from_client', sa.Integer(), nullable=False),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_unique_stock_snapshot', 'stock_snapshots',
+                        ['seller_account_id', 'snapshot_date', 'nm_id', 'warehouse_name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_unique_stock_snapshot', table_name='stock_snapshots')
+    op.drop_table('stock_snapshots')
@@ -0,0 +1,55 @@
+"""Add report jobs
+
+Revision ID: f3c9a1e7b052
+Revises: a6f2d8c41b97
+Create Date: 2026-10-19 20:14:51.638207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'f3c9a1e7b052'
+down_revision: Union[str, Sequence[str], None] = 'a6f2d8c41b97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через create_db() при старте бота
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('report_jobs'):
+        op.create_table(
+            'report_jobs',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('kind', sa.String(length=50), nullable=False, comment='Тип отчета'),
+            sa.Column('seller_account_id', sa.Integer(), nullable=False, comment='Связь с аккаунтом продавца'),
+            sa.Column('report_date', sa.Date(), nullable=False, comment='День, за который строится отчет'),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('worker', sa.String(length=100), nullable=True, comment='Процесс, выполняющий задание'),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True,
+                      comment='Снимок магазина для отображения'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created', sa.DateTime(), nullable=False),
+            sa.Column('updated', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['seller_account_id'], ['seller_accounts.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_report_jobs_status', 'report_jobs', ['status', 'id'], unique=False)
+        op.create_index('ix_report_jobs_lookup', 'report_jobs', ['kind', 'seller_account_id', 'report_date'],
+                        unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_report_jobs_lookup', table_name='report_jobs')
+    op.drop_index('ix_report_jobs_status', table_name='report_jobs')
+    op.drop_table('report_jobs')
@@ -0,0 +1,129 @@
+# benchmarks/fake_telegram.py
+"""
+Сессия бота без сети для замеров: все запросы к Telegram записываются и получают правдоподобный ответ.
+Middleware сессии (лимиты Telegram, пропуск одинаковых правок) работают как с настоящей сессией.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from datetime import datetime
+from typing import AsyncGenerator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import (EditMessageCaption, EditMessageReplyMarkup, EditMessageText, GetChatAdministrators,
+                             GetChatMember, GetMe, SendDocument, SendMessage, SendPhoto, TelegramMethod)
+from aiogram.types import Chat, ChatMemberAdministrator, ChatMemberMember, ChatMemberOwner, Message, User
+
+BOT_ID = 100000001
+BOT_USER = User(id=BOT_ID, is_bot=True, first_name="Benchmark", username="benchmark_bot")
+
+# Методы, которые возвращают отправленное или измененное сообщение
+MESSAGE_METHODS = (SendMessage, SendDocument, SendPhoto, EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+# Для Bot(...) нужен токен правильного формата
+FAKE_BOT_TOKEN = f"{BOT_ID}:AAbenchmarkbenchmarkbenchmarkbenchmark"
+
+
+class RecordingSession(BaseSession):
+    def __init__(self, admin_ids: Iterable[int] = (), latency: float = 0.0,
+                 on_request: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self.admin_ids = set(admin_ids)
+        # Имитация времени ответа Telegram в секундах
+        self.latency = latency
+        # Вызывается с именем метода перед каждым запросом (в задаче, которая его отправила)
+        self.on_request = on_request
+        self.calls: Counter = Counter()
+        # (время, метод, chat_id) каждого запроса - для проверки лимитов
+        self.log: List[Tuple[float, str, Optional[int]]] = []
+        self._message_ids = itertools.count(1000)
+
+    def reset(self):
+        self.calls.clear()
+        self.log.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.calls)
+
+    def _message(self, method: TelegramMethod) -> Message:
+        chat_id = getattr(method, "chat_id", None)
+        message_id = getattr(method, "message_id", None) or next(self._message_ids)
+        chat_type = "supergroup" if isinstance(chat_id, int) and chat_id < 0 else "private"
+        return Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type=chat_type),
+            from_user=BOT_USER,
+            text=getattr(method, "text", None),
+            reply_markup=getattr(method, "reply_markup", None),
+        )
+
+    def _member(self, user_id: int):
+        user = User(id=user_id, is_bot=False, first_name=f"User {user_id}")
+        if user_id in self.admin_ids:
+            return ChatMemberAdministrator(
+                user=user, can_be_edited=False, is_anonymous=False, can_manage_chat=True, can_delete_messages=True,
+                can_manage_video_chats=False, can_restrict_members=True, can_promote_members=False,
+                can_change_info=False, can_invite_users=True, can_post_stories=False, can_edit_stories=False,
+                can_delete_stories=False,
+            )
+        return ChatMemberMember(user=user)
+
+    def _response(self, method: TelegramMethod):
+        if isinstance(method, MESSAGE_METHODS):
+            if getattr(method, "inline_message_id", None):
+                return True
+            return self._message(method)
+        if isinstance(method, GetMe):
+            return BOT_USER
+        if isinstance(method, GetChatMember):
+            return self._member(method.user_id)
+        if isinstance(method, GetChatAdministrators):
+            owner = ChatMemberOwner(user=BOT_USER, is_anonymous=False)
+            return [owner] + [self._member(user_id) for user_id in sorted(self.admin_ids)]
+        return True
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        self.log.append((time.monotonic(), name, getattr(method, "chat_id", None)))
+        if self.on_request is not None:
+            self.on_request(name)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(method)
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def user_data(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Admin {user_id}", "language_code": "ru"}
+
+
+def message_data(user_id: int, text: str, message_id: int, from_bot: bool = False) -> Dict:
+    """Сообщение в личном чате пользователя (от пользователя или от бота)"""
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"Admin {user_id}"},
+        "from": BOT_USER.model_dump(exclude_none=True) if from_bot else user_data(user_id),
+        "text": text,
+    }
+
+
+def callback_query_data(user_id: int, data: str, message_id: int = 1, query_id: str = "1") -> Dict:
+    """Нажатие инлайн-кнопки под сообщением бота"""
+    return {
+        "id": query_id,
+        "from": user_data(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": message_data(user_id, "Меню", message_id, from_bot=True),
+    }
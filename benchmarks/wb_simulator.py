@@ -0,0 +1,539 @@
+# benchmarks/wb_simulator.py
+"""
+Локальный симулятор WB API (statistics-api и seller-analytics-api) для нагрузочных замеров.
+
+Для каждого токена генерируется детерминированный каталог заданного размера, заказы, продажи,
+остатки, отчет о реализации и воронка продаж. Поддерживаются пагинация (offset, rrdid, lastChangeDate),
+лимиты запросов на токен с ответом 429 + Retry-After, искусственная задержка и ошибки сервера.
+
+Запуск:
+    python -m benchmarks.wb_simulator --port 8081 --products 10000 --rate-limit-scale 60
+
+Бот направляется на симулятор переменными окружения:
+    WB_STATISTICS_API_URL=http://127.0.0.1:8081
+    WB_ANALYTICS_API_URL=http://127.0.0.1:8081
+    WB_RATE_LIMIT_SCALE=60  (тот же множитель, что и у симулятора)
+
+Токены, содержащие "invalid", получают 401. Счетчики запросов: GET /__stats, сброс: POST /__reset.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from functions.wb_endpoints import WB_ENDPOINT_GROUPS
+from functions.wb_rate_limiter import WB_RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+BRANDS = ("Nordic Home", "Урбан", "SoftLine", "Эко Стиль", "Basic Lab")
+SUBJECTS = ("Футболки", "Кружки", "Пледы", "Рюкзаки", "Носки", "Полотенца")
+WAREHOUSES = ("Коледино", "Электросталь", "Казань", "Краснодар", "Новосибирск")
+REGIONS = ("Московская", "Санкт-Петербург", "Татарстан", "Краснодарский", "Свердловская")
+
+WB_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+@dataclass
+class SimulatorConfig:
+    products: int = 100  # Размер каталога каждого токена
+    seed: int = 0
+    orders_per_product_day: float = 0.3  # Среднее число заказов на товар в день
+    buyout_rate: float = 0.7  # Доля выкупленных заказов
+    history_days: int = 90  # WB хранит заказы и продажи 90 дней
+    page_size: int = 80000  # Максимум строк в ответе orders/sales (как у WB)
+    latency_ms: float = 0.0  # Средняя задержка ответа
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0  # Доля ответов 500
+    rate_limit_scale: float = 1.0  # Множитель лимитов WB (0 - без лимитов)
+
+
+def _token_seed(seed: int, token: str) -> int:
+    return int(hashlib.sha256(f"{seed}:{token}".encode()).hexdigest()[:16], 16)
+
+
+def _format_dt(value: datetime) -> str:
+    return value.strftime(WB_DATETIME_FORMAT)
+
+
+def _parse_date_from(value: Optional[str]) -> datetime:
+    """dateFrom в форматах WB: дата или дата со временем (RFC3339 без таймзоны)"""
+    if not value:
+        raise ValueError("dateFrom is required")
+    value = value.replace("Z", "")
+    if len(value) <= 10:
+        return datetime.combine(date.fromisoformat(value), datetime.min.time())
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+class _Bucket:
+    """Токен-бакет лимита WB: возвращает 0, если запрос разрешен, иначе время до следующего токена"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class SellerCatalog:
+    """Детерминированные данные одного продавца (токена)"""
+
+    def __init__(self, token: str, config: SimulatorConfig):
+        self.config = config
+        self.seed = _token_seed(config.seed, token)
+        self.prefix = hashlib.sha1(token.encode()).hexdigest()[:6]
+
+        rng = random.Random(self.seed)
+        base_nm_id = rng.randrange(10_000_000, 300_000_000)
+        self.products: List[Dict] = []
+        for i in range(config.products):
+            nm_id = base_nm_id + i
+            self.products.append({
+                "nmId": nm_id,
+                "vendorCode": f"SKU-{self.prefix}-{i:05d}",
+                "title": f"{rng.choice(SUBJECTS)[:-1]} модель {i}",
+                "brandName": rng.choice(BRANDS),
+                "subjectName": rng.choice(SUBJECTS),
+                "barcode": str(2_000_000_000_000 + nm_id),
+                "price": rng.randrange(300, 5000, 10),
+                "discount": rng.choice((0, 10, 15, 20, 30, 40)),
+                "warehouses": rng.sample(WAREHOUSES, rng.randint(1, 3)),
+            })
+
+        # Кэши привязаны к экземпляру
+        self.orders_for_day = lru_cache(maxsize=256)(self._orders_for_day)
+        self.sales_for_day = lru_cache(maxsize=256)(self._sales_for_day)
+
+    def _day_rng(self, kind: str, day: date) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{day.toordinal()}")
+
+    def _orders_for_day(self, day: date) -> Tuple[Dict, ...]:
+        rng = self._day_rng("orders", day)
+        expected = len(self.products) * self.config.orders_per_product_day
+        count = max(0, int(rng.gauss(expected, math.sqrt(expected) if expected else 0)))
+        start = datetime.combine(day, datetime.min.time())
+        orders = []
+
+        for j in range(count):
+            # Спрос смещен к началу каталога: есть популярные и "спящие" товары
+            product = self.products[int(len(self.products) * rng.random() ** 2)]
+            order_date = start + timedelta(seconds=rng.randrange(86400))
+            is_cancel = rng.random() < 0.05
+            price_with_disc = round(product["price"] * (100 - product["discount"]) / 100, 2)
+            orders.append({
+                "date": _format_dt(order_date),
+                "lastChangeDate": _format_dt(order_date + timedelta(minutes=rng.randrange(1, 180))),
+                "warehouseName": rng.choice(product["warehouses"]),
+                "regionName": rng.choice(REGIONS),
+                "supplierArticle": product["vendorCode"],
+                "nmId": product["nmId"],
+                "barcode": product["barcode"],
+                "subject": product["subjectName"],
+                "brand": product["brandName"],
+                "totalPrice": product["price"],
+                "discountPercent": product["discount"],
+                "priceWithDisc": price_with_disc,
+                "finishedPrice": round(price_with_disc * 0.97, 2),
+                "quantity": 1,
+                "isCancel": is_cancel,
+                "cancelDate": _format_dt(order_date + timedelta(hours=rng.randrange(1, 24))) if is_cancel
+                else "0001-01-01T00:00:00",
+                "gNumber": f"{self.prefix}{day:%Y%m%d}{j // 3:06d}",
+                "srid": f"{self.prefix}.{day:%Y%m%d}.{j:06d}",
+                # Служебные поля симулятора для построения продаж
+                "_buyout": not is_cancel and rng.random() < self.config.buyout_rate,
+                "_sale_delay": rng.randint(1, 3),
+            })
+        return tuple(orders)
+
+    def _sales_for_day(self, day: date) -> Tuple[Dict, ...]:
+        """Выкупы заказов, сделанных за 1-3 дня до этого дня"""
+        sales = []
+        for delay in (1, 2, 3):
+            order_day = day - timedelta(days=delay)
+            rng = self._day_rng(f"sales{delay}", day)
+            for order in self.orders_for_day(order_day):
+                if not order["_buyout"] or order["_sale_delay"] != delay:
+                    continue
+                sale_date = datetime.fromisoformat(order["date"]) + timedelta(days=delay)
+                price_with_disc = order["priceWithDisc"]
+                sales.append({
+                    "date": _format_dt(sale_date),
+                    "lastChangeDate": _format_dt(sale_date + timedelta(minutes=rng.randrange(1, 120))),
+                    "warehouseName": order["warehouseName"],
+                    "regionName": order["regionName"],
+                    "supplierArticle": order["supplierArticle"],
+                    "nmId": order["nmId"],
+                    "barcode": order["barcode"],
+                    "subject": order["subject"],
+                    "brand": order["brand"],
+                    "totalPrice": order["totalPrice"],
+                    "discountPercent": order["discountPercent"],
+                    "priceWithDisc": price_with_disc,
+                    "finishedPrice": order["finishedPrice"],
+                    "forPay": round(price_with_disc * 0.78, 2),
+                    "quantity": 1,
+                    "isRealization": True,
+                    "saleID": f"S{order['srid'].replace('.', '')}",
+                    "gNumber": order["gNumber"],
+                    "srid": order["srid"],
+                })
+        sales.sort(key=lambda item: item["date"])
+        return tuple(sales)
+
+    def _history_days(self, date_from: datetime, now: datetime) -> List[date]:
+        first = max(date_from.date() - timedelta(days=1), now.date() - timedelta(days=self.config.history_days))
+        return [first + timedelta(days=i) for i in range((now.date() - first).days + 1)]
+
+    def changed_rows(self, kind: str, date_from: datetime, flag: int, now: datetime) -> List[Dict]:
+        """Строки заказов или продаж в семантике WB: flag=1 - за день dateFrom, flag=0 - по lastChangeDate"""
+        source = self.orders_for_day if kind == "orders" else self.sales_for_day
+        now_str = _format_dt(now)
+
+        if flag == 1:
+            rows = [row for row in source(date_from.date()) if row["date"] <= now_str]
+        else:
+            date_from_str = _format_dt(date_from)
+            rows = [row for day in self._history_days(date_from, now) for row in source(day)
+                    if date_from_str <= row["lastChangeDate"] <= now_str]
+            rows.sort(key=lambda item: item["lastChangeDate"])
+            rows = rows[:self.config.page_size]
+
+        return [{key: value for key, value in row.items() if not key.startswith("_")} for row in rows]
+
+    def stocks(self, date_from: datetime, now: datetime) -> List[Dict]:
+        rng = random.Random(f"{self.seed}:stocks:{now.date().toordinal()}")
+        rows = []
+        for product in self.products:
+            for warehouse in product["warehouses"]:
+                last_change = datetime.combine(now.date(), datetime.min.time()) - timedelta(days=rng.randrange(0, 30))
+                if last_change < date_from:
+                    continue
+                quantity = rng.randrange(0, 200)
+                rows.append({
+                    "lastChangeDate": _format_dt(last_change),
+                    "warehouseName": warehouse,
+                    "supplierArticle": product["vendorCode"],
+                    "nmId": product["nmId"],
+                    "barcode": product["barcode"],
+                    "quantity": quantity,
+                    "inWayToClient": rng.randrange(0, 10),
+                    "inWayFromClient": rng.randrange(0, 5),
+                    "quantityFull": quantity + rng.randrange(0, 15),
+                    "category": "Товары",
+                    "subject": product["subjectName"],
+                    "brand": product["brandName"],
+                    "techSize": "0",
+                    "Price": product["price"],
+                    "Discount": product["discount"],
+                    "isSupply": True,
+                    "isRealization": False,
+                    "SCCode": "Tech",
+                })
+        return rows
+
+    def realization_rows(self, date_from: date, date_to: date) -> List[Dict]:
+        """Строки отчета о реализации: продажа и логистика на каждый выкуп, rrd_id растет по дням"""
+        rows = []
+        report_id = _token_seed(self.config.seed, f"{self.prefix}{date_from}") % 10_000_000
+        day = date_from
+        while day <= date_to:
+            index = 0
+            for sale in self.sales_for_day(day):
+                retail = sale["priceWithDisc"]
+                common = {
+                    "realizationreport_id": report_id,
+                    "date_from": date_from.isoformat(),
+                    "date_to": date_to.isoformat(),
+                    "rr_dt": day.isoformat(),
+                    "sale_dt": sale["date"],
+                    "nm_id": sale["nmId"],
+                    "sa_name": sale["supplierArticle"],
+                    "subject_name": sale["subject"],
+                    "brand_name": sale["brand"],
+                    "srid": sale["srid"],
+                }
+                for oper in ("Продажа", "Логистика"):
+                    is_sale = oper == "Продажа"
+                    rows.append({
+                        **common,
+                        "rrd_id": day.toordinal() * 1_000_000 + index,
+                        "doc_type_name": "Продажа" if is_sale else "",
+                        "supplier_oper_name": oper,
+                        "quantity": 1 if is_sale else 0,
+                        "delivery_amount": 0 if is_sale else 1,
+                        "return_amount": 0,
+                        "retail_price_withdisc_rub": retail if is_sale else 0,
+                        "retail_amount": retail if is_sale else 0,
+                        "ppvz_for_pay": sale["forPay"] if is_sale else 0,
+                        "ppvz_sales_commission": round(retail * 0.2, 2) if is_sale else 0,
+                        "ppvz_vw": round(retail * 0.17, 2) if is_sale else 0,
+                        "ppvz_vw_nds": round(retail * 0.03, 2) if is_sale else 0,
+                        "acquiring_fee": round(retail * 0.015, 2) if is_sale else 0,
+                        "delivery_rub": 0 if is_sale else 55.0,
+                        "storage_fee": 0,
+                        "penalty": 0,
+                        "deduction": 0,
+                        "acceptance": 0,
+                        "additional_payment": 0,
+                    })
+                    index += 1
+            day += timedelta(days=1)
+        return rows
+
+    def funnel_products(self, start: date, end: date) -> List[Dict]:
+        """Воронка по всем товарам каталога за период, сортировка по просмотрам"""
+        stats = defaultdict(lambda: {"orderCount": 0, "orderSum": 0.0, "buyoutCount": 0, "buyoutSum": 0.0})
+        day = start
+        while day <= end:
+            for order in self.orders_for_day(day):
+                item = stats[order["nmId"]]
+                item["orderCount"] += 1
+                item["orderSum"] += order["priceWithDisc"]
+            for sale in self.sales_for_day(day):
+                item = stats[sale["nmId"]]
+                item["buyoutCount"] += 1
+                item["buyoutSum"] += sale["priceWithDisc"]
+            day += timedelta(days=1)
+
+        rng = random.Random(f"{self.seed}:funnel:{start.toordinal()}:{end.toordinal()}")
+        items = []
+        for product in self.products:
+            item = stats.get(product["nmId"]) or {"orderCount": 0, "orderSum": 0.0, "buyoutCount": 0,
+                                                  "buyoutSum": 0.0}
+            carts = item["orderCount"] * rng.randint(2, 4) + rng.randrange(0, 3)
+            views = carts * rng.randint(5, 15) + rng.randrange(0, 20)
+            selected = {
+                "openCount": views,
+                "cartCount": carts,
+                "orderCount": item["orderCount"],
+                "orderSum": round(item["orderSum"], 2),
+                "buyoutCount": item["buyoutCount"],
+                "buyoutSum": round(item["buyoutSum"], 2),
+                "conversions": {
+                    "addToCartPercent": round(carts / views * 100, 1) if views else 0,
+                    "cartToOrderPercent": round(item["orderCount"] / carts * 100, 1) if carts else 0,
+                },
+            }
+            items.append({
+                "product": {key: product[key] for key in ("nmId", "vendorCode", "title", "brandName", "subjectName")},
+                "statistic": {"selected": selected, "past": {}},
+            })
+        items.sort(key=lambda entry: entry["statistic"]["selected"]["openCount"], reverse=True)
+        return items
+
+
+class WBSimulator:
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.catalogs: Dict[str, SellerCatalog] = {}
+        self.buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self.rng = random.Random(config.seed)
+        # {путь: {статус: количество}}
+        self.stats: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.tokens_seen = set()
+
+    def catalog(self, token: str) -> SellerCatalog:
+        catalog = self.catalogs.get(token)
+        if catalog is None:
+            catalog = SellerCatalog(token, self.config)
+            self.catalogs[token] = catalog
+        return catalog
+
+    def _rate_limit(self, token: str, group: str) -> float:
+        if self.config.rate_limit_scale <= 0:
+            return 0.0
+        bucket = self.buckets.get((token, group))
+        if bucket is None:
+            rate_per_minute, burst = WB_RATE_LIMITS[group]
+            bucket = _Bucket(rate_per_minute * self.config.rate_limit_scale, burst)
+            self.buckets[(token, group)] = bucket
+        return bucket.take()
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        path = request.path
+        if path.startswith("/__"):
+            return await handler(request)
+
+        response = await self._guarded(request, handler)
+        self.stats[path][response.status] += 1
+        return response
+
+    async def _guarded(self, request: web.Request, handler) -> web.StreamResponse:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not token or "invalid" in token:
+            return web.json_response({"title": "unauthorized", "detail": "token is invalid"}, status=401)
+        self.tokens_seen.add(token)
+
+        group = WB_ENDPOINT_GROUPS.get(request.path)
+        if group is None:
+            return web.json_response({"title": "not found"}, status=404)
+
+        retry_after = self._rate_limit(token, group)
+        if retry_after > 0:
+            seconds = max(1, math.ceil(retry_after))
+            return web.json_response(
+                {"title": "too many requests", "detail": "limited by c122a060-a7fb-4bb4-abb0-32fd4e18d489"},
+                status=429,
+                headers={"Retry-After": str(seconds), "X-Ratelimit-Retry": str(seconds),
+                         "X-Ratelimit-Limit": str(WB_RATE_LIMITS[group][1]), "X-Ratelimit-Remaining": "0"},
+            )
+
+        if self.config.latency_ms or self.config.latency_jitter_ms:
+            delay = self.rng.gauss(self.config.latency_ms, self.config.latency_jitter_ms)
+            await asyncio.sleep(max(0.0, delay) / 1000)
+
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            return web.json_response({"title": "internal server error"}, status=500)
+
+        try:
+            return await handler(request)
+        except ValueError as e:
+            return web.json_response({"title": "bad request", "detail": str(e)}, status=400)
+
+    @staticmethod
+    def _token(request: web.Request) -> str:
+        return request.headers["Authorization"].removeprefix("Bearer ").strip()
+
+    async def orders(self, request: web.Request) -> web.Response:
+        return await self._changed_rows(request, "orders")
+
+    async def sales(self, request: web.Request) -> web.Response:
+        return await self._changed_rows(request, "sales")
+
+    async def _changed_rows(self, request: web.Request, kind: str) -> web.Response:
+        date_from = _parse_date_from(request.query.get("dateFrom"))
+        flag = int(request.query.get("flag", "0"))
+        rows = self.catalog(self._token(request)).changed_rows(kind, date_from, flag, datetime.now())
+        return web.json_response(rows)
+
+    async def stocks(self, request: web.Request) -> web.Response:
+        date_from = _parse_date_from(request.query.get("dateFrom"))
+        return web.json_response(self.catalog(self._token(request)).stocks(date_from, datetime.now()))
+
+    async def report_detail(self, request: web.Request) -> web.Response:
+        date_from = _parse_date_from(request.query.get("dateFrom")).date()
+        date_to = _parse_date_from(request.query.get("dateTo")).date()
+        limit = min(int(request.query.get("limit", "100000")), 100000)
+        rrdid = int(request.query.get("rrdid", "0"))
+
+        rows = [row for row in self.catalog(self._token(request)).realization_rows(date_from, date_to)
+                if row["rrd_id"] > rrdid][:limit]
+        if not rows:
+            # WB отвечает 204, когда строк больше нет
+            return web.Response(status=204)
+        return web.json_response(rows)
+
+    async def funnel_products(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        period = payload.get("selectedPeriod") or {}
+        start = date.fromisoformat(period["start"])
+        end = date.fromisoformat(period.get("end") or period["start"])
+        limit = min(int(payload.get("limit", 50)), 1000)
+        offset = int(payload.get("offset", 0))
+
+        items = self.catalog(self._token(request)).funnel_products(start, end)
+        return web.json_response({"data": {"products": items[offset:offset + limit]}})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"ok": True})
+
+    def snapshot(self) -> Dict:
+        requests = {path: {str(status): count for status, count in statuses.items()}
+                    for path, statuses in self.stats.items()}
+        return {
+            "requests": requests,
+            "total": sum(sum(statuses.values()) for statuses in self.stats.values()),
+            "tokens": len(self.tokens_seen),
+        }
+
+    def reset(self):
+        self.stats.clear()
+        self.buckets.clear()
+        self.tokens_seen.clear()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware], client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/api/v1/supplier/orders", self.orders)
+        app.router.add_get("/api/v1/supplier/sales", self.sales)
+        app.router.add_get("/api/v1/supplier/stocks", self.stocks)
+        app.router.add_get("/api/v5/supplier/reportDetailByPeriod", self.report_detail)
+        app.router.add_post("/api/analytics/v3/sales-funnel/products", self.funnel_products)
+        app.router.add_get("/__stats", self.get_stats)
+        app.router.add_post("/__reset", self.reset_stats)
+        return app
+
+
+@asynccontextmanager
+async def running_simulator(config: SimulatorConfig, host: str = "127.0.0.1", port: int = 0):
+    """Запустить симулятор в текущем event loop; отдает (симулятор, базовый URL)"""
+    simulator = WBSimulator(config)
+    runner = web.AppRunner(simulator.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_host, bound_port = runner.addresses[0][:2]
+    try:
+        yield simulator, f"http://{bound_host}:{bound_port}"
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный симулятор WB API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--products", type=int, default=SimulatorConfig.products)
+    parser.add_argument("--seed", type=int, default=SimulatorConfig.seed)
+    parser.add_argument("--orders-per-product-day", type=float, default=SimulatorConfig.orders_per_product_day)
+    parser.add_argument("--page-size", type=int, default=SimulatorConfig.page_size)
+    parser.add_argument("--latency-ms", type=float, default=SimulatorConfig.latency_ms)
+    parser.add_argument("--latency-jitter-ms", type=float, default=SimulatorConfig.latency_jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=SimulatorConfig.error_rate)
+    parser.add_argument("--rate-limit-scale", type=float, default=SimulatorConfig.rate_limit_scale,
+                        help="множитель лимитов WB, 0 - без лимитов")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        products=args.products,
+        seed=args.seed,
+        orders_per_product_day=args.orders_per_product_day,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_scale=args.rate_limit_scale,
+    )
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info(f"Симулятор WB API: {args.host}:{args.port}, товаров на токен: {config.products}")
+    web.run_app(WBSimulator(config).create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# database/account_health_manager.py
+from typing import List
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import AccountHealth
+
+
+class AccountHealthManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_all(self) -> List[AccountHealth]:
+        """
+        Состояния всех магазинов, у которых они сохранялись
+        """
+        result = await self.session.execute(select(AccountHealth))
+        return list(result.scalars())
+
+    async def save(self, seller_account_id: int, **values):
+        """
+        Сохранить состояние магазина (создает запись при первом вызове)
+        """
+        stmt = insert(AccountHealth).values(seller_account_id=seller_account_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id'],
+            set_={**values, 'updated': func.now()}
+        )
+        await self.session.execute(stmt)
+        await self.session.commit()
+
+    async def reset(self, seller_account_id: int):
+        """
+        Сбросить состояние магазина (например, после замены API ключа)
+        """
+        await self.session.execute(delete(AccountHealth).where(AccountHealth.seller_account_id == seller_account_id))
+        await self.session.commit()
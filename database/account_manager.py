@@ -1,6 +1,7 @@
 # database/account_manager.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func
+from database.account_registry import AccountInfo, account_registry
 from database.models import SellerAccount
 from typing import List, Optional
 
@@ -28,40 +29,70 @@ class AccountManager:
         )
 
         self.session.add(new_account)
+        await account_registry.notify_changed(self.session)
         await self.session.commit()
         await self.session.refresh(new_account)
+        account_registry.invalidate()
 
         print(f"✅ Создан новый магазин: {new_account.account_name or 'Без названия'}")
         return new_account
 
-    async def get_all_accounts(self) -> List[SellerAccount]:
-        """Получение всех магазинов"""
-        stmt = select(SellerAccount).order_by(SellerAccount.created.desc())
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+    async def get_all_accounts(self) -> List[AccountInfo]:
+        """Получение всех магазинов (из кэша)"""
+        return await account_registry.get_all(self.session)
+
+    async def get_account_by_id(self, account_id: int) -> Optional[AccountInfo]:
+        """Получение конкретного магазина (из кэша)"""
+        for account in await account_registry.get_all(self.session):
+            if account.id == account_id:
+                return account
+        return None
 
-    async def get_account_by_id(self, account_id: int) -> Optional[SellerAccount]:
-        """Получение конкретного магазина"""
+    async def _get_account_row(self, account_id: int) -> Optional[SellerAccount]:
+        """Строка магазина из БД (для изменений)"""
         stmt = select(SellerAccount).where(SellerAccount.id == account_id)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
     async def delete_account(self, account_id: int) -> bool:
         """Удаление магазина (полное удаление из БД)"""
-        account = await self.get_account_by_id(account_id)
+        account = await self._get_account_row(account_id)
         if account:
             await self.session.delete(account)
+            await account_registry.notify_changed(self.session)
             await self.session.commit()
+            account_registry.invalidate()
             return True
         return False
 
     async def update_account_name(self, account_id: int, new_name: str) -> Optional[SellerAccount]:
         """Обновление названия магазина"""
-        account = await self.get_account_by_id(account_id)
+        account = await self._get_account_row(account_id)
         if account:
             account.account_name = new_name
+            await account_registry.notify_changed(self.session)
+            await self.session.commit()
+            await self.session.refresh(account)
+            account_registry.invalidate()
+            return account
+        return None
+
+    async def update_account_api_key(self, account_id: int, api_key: str) -> Optional[SellerAccount]:
+        """Замена API ключа магазина"""
+        if not api_key or len(api_key) < 10:
+            raise ValueError("Некорректный API ключ")
+
+        existing = await self.get_account_by_api_key(api_key)
+        if existing and existing.id != account_id:
+            raise ValueError("Этот API ключ уже используется")
+
+        account = await self._get_account_row(account_id)
+        if account:
+            account.api_key = api_key
+            await account_registry.notify_changed(self.session)
             await self.session.commit()
             await self.session.refresh(account)
+            account_registry.invalidate()
             return account
         return None
 
@@ -73,6 +104,8 @@ class AccountManager:
 
     async def get_accounts_count(self) -> int:
         """Получение количества магазинов"""
-        stmt = select(SellerAccount)
-        result = await self.session.execute(stmt)
-        return len(list(result.scalars().all()))
\ No newline at end of file
+        if account_registry.is_loaded:
+            return len(await account_registry.get_all(self.session))
+
+        result = await self.session.execute(select(func.count()).select_from(SellerAccount))
+        return result.scalar_one()
@@ -0,0 +1,127 @@
+# database/account_registry.py
+"""
+Кэш списка магазинов в памяти процесса.
+Список загружается из БД один раз и сбрасывается при создании, удалении и переименовании магазина.
+Другие процессы бота узнают об изменениях через PostgreSQL NOTIFY и тоже сбрасывают свой кэш.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import asyncpg
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import SellerAccount
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "account_registry"
+
+
+@dataclass(frozen=True)
+class AccountInfo:
+    """Неизменяемая копия строки seller_accounts, безопасная для использования в любой сессии"""
+    id: int
+    account_name: Optional[str]
+    api_key: Optional[str]
+    created: Optional[datetime]
+
+
+class AccountRegistry:
+    def __init__(self):
+        self._accounts: Optional[List[AccountInfo]] = None
+        # Увеличивается при каждом сбросе: загрузка, начатая до сброса, не сохраняет устаревший список
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._accounts is not None
+
+    async def get_all(self, session: AsyncSession) -> List[AccountInfo]:
+        """Все магазины (новые первыми), из БД - только при первом обращении после сброса"""
+        accounts = self._accounts
+        if accounts is None:
+            async with self._lock:
+                accounts = self._accounts
+                if accounts is None:
+                    generation = self._generation
+                    stmt = select(
+                        SellerAccount.id, SellerAccount.account_name, SellerAccount.api_key, SellerAccount.created
+                    ).order_by(SellerAccount.created.desc())
+                    result = await session.execute(stmt)
+                    accounts = [AccountInfo(*row) for row in result.all()]
+                    if generation == self._generation:
+                        self._accounts = accounts
+                        logger.debug(f"Кэш магазинов загружен: {len(accounts)}")
+        return list(accounts)
+
+    async def find_by_api_key(self, api_key: str) -> Optional[AccountInfo]:
+        """Магазин по токену; после сброса кэш загружается заново (None - магазина нет или БД недоступна)"""
+        accounts = self._accounts
+        if accounts is None:
+            from database.engine import session_maker
+            try:
+                async with session_maker() as session:
+                    accounts = await self.get_all(session)
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить кэш магазинов: {e}")
+                return None
+
+        for account in accounts:
+            if account.api_key == api_key:
+                return account
+        return None
+
+    def invalidate(self):
+        self._generation += 1
+        self._accounts = None
+
+    @staticmethod
+    async def notify_changed(session: AsyncSession):
+        """Оповестить другие процессы (уходит вместе с коммитом текущей транзакции)"""
+        await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": NOTIFY_CHANNEL})
+
+
+account_registry = AccountRegistry()
+
+
+class AccountRegistryListener:
+    """LISTEN на отдельном соединении: сбрасывает кэш, когда магазины изменил другой процесс"""
+
+    def __init__(self, registry: AccountRegistry = account_registry, retry_interval: float = 10):
+        self.registry = registry
+        self.retry_interval = retry_interval
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.registry.invalidate()
+
+    async def start_listener(self):
+        dsn = make_url(os.getenv('DB_URL')).set(drivername='postgresql').render_as_string(hide_password=False)
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                # Пока соединения не было, уведомления могли потеряться
+                self.registry.invalidate()
+                logger.info("Подписка на изменения магазинов активна")
+
+                while not connection.is_closed():
+                    await asyncio.sleep(self.retry_interval)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Подписка на изменения магазинов прервана: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(self.retry_interval)
@@ -1,8 +1,33 @@
 import os
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from database.instrumentation import InstrumentedQueuePool, instrument_engine
 from database.models import Base
 
-engine = create_async_engine(os.getenv('DB_URL'), echo=True)
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# Кэш подготовленных запросов asyncpg (0 - выключен, нужно для pgbouncer в режиме transaction)
+statement_cache_size = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+
+engine = create_async_engine(
+    os.getenv('DB_URL'),
+    echo=_env_flag('DB_ECHO', 'false'),
+    poolclass=InstrumentedQueuePool,
+    pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+    pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    pool_pre_ping=_env_flag('DB_POOL_PRE_PING', 'true'),
+    connect_args={
+        'statement_cache_size': statement_cache_size,
+        'prepared_statement_cache_size': statement_cache_size,
+    },
+)
+instrument_engine(engine.sync_engine, slow_query_seconds=float(os.getenv('DB_SLOW_QUERY_MS', '500')) / 1000)
+
 session_maker = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -11,6 +36,8 @@ session_maker = async_sessionmaker(
 
 async def create_db():
     async with engine.begin() as conn:
+        # Нужен для индекса поиска товаров по названию
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
 
     # async with session_maker() as session:
@@ -0,0 +1,116 @@
+# database/instrumentation.py
+"""
+Метрики работы с БД: гистограммы времени выполнения запросов по типу запроса
+и времени ожидания соединения из пула, лог медленных запросов без значений параметров.
+"""
+import logging
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+class LatencyHistogram:
+    """Накопительная гистограмма длительностей (количество попаданий в каждую корзину)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def snapshot(self) -> Dict:
+        """Кумулятивные значения по корзинам (формат Prometheus: le -> count)"""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"buckets": cumulative, "count": self.count, "sum": self.sum}
+
+
+statement_latency: Dict[str, LatencyHistogram] = {
+    kind: LatencyHistogram() for kind in STATEMENT_KINDS + ("OTHER",)
+}
+pool_checkout_wait = LatencyHistogram()
+
+
+def statement_kind(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head if head in STATEMENT_KINDS else "OTHER"
+
+
+def redact_parameters(parameters, executemany: bool) -> str:
+    """Описание параметров без значений: только типы (для пачек - количество наборов)"""
+    if executemany:
+        return f"<{len(parameters)} наборов параметров>"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: <{type(value).__name__}>" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(f"<{type(value).__name__}>" for value in parameters) + ")"
+    return "<>"
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который измеряет время ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine, slow_query_seconds: float):
+    """Подключить измерение времени запросов к синхронному движку (engine.sync_engine для async)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started: List[float] = conn.info.get("query_start_time")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        statement_latency[statement_kind(statement)].observe(elapsed)
+
+        if elapsed >= slow_query_seconds:
+            logger.warning(
+                f"Медленный запрос ({elapsed * 1000:.0f} мс): {statement[:1000]} "
+                f"| параметры: {redact_parameters(parameters, executemany)}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Ошибочный запрос не должен оставлять метку начала в стеке соединения
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+
+def get_pool_status(engine: Engine) -> Dict[str, int]:
+    """Текущее состояние пула соединений"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checked_in": pool.checkedin(),
+    }
@@ -1,4 +1,5 @@
-from sqlalchemy import DateTime, ForeignKey, Numeric, String, Text, BigInteger, func, Index
+from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Integer, Numeric, String, Text, BigInteger, func, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -56,3 +57,324 @@ class Product(Base):
                            'seller_account_id',
                            'supplier_article', unique=True),)
 
+
+# Индексы для поиска товаров: по началу артикула и по подстроке названия (pg_trgm)
+Index('ix_products_article_prefix',
+      func.lower(Product.supplier_article).label('article_lower'),
+      postgresql_ops={'article_lower': 'text_pattern_ops'})
+Index('ix_products_custom_name_trgm', Product.custom_name,
+      postgresql_using='gin',
+      postgresql_ops={'custom_name': 'gin_trgm_ops'})
+
+
+# Дневная статистика воронки продаж по товарам
+class ProductDailyStat(Base):
+    __tablename__ = 'product_daily_stats'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=False, comment='Артикул WB')
+    supplier_article: Mapped[str] = mapped_column(String(100), nullable=True,
+                                                  comment='Артикул поставщика')
+    stat_date: Mapped[Date] = mapped_column(Date, nullable=False, comment='День статистики')
+
+    views: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    carts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    orders: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    order_sum: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    buyouts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    buyout_sum: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+
+    # Одна строка на товар и день, выборки по магазину за период
+    __table_args__ = (Index('ix_unique_product_daily_stat',
+                            'seller_account_id', 'nm_id', 'stat_date', unique=True),
+                      Index('ix_product_daily_stats_account_date',
+                            'seller_account_id', 'stat_date'),)
+
+
+# Прогресс загрузки истории воронки продаж
+class FunnelBackfillCheckpoint(Base):
+    __tablename__ = 'funnel_backfill_checkpoints'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False, unique=True)
+    # Полностью загруженный диапазон дат
+    oldest_date: Mapped[Date] = mapped_column(Date, nullable=True)
+    newest_date: Mapped[Date] = mapped_column(Date, nullable=True)
+    # Окно, загрузка которого идет сейчас, и последний обработанный nmId в нем
+    window_start: Mapped[Date] = mapped_column(Date, nullable=True)
+    window_end: Mapped[Date] = mapped_column(Date, nullable=True)
+    last_nm_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+
+
+# Строки отчета о реализации (reportDetailByPeriod)
+class RealizationReportRow(Base):
+    __tablename__ = 'realization_report_rows'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    rrd_id: Mapped[int] = mapped_column(BigInteger, nullable=False, comment='ID строки отчета')
+    realizationreport_id: Mapped[int] = mapped_column(BigInteger, nullable=True, comment='ID отчета')
+    report_date_from: Mapped[Date] = mapped_column(Date, nullable=True, comment='Начало периода отчета')
+    report_date_to: Mapped[Date] = mapped_column(Date, nullable=True, comment='Конец периода отчета')
+    rr_dt: Mapped[Date] = mapped_column(Date, nullable=True, comment='Дата операции')
+    sale_dt: Mapped[DateTime] = mapped_column(DateTime, nullable=True, comment='Дата продажи')
+
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=True, comment='Артикул WB')
+    sa_name: Mapped[str] = mapped_column(String(100), nullable=True, comment='Артикул поставщика')
+    subject_name: Mapped[str] = mapped_column(String(150), nullable=True)
+    brand_name: Mapped[str] = mapped_column(String(150), nullable=True)
+    doc_type_name: Mapped[str] = mapped_column(String(50), nullable=True, comment='Тип документа')
+    supplier_oper_name: Mapped[str] = mapped_column(String(100), nullable=True, comment='Обоснование оплаты')
+    srid: Mapped[str] = mapped_column(String(100), nullable=True, comment='Уникальный ID заказа')
+
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    retail_price_withdisc_rub: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    retail_amount: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    ppvz_for_pay: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0,
+                                                comment='К перечислению продавцу')
+    ppvz_sales_commission: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    ppvz_vw: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0,
+                                           comment='Вознаграждение WB без НДС')
+    ppvz_vw_nds: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    acquiring_fee: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    delivery_amount: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    return_amount: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    delivery_rub: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0,
+                                                comment='Стоимость логистики')
+    storage_fee: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    penalty: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    deduction: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    acceptance: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    additional_payment: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (Index('ix_unique_realization_rrd',
+                            'seller_account_id', 'rrd_id', unique=True),
+                      Index('ix_realization_account_period',
+                            'seller_account_id', 'report_date_from', 'report_date_to'),)
+
+
+# Прогресс загрузки отчета о реализации за период
+class RealizationSyncState(Base):
+    __tablename__ = 'realization_sync_states'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False)
+    date_from: Mapped[Date] = mapped_column(Date, nullable=False)
+    date_to: Mapped[Date] = mapped_column(Date, nullable=False)
+    period: Mapped[str] = mapped_column(String(10), nullable=False, default='weekly')
+    last_rrd_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    rows_loaded: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (Index('ix_unique_realization_sync_period',
+                            'seller_account_id', 'date_from', 'date_to', 'period', unique=True),)
+
+
+# Кэш P&L по артикулам за закрытую неделю
+class WeeklyArticlePnl(Base):
+    __tablename__ = 'weekly_article_pnl'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    week_start: Mapped[Date] = mapped_column(Date, nullable=False, comment='Понедельник недели')
+    week_end: Mapped[Date] = mapped_column(Date, nullable=False, comment='Воскресенье недели')
+    article: Mapped[str] = mapped_column(String(100), nullable=False,
+                                         comment='Артикул поставщика (пусто - операции без артикула)')
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=True, comment='Артикул WB')
+
+    sold_quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    returned_quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    returns: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    commission: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    logistics: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    storage: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    penalties: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    other_deductions: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    payout: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0,
+                                          comment='Итого к перечислению продавцу')
+
+    __table_args__ = (Index('ix_unique_weekly_article_pnl',
+                            'seller_account_id', 'week_start', 'article', unique=True),)
+
+
+# Магазины, P&L которых за неделю уже разослан администраторам (автоотчет)
+class WeeklyPnlDelivery(Base):
+    __tablename__ = 'weekly_pnl_deliveries'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    week_start: Mapped[Date] = mapped_column(Date, nullable=False, comment='Понедельник недели')
+
+    __table_args__ = (Index('ix_unique_weekly_pnl_delivery', 'seller_account_id', 'week_start', unique=True),)
+
+
+# Заказы (/api/v1/supplier/orders)
+class Order(Base):
+    __tablename__ = 'orders'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    srid: Mapped[str] = mapped_column(String(100), nullable=False, comment='Уникальный ID заказа')
+    g_number: Mapped[str] = mapped_column(String(100), nullable=True, comment='ID корзины покупателя')
+    order_date: Mapped[DateTime] = mapped_column(DateTime, nullable=False, comment='Дата и время заказа')
+    last_change_date: Mapped[DateTime] = mapped_column(DateTime, nullable=False,
+                                                       comment='Дата и время обновления в WB')
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=True, comment='Артикул WB')
+    supplier_article: Mapped[str] = mapped_column(String(100), nullable=True, comment='Артикул поставщика')
+    warehouse_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    region_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    total_price: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    discount_percent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    price_with_disc: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    finished_price: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    is_cancel: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    cancel_date: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_unique_order_srid', 'seller_account_id', 'srid', unique=True),
+        Index('ix_orders_account_date', 'seller_account_id', 'order_date'),
+        Index('ix_orders_account_last_change', 'seller_account_id', 'last_change_date'),
+    )
+
+
+# Продажи и возвраты (/api/v1/supplier/sales)
+class Sale(Base):
+    __tablename__ = 'sales'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    srid: Mapped[str] = mapped_column(String(100), nullable=False, comment='Уникальный ID заказа')
+    # У продажи и возврата одного заказа общий srid, различаются они по saleID (S... / R...)
+    sale_id: Mapped[str] = mapped_column(String(50), nullable=False, comment='ID продажи или возврата')
+    sale_date: Mapped[DateTime] = mapped_column(DateTime, nullable=False, comment='Дата и время продажи')
+    last_change_date: Mapped[DateTime] = mapped_column(DateTime, nullable=False,
+                                                       comment='Дата и время обновления в WB')
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=True, comment='Артикул WB')
+    supplier_article: Mapped[str] = mapped_column(String(100), nullable=True, comment='Артикул поставщика')
+    warehouse_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    region_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    total_price: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    price_with_disc: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    finished_price: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0)
+    for_pay: Mapped[float] = mapped_column(Numeric(14, 2), nullable=False, default=0,
+                                           comment='К перечислению продавцу')
+    is_realization: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        Index('ix_unique_sale_srid', 'seller_account_id', 'srid', 'sale_id', unique=True),
+        Index('ix_sales_account_date', 'seller_account_id', 'sale_date'),
+        Index('ix_sales_account_last_change', 'seller_account_id', 'last_change_date'),
+    )
+
+
+# Время последней синхронизации заказов и продаж магазина
+class OrdersSyncState(Base):
+    __tablename__ = 'orders_sync_states'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False, unique=True,
+                                                   comment='Связь с аккаунтом продавца')
+    orders_synced_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+    sales_synced_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+
+
+# Снимки остатков по складам (один снимок на день, в течение дня перезаписывается)
+class StockSnapshot(Base):
+    __tablename__ = 'stock_snapshots'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    snapshot_date: Mapped[Date] = mapped_column(Date, nullable=False, comment='День снимка')
+    nm_id: Mapped[int] = mapped_column(BigInteger, nullable=False, comment='Артикул WB')
+    supplier_article: Mapped[str] = mapped_column(String(100), nullable=True, comment='Артикул поставщика')
+    warehouse_name: Mapped[str] = mapped_column(String(100), nullable=False, comment='Склад')
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0,
+                                          comment='Доступно для продажи (сумма по размерам)')
+    in_way_to_client: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    in_way_from_client: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index('ix_unique_stock_snapshot',
+                            'seller_account_id', 'snapshot_date', 'nm_id', 'warehouse_name', unique=True),)
+
+
+# Очередь заданий на построение отчетов (выполняет отдельный процесс worker.py)
+class ReportJob(Base):
+    __tablename__ = 'report_jobs'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False, comment='Тип отчета')
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False,
+                                                   comment='Связь с аккаунтом продавца')
+    report_date: Mapped[Date] = mapped_column(Date, nullable=False, comment='День, за который строится отчет')
+    # pending -> running -> done / failed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='pending')
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Отчеты, ожидающие результат: задание снимается с очереди при отмене, только когда их не осталось
+    waiters: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0',
+                                         comment='Сколько отчетов ждут результат задания')
+    worker: Mapped[str] = mapped_column(String(100), nullable=True, comment='Процесс, выполняющий задание')
+    started_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+    result: Mapped[dict] = mapped_column(JSONB, nullable=True, comment='Снимок магазина для отображения')
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (
+        Index('ix_report_jobs_status', 'status', 'id'),
+        Index('ix_report_jobs_lookup', 'kind', 'seller_account_id', 'report_date'),
+    )
+
+
+# Состояние доступа к WB API магазина (предохранитель): healthy -> degraded -> open
+class AccountHealth(Base):
+    __tablename__ = 'account_health'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    seller_account_id: Mapped[int] = mapped_column(ForeignKey('seller_accounts.id',
+                                                              ondelete='CASCADE'),
+                                                   nullable=False, unique=True,
+                                                   comment='Связь с аккаунтом продавца')
+    state: Mapped[str] = mapped_column(String(20), nullable=False, default='healthy')
+    # auth - ключ отклонен (401/403), unavailable - временные ошибки подряд
+    reason: Mapped[str] = mapped_column(String(20), nullable=True)
+    failures: Mapped[int] = mapped_column(Integer, nullable=False, default=0,
+                                          comment='Временных ошибок подряд')
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    opened_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+    retry_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True, comment='Время пробного запроса')
+    cooldown: Mapped[int] = mapped_column(Integer, nullable=False, default=0,
+                                          comment='Текущая пауза до пробного запроса, сек.')
+    key_hash: Mapped[str] = mapped_column(String(64), nullable=True,
+                                          comment='Хэш отклоненного ключа (новый ключ снимает блокировку)')
@@ -0,0 +1,134 @@
+# database/orders_sales_manager.py
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import select, func, case
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Order, Sale, OrdersSyncState
+
+logger = logging.getLogger(__name__)
+
+ORDER_UPDATE_FIELDS = (
+    'g_number', 'order_date', 'last_change_date', 'nm_id', 'supplier_article', 'warehouse_name',
+    'region_name', 'quantity', 'total_price', 'discount_percent', 'price_with_disc', 'finished_price',
+    'is_cancel', 'cancel_date',
+)
+SALE_UPDATE_FIELDS = (
+    'sale_date', 'last_change_date', 'nm_id', 'supplier_article', 'warehouse_name', 'region_name',
+    'quantity', 'total_price', 'price_with_disc', 'finished_price', 'for_pay', 'is_realization',
+)
+
+
+class OrdersSalesManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def _bulk_upsert(self, model, rows: List[Dict], index_elements: List[str], fields) -> int:
+        """
+        Записать пачку строк. Уже сохраненная строка обновляется, только если пришла более свежая версия
+        """
+        if not rows:
+            return 0
+
+        stmt = insert(model)
+        set_ = {field: stmt.excluded[field] for field in fields}
+        set_['updated'] = func.now()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_=set_,
+            where=model.last_change_date <= stmt.excluded.last_change_date
+        )
+        await self.session.execute(stmt, rows)
+        return len(rows)
+
+    async def bulk_upsert_orders(self, rows: List[Dict]) -> int:
+        return await self._bulk_upsert(Order, rows, ['seller_account_id', 'srid'], ORDER_UPDATE_FIELDS)
+
+    async def bulk_upsert_sales(self, rows: List[Dict]) -> int:
+        return await self._bulk_upsert(Sale, rows, ['seller_account_id', 'srid', 'sale_id'], SALE_UPDATE_FIELDS)
+
+    async def get_last_change_date(self, model, seller_account_id: int) -> Optional[datetime]:
+        """
+        Максимальный lastChangeDate сохраненных строк (точка продолжения синхронизации)
+        """
+        stmt = select(func.max(model.last_change_date)).where(model.seller_account_id == seller_account_id)
+        result = await self.session.execute(stmt)
+        return result.scalar()
+
+    async def get_orders_totals(self, seller_account_id: int, date_from: date, date_to: date) -> Tuple[int, float]:
+        """
+        Заказы за период: (количество, сумма без отмененных)
+        """
+        stmt = select(
+            func.coalesce(func.sum(Order.quantity), 0),
+            func.coalesce(func.sum(case(
+                (Order.is_cancel.is_(False), Order.price_with_disc * Order.quantity),
+                else_=0
+            )), 0),
+        ).where(
+            Order.seller_account_id == seller_account_id,
+            Order.order_date >= date_from,
+            Order.order_date < date_to + timedelta(days=1)
+        )
+        quantity, amount = (await self.session.execute(stmt)).one()
+        return int(quantity), float(amount)
+
+    async def get_sales_totals(self, seller_account_id: int, date_from: date, date_to: date) -> Tuple[int, float]:
+        """
+        Выкупы за период: (количество, сумма)
+        """
+        stmt = select(
+            func.coalesce(func.sum(Sale.quantity), 0),
+            func.coalesce(func.sum(Sale.price_with_disc * Sale.quantity), 0),
+        ).where(
+            Sale.seller_account_id == seller_account_id,
+            Sale.is_realization.is_(True),
+            Sale.sale_date >= date_from,
+            Sale.sale_date < date_to + timedelta(days=1)
+        )
+        quantity, amount = (await self.session.execute(stmt)).one()
+        return int(quantity), float(amount)
+
+    async def get_sold_by_article(self, seller_account_id: int, date_from: date, date_to: date) -> List[tuple]:
+        """
+        Выкупленные штуки по артикулам за период (без возвратов): [(nm_id, supplier_article, quantity)]
+        """
+        stmt = select(
+            Sale.nm_id,
+            func.max(Sale.supplier_article),
+            func.sum(Sale.quantity),
+        ).where(
+            Sale.seller_account_id == seller_account_id,
+            Sale.is_realization.is_(True),
+            # Возвраты имеют saleID с префиксом R
+            Sale.sale_id.like('S%'),
+            Sale.nm_id.is_not(None),
+            Sale.sale_date >= date_from,
+            Sale.sale_date < date_to + timedelta(days=1)
+        ).group_by(Sale.nm_id)
+        result = await self.session.execute(stmt)
+        return list(result.all())
+
+    async def get_sync_state(self, seller_account_id: int) -> Optional[OrdersSyncState]:
+        """
+        Время последней синхронизации заказов и продаж магазина
+        """
+        stmt = select(OrdersSyncState).where(OrdersSyncState.seller_account_id == seller_account_id)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def mark_synced(self, seller_account_id: int, field: str):
+        """
+        Отметить успешную синхронизацию (field: orders_synced_at или sales_synced_at)
+        """
+        # Время приложения, а не БД: с ним сравнивается возраст данных при показе статистики
+        now = datetime.now()
+        stmt = insert(OrdersSyncState).values(seller_account_id=seller_account_id, **{field: now})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id'],
+            set_={field: now, 'updated': func.now()}
+        )
+        await self.session.execute(stmt)
@@ -0,0 +1,103 @@
+# database/pnl_manager.py
+from datetime import date
+from typing import Dict, List, Optional, Set
+import logging
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import WeeklyArticlePnl, WeeklyPnlDelivery
+
+logger = logging.getLogger(__name__)
+
+PNL_FIELDS = (
+    "sold_quantity", "returned_quantity", "revenue", "returns", "commission", "logistics",
+    "storage", "penalties", "other_deductions", "payout",
+)
+
+
+class PnlManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def replace_week(self, seller_account_id: int, week_start: date, week_end: date, rows: List[Dict]):
+        """
+        Сохранить рассчитанный P&L недели (старый расчет за эту неделю удаляется)
+        """
+        await self.session.execute(
+            delete(WeeklyArticlePnl).where(
+                WeeklyArticlePnl.seller_account_id == seller_account_id,
+                WeeklyArticlePnl.week_start == week_start
+            )
+        )
+        if rows:
+            values = [
+                {**row, "seller_account_id": seller_account_id, "week_start": week_start, "week_end": week_end}
+                for row in rows
+            ]
+            await self.session.execute(WeeklyArticlePnl.__table__.insert(), values)
+
+    async def has_week(self, seller_account_id: int, week_start: date) -> bool:
+        """
+        Есть ли сохраненный расчет за неделю
+        """
+        stmt = select(WeeklyArticlePnl.id).where(
+            WeeklyArticlePnl.seller_account_id == seller_account_id,
+            WeeklyArticlePnl.week_start == week_start
+        ).limit(1)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none() is not None
+
+    async def get_week_totals(self, seller_account_id: int, week_start: date) -> Optional[Dict]:
+        """
+        Итоги магазина за неделю
+        """
+        columns = [func.sum(getattr(WeeklyArticlePnl, field)) for field in PNL_FIELDS]
+        stmt = select(func.count(WeeklyArticlePnl.id), *columns).where(
+            WeeklyArticlePnl.seller_account_id == seller_account_id,
+            WeeklyArticlePnl.week_start == week_start
+        )
+        result = await self.session.execute(stmt)
+        count, *sums = result.one()
+
+        if not count:
+            return None
+
+        totals = {field: float(value or 0) for field, value in zip(PNL_FIELDS, sums)}
+        totals["articles"] = count
+        return totals
+
+    async def get_week_articles(self, seller_account_id: int, week_start: date,
+                                limit: int, offset: int = 0) -> List[WeeklyArticlePnl]:
+        """
+        Страница артикулов недели, отсортированных по сумме к перечислению
+        """
+        stmt = select(WeeklyArticlePnl).where(
+            WeeklyArticlePnl.seller_account_id == seller_account_id,
+            WeeklyArticlePnl.week_start == week_start
+        ).order_by(WeeklyArticlePnl.payout.desc(), WeeklyArticlePnl.article).limit(limit).offset(offset)
+
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_delivered_accounts(self, week_start: date) -> Set[int]:
+        """
+        Магазины, P&L которых за неделю уже отправлен администраторам
+        """
+        stmt = select(WeeklyPnlDelivery.seller_account_id).where(WeeklyPnlDelivery.week_start == week_start)
+        result = await self.session.execute(stmt)
+        return set(result.scalars())
+
+    async def mark_delivered(self, seller_account_ids: List[int], week_start: date):
+        """
+        Отметить отправку P&L магазинов за неделю
+        """
+        if not seller_account_ids:
+            return
+        stmt = insert(WeeklyPnlDelivery).values([
+            {"seller_account_id": seller_account_id, "week_start": week_start}
+            for seller_account_id in seller_account_ids
+        ]).on_conflict_do_nothing(index_elements=['seller_account_id', 'week_start'])
+        await self.session.execute(stmt)
+        await self.session.commit()
@@ -0,0 +1,61 @@
+# database/product_daily_stats_manager.py
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ProductDailyStat, FunnelBackfillCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+class ProductDailyStatsManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def bulk_upsert(self, rows: List[Dict]) -> int:
+        """
+        Записать дневную статистику пачкой (один INSERT ... ON CONFLICT на пачку)
+        """
+        if not rows:
+            return 0
+
+        stmt = insert(ProductDailyStat)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id', 'nm_id', 'stat_date'],
+            set_={
+                'supplier_article': stmt.excluded.supplier_article,
+                'views': stmt.excluded.views,
+                'carts': stmt.excluded.carts,
+                'orders': stmt.excluded.orders,
+                'order_sum': stmt.excluded.order_sum,
+                'buyouts': stmt.excluded.buyouts,
+                'buyout_sum': stmt.excluded.buyout_sum,
+                'updated': func.now(),
+            }
+        )
+        await self.session.execute(stmt, rows)
+        return len(rows)
+
+    async def get_checkpoint(self, seller_account_id: int) -> Optional[FunnelBackfillCheckpoint]:
+        """
+        Прогресс загрузки истории для магазина
+        """
+        stmt = select(FunnelBackfillCheckpoint).where(
+            FunnelBackfillCheckpoint.seller_account_id == seller_account_id
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def save_checkpoint(self, seller_account_id: int, **values):
+        """
+        Сохранить прогресс загрузки истории (создает запись при первом вызове)
+        """
+        stmt = insert(FunnelBackfillCheckpoint).values(seller_account_id=seller_account_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id'],
+            set_={**values, 'updated': func.now()}
+        )
+        await self.session.execute(stmt)
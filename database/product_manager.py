@@ -1,13 +1,39 @@
 # database/product_manager.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from typing import Dict, List, Optional, Tuple
 import logging
+import os
+import time
 
 from database.models import Product
 
 logger = logging.getLogger(__name__)
 
+# Индекс страниц списка товаров: {(магазин, размер страницы): (время загрузки, всего товаров, первый артикул каждой страницы)}
+_page_index: Dict[Tuple[int, int], Tuple[float, int, List[str]]] = {}
+PAGE_INDEX_TTL = float(os.getenv("PRODUCT_PAGE_CACHE_TTL", "300"))
+TRIGRAM_MIN_LENGTH = 3
+
+
+# Названия товаров для отчетов: {магазин: (время загрузки, {артикул: название})}.
+# Отчеты хранят ссылку на словарь магазина, поэтому переименование меняет его на месте
+_custom_names: Dict[int, Tuple[float, Dict[str, str]]] = {}
+CUSTOM_NAMES_TTL = float(os.getenv("PRODUCT_NAMES_CACHE_TTL", "600"))
+
+
+def invalidate_product_pages(seller_account_id: int):
+    """Сбросить индекс страниц магазина (после добавления товаров)"""
+    for key in [key for key in _page_index if key[0] == seller_account_id]:
+        del _page_index[key]
+
+
+def invalidate_custom_names(seller_account_id: int):
+    """Сбросить названия товаров магазина (следующий отчет загрузит их заново)"""
+    _custom_names.pop(seller_account_id, None)
+
 
 class ProductManager:
     def __init__(self, session: AsyncSession):
@@ -46,6 +72,8 @@ class ProductManager:
         self.session.add(product)
         try:
             await self.session.commit()
+            invalidate_product_pages(seller_account_id)
+            invalidate_custom_names(seller_account_id)
             logger.info(f"Товар создан: {supplier_article}")
         except Exception as e:
             await self.session.rollback()
@@ -56,8 +84,13 @@ class ProductManager:
 
     async def get_custom_names_dict(self, seller_account_id: int) -> Dict[str, str]:
         """
-        Получаем словарь: {supplier_article: custom_name или supplier_article}
+        Получаем словарь: {supplier_article: custom_name или supplier_article}.
+        Словарь общий для процесса - его нельзя изменять, можно хранить ссылку на него
         """
+        cached = _custom_names.get(seller_account_id)
+        if cached and time.monotonic() - cached[0] < CUSTOM_NAMES_TTL:
+            return cached[1]
+
         stmt = select(Product.supplier_article, Product.custom_name).where(
             Product.seller_account_id == seller_account_id
         )
@@ -68,6 +101,8 @@ class ProductManager:
             # Используем кастомное название если есть, иначе сам артикул
             names_dict[article] = custom_name if custom_name else article
 
+        _custom_names[seller_account_id] = (time.monotonic(), names_dict)
+        logger.debug(f"Названия товаров магазина {seller_account_id} загружены: {len(names_dict)}")
         return names_dict
 
     async def update_custom_name(
@@ -95,6 +130,9 @@ class ProductManager:
         product.custom_name = custom_name
         try:
             await self.session.commit()
+            cached = _custom_names.get(seller_account_id)
+            if cached:
+                cached[1][supplier_article] = custom_name
             logger.info(f"Название обновлено для {supplier_article}: {custom_name}")
             return True
         except Exception as e:
@@ -102,6 +140,53 @@ class ProductManager:
             logger.error(f"Ошибка при обновлении названия: {e}")
             return False
 
+    async def bulk_upsert_products(self, seller_account_id: int, products: List[Dict]) -> int:
+        """
+        Сохранить товары из статистики одной пачкой: новые артикулы создаются,
+        название из WB записывается только товарам, у которых его еще нет
+        """
+        rows = {}
+        for product_data in products:
+            article = product_data.get('article')
+            if article:
+                title = product_data.get('title')
+                rows[article] = {
+                    'seller_account_id': seller_account_id,
+                    'supplier_article': article,
+                    'custom_name': title[:100] if title else None,
+                }
+
+        if not rows:
+            return 0
+
+        stmt = insert(Product)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id', 'supplier_article'],
+            set_={'custom_name': stmt.excluded.custom_name, 'updated': func.now()},
+            where=Product.custom_name.is_(None) & stmt.excluded.custom_name.is_not(None)
+        )
+        # RETURNING отдает только созданные и переименованные строки
+        stmt = stmt.returning(Product.supplier_article, Product.custom_name)
+        try:
+            result = await self.session.execute(stmt, list(rows.values()))
+            changed = result.all()
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f"Ошибка при сохранении товаров магазина {seller_account_id}: {e}")
+            raise
+
+        if changed:
+            invalidate_product_pages(seller_account_id)
+            # Кэш названий обновляем на месте, чтобы отчеты со ссылкой на него видели новые названия
+            cached = _custom_names.get(seller_account_id)
+            if cached:
+                for article, custom_name in changed:
+                    cached[1][article] = custom_name if custom_name else article
+            logger.info(f"Магазин {seller_account_id}: создано или названо товаров: {len(changed)}")
+
+        return len(rows)
+
     async def get_all_products(self, seller_account_id: int) -> List[Product]:
         """
         Получаем все товары аккаунта
@@ -112,3 +197,98 @@ class ProductManager:
 
         result = await self.session.execute(stmt)
         return list(result.scalars().all())
+
+    async def _get_page_index(self, seller_account_id: int, per_page: int) -> Tuple[int, List[str]]:
+        """
+        Количество товаров и первый артикул каждой страницы (кэшируется на PAGE_INDEX_TTL секунд)
+        """
+        key = (seller_account_id, per_page)
+        cached = _page_index.get(key)
+        if cached and time.monotonic() - cached[0] < PAGE_INDEX_TTL:
+            return cached[1], cached[2]
+
+        numbered = select(
+            Product.supplier_article,
+            func.row_number().over(order_by=Product.supplier_article).label('row_number'),
+            func.count().over().label('total'),
+        ).where(Product.seller_account_id == seller_account_id).subquery()
+
+        stmt = select(numbered.c.supplier_article, numbered.c.total).where(
+            (numbered.c.row_number - 1) % per_page == 0
+        ).order_by(numbered.c.supplier_article)
+        rows = (await self.session.execute(stmt)).all()
+
+        total = rows[0].total if rows else 0
+        anchors = [row.supplier_article for row in rows]
+        _page_index[key] = (time.monotonic(), total, anchors)
+        return total, anchors
+
+    async def get_products_count(self, seller_account_id: int, per_page: int) -> int:
+        """
+        Количество товаров магазина (из того же кэша, что и страницы)
+        """
+        total, _ = await self._get_page_index(seller_account_id, per_page)
+        return total
+
+    async def get_products_page(
+            self,
+            seller_account_id: int,
+            page: int,
+            per_page: int
+    ) -> Tuple[List[Row], int, int]:
+        """
+        Страница товаров (supplier_article, custom_name) по ключу supplier_article.
+        Возвращает (товары, всего товаров, номер страницы после проверки границ)
+        """
+        total, anchors = await self._get_page_index(seller_account_id, per_page)
+        if not anchors:
+            return [], 0, 0
+
+        page = max(0, min(page, len(anchors) - 1))
+        stmt = select(Product.supplier_article, Product.custom_name).where(
+            Product.seller_account_id == seller_account_id,
+            Product.supplier_article >= anchors[page]
+        ).order_by(Product.supplier_article).limit(per_page)
+
+        result = await self.session.execute(stmt)
+        return list(result.all()), total, page
+
+    async def get_product(self, seller_account_id: int, supplier_article: str) -> Optional[Row]:
+        """
+        Один товар магазина (supplier_article, custom_name)
+        """
+        stmt = select(Product.supplier_article, Product.custom_name).where(
+            Product.seller_account_id == seller_account_id,
+            Product.supplier_article == supplier_article
+        )
+        result = await self.session.execute(stmt)
+        return result.one_or_none()
+
+    async def search_products(
+            self,
+            query: str,
+            offset: int,
+            limit: int,
+            seller_account_id: Optional[int] = None
+    ) -> Tuple[List[Row], bool]:
+        """
+        Поиск товаров по началу артикула или подстроке названия (без учета регистра,
+        по названию - от TRIGRAM_MIN_LENGTH символов).
+        Без seller_account_id ищет во всех магазинах.
+        Возвращает (товары (seller_account_id, supplier_article, custom_name), есть ли следующая страница)
+        """
+        query = query.strip()
+        # lower() LIKE 'abc%' идет по индексу ix_products_article_prefix
+        condition = func.lower(Product.supplier_article).startswith(query.lower(), autoescape=True)
+        if len(query) >= TRIGRAM_MIN_LENGTH:
+            # ILIKE '%abc%' идет по триграммному индексу, из более коротких строк триграммы не строятся
+            condition = condition | Product.custom_name.icontains(query, autoescape=True)
+
+        stmt = select(Product.seller_account_id, Product.supplier_article, Product.custom_name).where(condition)
+        if seller_account_id is not None:
+            stmt = stmt.where(Product.seller_account_id == seller_account_id)
+
+        # Лишняя строка показывает, есть ли следующая страница, без COUNT по всем совпадениям
+        stmt = stmt.order_by(Product.supplier_article, Product.seller_account_id).offset(offset).limit(limit + 1)
+        rows = list((await self.session.execute(stmt)).all())
+        return rows[:limit], len(rows) > limit
@@ -0,0 +1,106 @@
+# database/realization_manager.py
+from datetime import date
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import RealizationReportRow, RealizationSyncState
+
+logger = logging.getLogger(__name__)
+
+
+class RealizationManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def bulk_insert_rows(self, rows: List[Dict]) -> int:
+        """
+        Записать страницу отчета пачкой. Повторно загруженные строки (тот же rrd_id) пропускаются
+        """
+        if not rows:
+            return 0
+
+        stmt = insert(RealizationReportRow).on_conflict_do_nothing(
+            index_elements=['seller_account_id', 'rrd_id']
+        )
+        await self.session.execute(stmt, rows)
+        return len(rows)
+
+    async def get_sync_state(
+            self,
+            seller_account_id: int,
+            date_from: date,
+            date_to: date,
+            period: str
+    ) -> Optional[RealizationSyncState]:
+        """
+        Прогресс загрузки отчета за период
+        """
+        stmt = select(RealizationSyncState).where(
+            RealizationSyncState.seller_account_id == seller_account_id,
+            RealizationSyncState.date_from == date_from,
+            RealizationSyncState.date_to == date_to,
+            RealizationSyncState.period == period
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def save_sync_state(
+            self,
+            seller_account_id: int,
+            date_from: date,
+            date_to: date,
+            period: str,
+            last_rrd_id: int,
+            rows_added: int = 0,
+            completed: bool = False
+    ):
+        """
+        Сохранить последний загруженный rrd_id (создает запись при первом вызове)
+        """
+        stmt = insert(RealizationSyncState).values(
+            seller_account_id=seller_account_id,
+            date_from=date_from,
+            date_to=date_to,
+            period=period,
+            last_rrd_id=last_rrd_id,
+            rows_loaded=rows_added,
+            completed=completed
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id', 'date_from', 'date_to', 'period'],
+            set_={
+                'last_rrd_id': stmt.excluded.last_rrd_id,
+                'rows_loaded': RealizationSyncState.rows_loaded + stmt.excluded.rows_loaded,
+                'completed': stmt.excluded.completed,
+                'updated': func.now(),
+            }
+        )
+        await self.session.execute(stmt)
+
+    async def get_rows_for_pnl(self, seller_account_id: int, date_from: date, date_to: date) -> List[tuple]:
+        """
+        Строки отчетов за период в виде кортежей (только поля, нужные для расчета P&L)
+        """
+        stmt = select(
+            RealizationReportRow.sa_name,
+            RealizationReportRow.nm_id,
+            RealizationReportRow.doc_type_name,
+            RealizationReportRow.quantity,
+            RealizationReportRow.retail_amount,
+            RealizationReportRow.ppvz_for_pay,
+            RealizationReportRow.delivery_rub,
+            RealizationReportRow.storage_fee,
+            RealizationReportRow.penalty,
+            RealizationReportRow.deduction,
+            RealizationReportRow.acceptance,
+            RealizationReportRow.additional_payment,
+        ).where(
+            RealizationReportRow.seller_account_id == seller_account_id,
+            RealizationReportRow.report_date_from.between(date_from, date_to)
+        )
+        result = await self.session.execute(stmt)
+        return list(result.all())
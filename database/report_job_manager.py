@@ -0,0 +1,207 @@
+# database/report_job_manager.py
+"""
+Очередь заданий на построение отчетов в таблице report_jobs.
+Бот ставит задания, процессы worker.py забирают их через SELECT ... FOR UPDATE SKIP LOCKED
+(каждое задание достается ровно одному процессу), о новых и выполненных заданиях
+сообщают PostgreSQL NOTIFY.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+NEW_JOBS_CHANNEL = "report_jobs_new"
+DONE_JOBS_CHANNEL = "report_jobs_done"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    id: int
+    kind: str
+    seller_account_id: int
+    report_date: date
+    attempts: int
+
+
+class ReportJobManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def enqueue(self, kind: str, seller_account_ids: List[int], report_date: date,
+                      reuse_seconds: int = 0) -> List[int]:
+        """
+        Поставить задания по магазинам (в порядке seller_account_ids) и вернуть их ID.
+        Незавершенное задание на тот же отчет, а также выполненное не раньше reuse_seconds назад,
+        используется повторно - несколько администраторов ждут один и тот же расчет.
+        Вызывающий становится ожидающим заданий и должен вызвать release() по окончании ожидания.
+        """
+        # Постановка заданий одного типа сериализуется, чтобы параллельные запросы не создали дубли
+        await self.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:kind))"), {"kind": kind})
+
+        # Время сравнивается по часам БД: started_at и finished_at записываются через now()
+        reuse_after = func.now() - timedelta(seconds=reuse_seconds)
+        stmt = select(ReportJob.seller_account_id, func.max(ReportJob.id)).where(
+            ReportJob.kind == kind,
+            ReportJob.report_date == report_date,
+            ReportJob.seller_account_id.in_(seller_account_ids),
+            (ReportJob.status.in_((STATUS_PENDING, STATUS_RUNNING))) |
+            ((ReportJob.status == STATUS_DONE) & (ReportJob.finished_at >= reuse_after))
+        ).group_by(ReportJob.seller_account_id)
+        existing: Dict[int, int] = dict((await self.session.execute(stmt)).all())
+
+        new_jobs = [ReportJob(kind=kind, seller_account_id=account_id, report_date=report_date,
+                              status=STATUS_PENDING, attempts=0)
+                    for account_id in seller_account_ids if account_id not in existing]
+        if new_jobs:
+            self.session.add_all(new_jobs)
+            await self.session.flush()
+            await self.session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": NEW_JOBS_CHANNEL})
+
+        created = {job.seller_account_id: job.id for job in new_jobs}
+        job_ids = [existing.get(account_id) or created[account_id] for account_id in seller_account_ids]
+        await self.session.execute(update(ReportJob).where(ReportJob.id.in_(set(job_ids))).values(
+            waiters=ReportJob.waiters + 1
+        ))
+        await self.session.commit()
+
+        logger.info(f"Задания {kind} за {report_date}: новых {len(created)}, повторно используется {len(existing)}")
+        return job_ids
+
+    async def claim(self, worker: str) -> Optional[ClaimedJob]:
+        """
+        Забрать самое старое ожидающее задание (задания, заблокированные другими процессами, пропускаются)
+        """
+        next_job = select(ReportJob.id).where(
+            ReportJob.status == STATUS_PENDING
+        ).order_by(ReportJob.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+        stmt = update(ReportJob).where(ReportJob.id == next_job).values(
+            status=STATUS_RUNNING,
+            worker=worker,
+            attempts=ReportJob.attempts + 1,
+            started_at=func.now(),
+            updated=func.now(),
+        ).returning(ReportJob.id, ReportJob.kind, ReportJob.seller_account_id, ReportJob.report_date,
+                    ReportJob.attempts)
+
+        row = (await self.session.execute(stmt)).first()
+        await self.session.commit()
+        return ClaimedJob(*row) if row else None
+
+    async def finish(self, job_id: int, worker: str, result: Optional[Dict] = None,
+                     error: Optional[str] = None) -> bool:
+        """
+        Записать результат (или ошибку) задания и оповестить ожидающие процессы бота.
+        Если задание уже вернулось в очередь и его взял другой процесс, результат не записывается (False)
+        """
+        finished = await self.session.execute(update(ReportJob).where(
+            ReportJob.id == job_id,
+            ReportJob.worker == worker,
+            ReportJob.status == STATUS_RUNNING
+        ).values(
+            status=STATUS_FAILED if error else STATUS_DONE,
+            result=result,
+            error=error,
+            finished_at=func.now(),
+            updated=func.now(),
+        ))
+        if finished.rowcount == 0:
+            await self.session.rollback()
+            return False
+
+        await self.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {"channel": DONE_JOBS_CHANNEL, "payload": str(job_id)})
+        await self.session.commit()
+        return True
+
+    async def release(self, kind: str, job_ids: List[int], cancel: bool = False) -> int:
+        """
+        Перестать ждать задания. При отмене отчета задания, которые еще не взяты в работу
+        и которых больше никто не ждет, снимаются с очереди; возвращает их количество
+        """
+        if cancel:
+            # Сериализуется с enqueue(): задание не снимается, пока его подхватывает другой отчет
+            await self.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:kind))"), {"kind": kind})
+
+        await self.session.execute(update(ReportJob).where(ReportJob.id.in_(set(job_ids))).values(
+            waiters=func.greatest(ReportJob.waiters - 1, 0)
+        ))
+        if not cancel:
+            await self.session.commit()
+            return 0
+
+        cancelled = await self.session.execute(update(ReportJob).where(
+            ReportJob.id.in_(set(job_ids)),
+            ReportJob.status == STATUS_PENDING,
+            ReportJob.waiters == 0
+        ).values(
+            status=STATUS_FAILED, error="Отчет отменен", finished_at=func.now(), updated=func.now()
+        ).returning(ReportJob.id))
+        cancelled_ids = [job_id for (job_id,) in cancelled.all()]
+        for job_id in cancelled_ids:
+            await self.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                       {"channel": DONE_JOBS_CHANNEL, "payload": str(job_id)})
+        await self.session.commit()
+        return len(cancelled_ids)
+
+    async def get_jobs(self, job_ids: List[int]) -> Dict[int, ReportJob]:
+        """
+        Задания по ID (с результатами)
+        """
+        result = await self.session.execute(select(ReportJob).where(ReportJob.id.in_(job_ids)))
+        return {job.id: job for job in result.scalars()}
+
+    async def count_finished(self, job_ids: List[int]) -> int:
+        stmt = select(func.count()).select_from(ReportJob).where(
+            ReportJob.id.in_(job_ids),
+            ReportJob.status.in_(FINISHED_STATUSES)
+        )
+        return (await self.session.execute(stmt)).scalar()
+
+    async def requeue_stale(self, timeout_seconds: int, max_attempts: int) -> int:
+        """
+        Вернуть в очередь задания, процесс которых завис или упал (после max_attempts - ошибка)
+        """
+        started_before = func.now() - timedelta(seconds=timeout_seconds)
+        stale = (ReportJob.status == STATUS_RUNNING) & (ReportJob.started_at < started_before)
+
+        failed = await self.session.execute(update(ReportJob).where(
+            stale, ReportJob.attempts >= max_attempts
+        ).values(
+            status=STATUS_FAILED, error="Превышено время выполнения задания", finished_at=func.now(),
+            updated=func.now()
+        ).returning(ReportJob.id))
+        for (job_id,) in failed.all():
+            await self.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                       {"channel": DONE_JOBS_CHANNEL, "payload": str(job_id)})
+
+        requeued = await self.session.execute(update(ReportJob).where(stale).values(
+            status=STATUS_PENDING, worker=None, updated=func.now()
+        ))
+        await self.session.commit()
+        return requeued.rowcount
+
+    async def delete_finished_before(self, days: int) -> int:
+        """
+        Удалить завершенные задания старше days дней
+        """
+        stmt = ReportJob.__table__.delete().where(
+            ReportJob.status.in_(FINISHED_STATUSES),
+            ReportJob.finished_at < func.now() - timedelta(days=days)
+        )
+        result = await self.session.execute(stmt)
+        await self.session.commit()
+        return result.rowcount
@@ -0,0 +1,65 @@
+# database/stock_manager.py
+from datetime import date
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class StockManager:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def bulk_upsert_snapshot(self, rows: List[Dict]) -> int:
+        """
+        Записать снимок остатков пачкой (повторный снимок за тот же день перезаписывает значения)
+        """
+        if not rows:
+            return 0
+
+        stmt = insert(StockSnapshot)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['seller_account_id', 'snapshot_date', 'nm_id', 'warehouse_name'],
+            set_={
+                'supplier_article': stmt.excluded.supplier_article,
+                'quantity': stmt.excluded.quantity,
+                'in_way_to_client': stmt.excluded.in_way_to_client,
+                'in_way_from_client': stmt.excluded.in_way_from_client,
+                'updated': func.now(),
+            }
+        )
+        await self.session.execute(stmt, rows)
+        return len(rows)
+
+    async def get_latest_snapshot_date(self, seller_account_id: int) -> Optional[date]:
+        """
+        Дата последнего снимка остатков магазина
+        """
+        stmt = select(func.max(StockSnapshot.snapshot_date)).where(
+            StockSnapshot.seller_account_id == seller_account_id
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar()
+
+    async def get_snapshot(self, seller_account_id: int, snapshot_date: date) -> List[tuple]:
+        """
+        Остатки магазина на дату: [(nm_id, supplier_article, warehouse_name, quantity, in_way_to_client)]
+        """
+        stmt = select(
+            StockSnapshot.nm_id,
+            StockSnapshot.supplier_article,
+            StockSnapshot.warehouse_name,
+            StockSnapshot.quantity,
+            StockSnapshot.in_way_to_client,
+        ).where(
+            StockSnapshot.seller_account_id == seller_account_id,
+            StockSnapshot.snapshot_date == snapshot_date
+        )
+        result = await self.session.execute(stmt)
+        return list(result.all())
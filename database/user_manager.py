@@ -1,8 +1,38 @@
 # database/user_manager.py
+import asyncio
+import logging
+from typing import Dict, List
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, exists, func, or_, union_all
+from sqlalchemy.dialects.postgresql import insert
 from database.models import User
-from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _profile_row(tg_user) -> Dict:
+    return {
+        'tg_id': tg_user.id,
+        'username': tg_user.username,
+        'first_name': tg_user.first_name,
+        'last_name': tg_user.last_name,
+    }
+
+
+def _upsert_statement():
+    """
+    INSERT ... ON CONFLICT (tg_id) DO UPDATE, который пишет строку только при изменении профиля
+    """
+    stmt = insert(User)
+    changed = or_(*(getattr(User, field).is_distinct_from(stmt.excluded[field]) for field in PROFILE_FIELDS))
+    return stmt.on_conflict_do_update(
+        index_elements=['tg_id'],
+        set_={**{field: stmt.excluded[field] for field in PROFILE_FIELDS}, 'updated': func.now()},
+        where=changed
+    )
 
 
 class UserManager:
@@ -11,56 +41,36 @@ class UserManager:
 
     async def get_or_create_user(self, tg_user) -> User:
         """
-        Получение или создание пользователя из объекта Telegram User
-        """
-        # Ищем существующего пользователя
-        stmt = select(User).where(User.tg_id == tg_user.id)
-        result = await self.session.execute(stmt)
-        existing_user = result.scalar_one_or_none()
-
-        if existing_user:
-            # Обновляем данные существующего пользователя
-            await self._update_user_data(existing_user, tg_user)
-            return existing_user
-        else:
-            # Создаем нового пользователя
-            new_user = await self._create_new_user(tg_user)
-            return new_user
-
-    async def _update_user_data(self, user: User, tg_user):
+        Получение или создание пользователя из объекта Telegram User одним запросом.
+        Существующая строка перезаписывается, только если изменились имя или username
         """
-        Обновление данных существующего пользователя
-        """
-        update_data = {
-            'first_name': tg_user.first_name,
-            'last_name': tg_user.last_name,
-            'username': tg_user.username,
-        }
-
-        await self.session.execute(
-            update(User)
-            .where(User.tg_id == tg_user.id)
-            .values(**update_data)
+        upsert = _upsert_statement().values(**_profile_row(tg_user)).returning(*User.__table__.c).cte('upserted')
+        # Если профиль не изменился, RETURNING пуст - берем существующую строку
+        stmt = union_all(
+            select(upsert),
+            select(User.__table__).where(
+                User.tg_id == tg_user.id,
+                ~exists(select(upsert.c.id))
+            )
         )
+        result = await self.session.execute(select(User).from_statement(stmt))
+        user = result.scalar_one_or_none()
+        if user is None:
+            # Пользователя одновременно создал другой запрос: строка закоммичена после снимка
+            # нашего запроса и видна только следующему
+            user = await self.get_user_by_tg_id(tg_user.id)
         await self.session.commit()
+        return user
 
-    async def _create_new_user(self, tg_user) -> User:
+    async def bulk_upsert_profiles(self, rows: List[Dict]) -> int:
         """
-        Создание нового пользователя
+        Записать пачку профилей (executemany), неизменившиеся строки не перезаписываются
         """
-        new_user = User(
-            tg_id=tg_user.id,
-            username=tg_user.username,
-            first_name=tg_user.first_name,
-            last_name=tg_user.last_name,
-        )
+        if not rows:
+            return 0
 
-        self.session.add(new_user)
-        await self.session.commit()
-        await self.session.refresh(new_user)
-
-        print(f"✅ Новый пользователь создан: {new_user}")
-        return new_user
+        await self.session.execute(_upsert_statement(), rows)
+        return len(rows)
 
     async def get_user_by_tg_id(self, tg_id: int) -> User | None:
         """
@@ -68,4 +78,48 @@ class UserManager:
         """
         stmt = select(User).where(User.tg_id == tg_id)
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
\ No newline at end of file
+        return result.scalar_one_or_none()
+
+
+class UserProfileBuffer:
+    """
+    Буфер профилей пользователей из входящих обновлений.
+    Профили копятся в памяти (последний по каждому tg_id) и периодически пишутся одной пачкой
+    """
+
+    def __init__(self, session_maker, interval: float = 60):
+        self.session_maker = session_maker
+        self.interval = interval
+        self.pending: Dict[int, Dict] = {}
+
+    def add(self, tg_user):
+        if tg_user is None or tg_user.is_bot:
+            return
+        self.pending[tg_user.id] = _profile_row(tg_user)
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+
+        rows, self.pending = list(self.pending.values()), {}
+        try:
+            async with self.session_maker() as session:
+                await UserManager(session).bulk_upsert_profiles(rows)
+                await session.commit()
+        except Exception:
+            # Не теряем профили: вернем их в буфер, если за это время не пришли более свежие
+            for row in rows:
+                self.pending.setdefault(row['tg_id'], row)
+            raise
+
+        logger.debug(f"Записано профилей пользователей: {len(rows)}")
+        return len(rows)
+
+    async def start_worker(self):
+        """Периодически сбрасывать буфер в БД"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи профилей пользователей: {e}")
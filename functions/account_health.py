@@ -0,0 +1,258 @@
+# functions/account_health.py
+"""
+Предохранитель запросов к WB API по магазинам.
+healthy -> degraded: временная ошибка (таймаут, обрыв соединения, 5xx), запросы продолжаются.
+degraded -> open: ACCOUNT_HEALTH_FAILURE_THRESHOLD временных ошибок подряд; запросы не отправляются
+до retry_at, затем проходит один пробный запрос: успех возвращает healthy, ошибка - open с удвоенной паузой.
+Ответ 401/403 сразу переводит магазин в open до замены API ключа.
+Проверка и учет результатов выполняются в хуках TraceConfig клиентских сессий WB (functions/metrics.py),
+поэтому повторные попытки любого клиента для такого магазина завершаются сразу, без ожидания.
+Состояние хранится в таблице account_health и перечитывается из БД раз в ACCOUNT_HEALTH_REFRESH секунд
+(другие процессы бота и worker.py видят открытый предохранитель).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from database.account_health_manager import AccountHealthManager
+from database.account_registry import account_registry
+
+logger = logging.getLogger(__name__)
+
+STATE_HEALTHY = "healthy"
+STATE_DEGRADED = "degraded"
+STATE_OPEN = "open"
+
+REASON_AUTH = "auth"
+REASON_UNAVAILABLE = "unavailable"
+
+# Значения для метрики wb_account_health_state
+STATE_VALUES = {STATE_HEALTHY: 0, STATE_DEGRADED: 1, STATE_OPEN: 2}
+
+
+class AccountUnavailableError(ValueError):
+    """Запрос не отправлен: предохранитель магазина открыт"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class HealthState:
+    state: str = STATE_HEALTHY
+    reason: Optional[str] = None
+    failures: int = 0
+    last_error: Optional[str] = None
+    opened_at: Optional[datetime] = None
+    retry_at: Optional[datetime] = None
+    cooldown: int = 0
+    key_hash: Optional[str] = None
+    # Время начала пробного запроса (только в памяти процесса)
+    probe_started: Optional[float] = None
+
+
+def format_health(health: Optional[HealthState]) -> str:
+    """Подпись состояния для списка магазинов (для healthy - пустая строка)"""
+    if health is None or health.state == STATE_HEALTHY:
+        return ""
+    if health.state == STATE_DEGRADED:
+        return f" — ⚠️ ошибки API ({health.failures} подряд)"
+    if health.reason == REASON_AUTH:
+        return " — ⛔ неверный API ключ"
+    if health.retry_at is not None and datetime.now() < health.retry_at:
+        return f" — ⛔ недоступен до {health.retry_at:%H:%M}"
+    return " — ⛔ проверка доступности"
+
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def _clean_key(authorization: Optional[str]) -> Optional[str]:
+    return authorization.removeprefix("Bearer ") if authorization else None
+
+
+class AccountHealth:
+    def __init__(self, failure_threshold: int = None, cooldown: int = None, max_cooldown: int = None,
+                 refresh_interval: float = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("ACCOUNT_HEALTH_FAILURE_THRESHOLD", "5"))
+        self.cooldown = cooldown or int(os.getenv("ACCOUNT_HEALTH_COOLDOWN", "300"))
+        self.max_cooldown = max_cooldown or int(os.getenv("ACCOUNT_HEALTH_MAX_COOLDOWN", "3600"))
+        self.refresh_interval = refresh_interval or float(os.getenv("ACCOUNT_HEALTH_REFRESH", "60"))
+        # Пробный запрос, не вернувший результат за это время, считается потерянным
+        self.probe_timeout = 180
+        self._states: Dict[int, HealthState] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _session():
+        from database.engine import session_maker
+        return session_maker()
+
+    async def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            try:
+                async with self._session() as session:
+                    rows = await AccountHealthManager(session).get_all()
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить состояние магазинов: {e}")
+                self._loaded_at = time.monotonic()
+                return
+
+            states = {}
+            for row in rows:
+                previous = self._states.get(row.seller_account_id)
+                states[row.seller_account_id] = HealthState(
+                    state=row.state, reason=row.reason, failures=row.failures, last_error=row.last_error,
+                    opened_at=row.opened_at, retry_at=row.retry_at, cooldown=row.cooldown, key_hash=row.key_hash,
+                    probe_started=previous.probe_started if previous else None
+                )
+            self._states = states
+            self._loaded_at = time.monotonic()
+
+    async def _save(self, account_id: int, health: HealthState):
+        self._states[account_id] = health
+        try:
+            async with self._session() as session:
+                await AccountHealthManager(session).save(
+                    account_id, state=health.state, reason=health.reason, failures=health.failures,
+                    last_error=health.last_error, opened_at=health.opened_at, retry_at=health.retry_at,
+                    cooldown=health.cooldown, key_hash=health.key_hash
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить состояние магазина {account_id}: {e}")
+
+    async def check(self, account_id: int, api_key: str):
+        """Поднимает AccountUnavailableError, если запросы к магазину сейчас не отправляются"""
+        await self._ensure_loaded()
+        health = self._states.get(account_id)
+        if health is None or health.state != STATE_OPEN:
+            return
+
+        if health.reason == REASON_AUTH:
+            if health.key_hash == _key_hash(api_key):
+                raise AccountUnavailableError("Неверный API ключ", REASON_AUTH)
+            # Ключ заменен (в том числе в другом процессе): блокировка снимается
+            logger.info(f"Магазин {account_id}: API ключ заменен, предохранитель сброшен")
+            await self._save(account_id, HealthState())
+            return
+
+        if health.retry_at is not None and datetime.now() < health.retry_at:
+            raise AccountUnavailableError(
+                f"Ошибка подключения к API: магазин недоступен до {health.retry_at:%H:%M}", REASON_UNAVAILABLE)
+
+        # Пора проверить магазин: пропускаем один пробный запрос, остальные ждут его результата
+        if health.probe_started is not None and time.monotonic() - health.probe_started < self.probe_timeout:
+            raise AccountUnavailableError(
+                "Ошибка подключения к API: идет проверка доступности магазина", REASON_UNAVAILABLE)
+        health.probe_started = time.monotonic()
+        logger.info(f"Магазин {account_id}: пробный запрос после {health.failures} ошибок")
+
+    async def record_success(self, account_id: int):
+        await self._ensure_loaded()
+        health = self._states.get(account_id)
+        if health is None or health.state == STATE_HEALTHY:
+            return
+        logger.info(f"Магазин {account_id}: запросы к WB API снова успешны")
+        await self._save(account_id, HealthState())
+
+    async def record_auth_failure(self, account_id: int, api_key: str, status: int):
+        await self._ensure_loaded()
+        health = self._states.get(account_id)
+        key_hash = _key_hash(api_key)
+        if health is not None and health.reason == REASON_AUTH and health.key_hash == key_hash:
+            return
+        logger.warning(f"Магазин {account_id}: WB отклонил API ключ ({status}), запросы остановлены до замены ключа")
+        await self._save(account_id, HealthState(
+            state=STATE_OPEN, reason=REASON_AUTH, last_error=f"Неверный API ключ ({status})",
+            opened_at=datetime.now(), key_hash=key_hash
+        ))
+
+    async def record_failure(self, account_id: int, error: str):
+        """Временная ошибка: таймаут, обрыв соединения или 5xx"""
+        await self._ensure_loaded()
+        health = self._states.get(account_id) or HealthState()
+        if health.reason == REASON_AUTH:
+            return
+        if health.state == STATE_OPEN and health.probe_started is None:
+            # Ответ на запрос, отправленный до открытия предохранителя
+            return
+
+        failures = health.failures + 1
+        if health.state == STATE_OPEN:
+            # Неудачный пробный запрос: пауза удваивается
+            cooldown = min(max(health.cooldown, self.cooldown) * 2, self.max_cooldown)
+        elif failures >= self.failure_threshold:
+            cooldown = self.cooldown
+        else:
+            await self._save(account_id, HealthState(state=STATE_DEGRADED, failures=failures, last_error=error))
+            return
+
+        logger.warning(f"Магазин {account_id}: {failures} ошибок подряд ({error}), "
+                       f"запросы приостановлены на {cooldown} сек.")
+        await self._save(account_id, HealthState(
+            state=STATE_OPEN, reason=REASON_UNAVAILABLE, failures=failures, last_error=error,
+            opened_at=health.opened_at if health.state == STATE_OPEN else datetime.now(),
+            retry_at=datetime.now() + timedelta(seconds=cooldown), cooldown=cooldown
+        ))
+
+    async def reset(self, account_id: int):
+        """Сбросить состояние магазина (после замены API ключа)"""
+        self._states.pop(account_id, None)
+        async with self._session() as session:
+            await AccountHealthManager(session).reset(account_id)
+
+    async def get_states(self) -> Dict[int, HealthState]:
+        """Состояния магазинов для отображения (магазины без записи - healthy)"""
+        await self._ensure_loaded()
+        return dict(self._states)
+
+    def state_values(self) -> Dict[Tuple[str, ...], float]:
+        return {(str(account_id),): STATE_VALUES.get(health.state, 0) for account_id, health in self._states.items()}
+
+    # Хуки клиентских сессий WB: магазин определяется по токену из кэша магазинов
+
+    async def before_request(self, authorization: Optional[str]):
+        api_key = _clean_key(authorization)
+        account = await account_registry.find_by_api_key(api_key) if api_key else None
+        if account is not None:
+            await self.check(account.id, api_key)
+
+    async def after_response(self, authorization: Optional[str], status: int):
+        api_key = _clean_key(authorization)
+        account = await account_registry.find_by_api_key(api_key) if api_key else None
+        if account is None:
+            return
+        if status in (401, 403):
+            await self.record_auth_failure(account.id, api_key, status)
+        elif status >= 500:
+            await self.record_failure(account.id, f"Ошибка сервера: {status}")
+        elif status < 400:
+            await self.record_success(account.id)
+        # 429 и прочие 4xx не говорят о состоянии магазина
+
+    async def after_exception(self, authorization: Optional[str], exception: BaseException):
+        if not isinstance(exception, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return
+        api_key = _clean_key(authorization)
+        account = await account_registry.find_by_api_key(api_key) if api_key else None
+        if account is not None:
+            error = "Таймаут запроса" if isinstance(exception, asyncio.TimeoutError) else "Ошибка подключения"
+            await self.record_failure(account.id, error)
+
+
+# Общее состояние на процесс
+account_health = AccountHealth()
@@ -0,0 +1,71 @@
+# functions/compute_pool.py
+"""
+Пул процессов для тяжелых вычислений (агрегация больших ответов WB), чтобы цикл событий
+занимался только вводом-выводом. Небольшие объемы считаются на месте: передача данных
+в другой процесс для них дороже самого расчета.
+Процессы пула запускаются через forkserver, а не fork: в процессе бота уже работают потоки
+(сторож цикла событий, потоки исполнителя по умолчанию), и копия процесса могла бы унаследовать
+захваченную блокировку (например, обработчика логов) и зависнуть.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Модули с функциями для пула: forkserver загружает их один раз, процессы пула получают их готовыми.
+# Модуль запуска (run.py, worker.py) каждый процесс пула все равно импортирует заново как __mp_main__,
+# поэтому на уровне модуля в них только импорты и определения, а настройка - под if __name__ == "__main__"
+PRELOAD_MODULES = ["functions.report_aggregation"]
+
+
+class ComputePool:
+    def __init__(self, size: int = None, inline_threshold: int = None):
+        # 0 - пул отключен, все считается в текущем процессе
+        self.size = size if size is not None else int(os.getenv("COMPUTE_POOL_SIZE", "2"))
+        # Минимальное число строк, начиная с которого расчет уходит в пул
+        self.inline_threshold = inline_threshold if inline_threshold is not None else \
+            int(os.getenv("COMPUTE_INLINE_THRESHOLD", "5000"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            self._executor = ProcessPoolExecutor(max_workers=self.size, mp_context=context)
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args, rows: int) -> T:
+        """Выполнить func(*args) в пуле, если входных строк не меньше порога, иначе на месте.
+        func должна быть функцией верхнего уровня модуля (см. PRELOAD_MODULES), аргументы и результат -
+        сериализуемыми"""
+        if self.size <= 0 or rows < self.inline_threshold:
+            return func(*args)
+
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, по памяти): пересоздадим пул при следующем вызове
+            logger.error(f"Пул вычислений недоступен, {func.__name__} считается в основном процессе")
+            self._executor = None
+            return func(*args)
+
+        logger.debug(f"{func.__name__}: {rows} строк в пуле за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Общий пул на процесс
+compute_pool = ComputePool()
@@ -5,13 +5,18 @@ from datetime import datetime
 from typing import List, Dict, Tuple
 import logging
 
+from functions.account_health import AccountUnavailableError
+from functions.deadline import DeadlineExceeded, request_timeout
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.wb_endpoints import STATISTICS_API_URL
+
 logger = logging.getLogger(__name__)
 
 
 class CurrentStatistics:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "https://statistics-api.wildberries.ru"
+        self.base_url = STATISTICS_API_URL
         self.headers = {
             "Authorization": api_key,
             "Content-Type": "application/json"
@@ -35,12 +40,12 @@ class CurrentStatistics:
 
                 logger.info(f"Запрос заказов (попытка {attempt + 1}/{max_retries})")
 
-                async with aiohttp.ClientSession() as session:
+                async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
                     async with session.get(
                             f"{self.base_url}/api/v1/supplier/orders",
                             headers=self.headers,
                             params=params,
-                            timeout=30
+                            timeout=request_timeout(30)
                     ) as response:
 
                         logger.info(f"Статус ответа заказов: {response.status}")
@@ -60,7 +65,7 @@ class CurrentStatistics:
                             # Увеличиваем задержку с каждой попыткой
                             wait_time = (attempt + 1) * 30  # 30, 60, 90, 120, 150 секунд
                             logger.info(f"Ждем {wait_time} секунд перед повторной попыткой")
-                            await asyncio.sleep(wait_time)
+                            await wb_sleep(wait_time, "wb_retry_after")
                             continue
 
                         else:
@@ -68,7 +73,7 @@ class CurrentStatistics:
                             logger.error(f"Ошибка API заказов: {response.status}")
                             last_error = "Ошибка сервера"
                             if attempt < max_retries - 1:
-                                await asyncio.sleep(30)
+                                await wb_sleep(30, "wb_retry")
                                 continue
                             else:
                                 raise ValueError("Ошибка сервера")
@@ -77,11 +82,15 @@ class CurrentStatistics:
                 logger.warning(f"Таймаут запроса заказов (попытка {attempt + 1})")
                 last_error = "Таймаут запроса"
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise ValueError("Таймаут запроса")
 
+            except (AccountUnavailableError, DeadlineExceeded):
+                # Предохранитель магазина открыт или время отчета истекло: повторы бесполезны
+                raise
+
             except ValueError as e:
                 error_msg = str(e)
                 # Если это неисправимые ошибки - не повторяем
@@ -89,7 +98,7 @@ class CurrentStatistics:
                     raise
                 last_error = error_msg
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise
@@ -98,7 +107,7 @@ class CurrentStatistics:
                 logger.warning(f"Неожиданная ошибка при получении заказов (попытка {attempt + 1}): {e}")
                 last_error = "Ошибка подключения"
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise ValueError("Ошибка подключения")
@@ -124,12 +133,12 @@ class CurrentStatistics:
 
                 logger.info(f"Запрос продаж (попытка {attempt + 1}/{max_retries})")
 
-                async with aiohttp.ClientSession() as session:
+                async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
                     async with session.get(
                             f"{self.base_url}/api/v1/supplier/sales",
                             headers=self.headers,
                             params=params,
-                            timeout=30
+                            timeout=request_timeout(30)
                     ) as response:
 
                         logger.info(f"Статус ответа продаж: {response.status}")
@@ -148,7 +157,7 @@ class CurrentStatistics:
                             last_error = "Превышен лимит запросов"
                             wait_time = (attempt + 1) * 30
                             logger.info(f"Ждем {wait_time} секунд перед повторной попыткой")
-                            await asyncio.sleep(wait_time)
+                            await wb_sleep(wait_time, "wb_retry_after")
                             continue
 
                         else:
@@ -156,7 +165,7 @@ class CurrentStatistics:
                             logger.error(f"Ошибка API продаж: {response.status}")
                             last_error = "Ошибка сервера"
                             if attempt < max_retries - 1:
-                                await asyncio.sleep(30)
+                                await wb_sleep(30, "wb_retry")
                                 continue
                             else:
                                 raise ValueError("Ошибка сервера")
@@ -165,18 +174,22 @@ class CurrentStatistics:
                 logger.warning(f"Таймаут запроса продаж (попытка {attempt + 1})")
                 last_error = "Таймаут запроса"
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise ValueError("Таймаут запроса")
 
+            except (AccountUnavailableError, DeadlineExceeded):
+                # Предохранитель магазина открыт или время отчета истекло: повторы бесполезны
+                raise
+
             except ValueError as e:
                 error_msg = str(e)
                 if error_msg in ["Неверный API ключ"]:
                     raise
                 last_error = error_msg
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise
@@ -185,7 +198,7 @@ class CurrentStatistics:
                 logger.warning(f"Неожиданная ошибка при получении продаж (попытка {attempt + 1}): {e}")
                 last_error = "Ошибка подключения"
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(30)
+                    await wb_sleep(30, "wb_retry")
                     continue
                 else:
                     raise ValueError("Ошибка подключения")
@@ -238,7 +251,7 @@ class CurrentStatistics:
             orders_quantity, orders_amount = await self.get_today_orders_stats()
 
             # Задержка между запросами
-            await asyncio.sleep(2)
+            await wb_sleep(2, "wb_pacing")
 
             # Запрос продаж с повторными попытками
             sales_quantity, sales_amount = await self.get_today_sales_stats()
@@ -264,12 +277,12 @@ class CurrentStatistics:
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
                 async with session.get(
                         f"{self.base_url}/api/v1/supplier/orders",
                         headers=self.headers,
                         params=params,
-                        timeout=30
+                        timeout=request_timeout(30)
                 ) as response:
 
                     if response.status == 200:
@@ -295,12 +308,12 @@ class CurrentStatistics:
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
                 async with session.get(
                         f"{self.base_url}/api/v1/supplier/sales",
                         headers=self.headers,
                         params=params,
-                        timeout=30
+                        timeout=request_timeout(30)
                 ) as response:
 
                     if response.status == 200:
@@ -6,8 +6,12 @@ from database.account_manager import AccountManager
 from datetime import datetime, timezone
 import pytz
 import logging
+import time
 
-from functions.current_statistics import CurrentStatistics
+from functions.metrics import (mark_scheduler_success, report_run_duration, report_store_duration,
+                               report_store_errors)
+from functions.wb_client import wb_sleep
+from functions.orders_sales_sync import get_today_stats, orders_sync_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -65,18 +69,19 @@ class CurrentStatisticsScheduler:
 
             successful_accounts = 0
             rate_limited_accounts = 0
+            run_started = time.perf_counter()
 
             # Собираем статистику по каждому магазину
             for i, account in enumerate(all_accounts):
                 account_display_name = account.account_name or f"Магазин {account.id}"
+                store_started = time.perf_counter()
 
                 try:
-                    # Задержка между запросами к разным аккаунтам (2 секунды)
-                    if i > 0:
-                        await asyncio.sleep(2)
+                    # Задержка между запросами к разным аккаунтам (2 секунды), не нужна при чтении из БД
+                    if i > 0 and not orders_sync_enabled():
+                        await wb_sleep(2, "wb_pacing")
 
-                    wb_api = CurrentStatistics(account.api_key)
-                    stats = await wb_api.get_today_stats_for_message()
+                    stats = await get_today_stats(self.session_maker, account)
 
                     orders_quantity = stats["orders"]["quantity"]
                     orders_amount = stats["orders"]["amount"]
@@ -108,6 +113,11 @@ class CurrentStatisticsScheduler:
 
                     stats_text += f"<b>{account_display_name}</b>\n"
                     stats_text += f"{display_error}\n\n"
+                    report_store_errors.inc(report="daily_stats_message")
+
+                report_store_duration.observe(time.perf_counter() - store_started, report="daily_stats_message")
+
+            report_run_duration.observe(time.perf_counter() - run_started, report="daily_stats_message")
 
             # Добавляем подсказку только если есть ошибки лимита
             if rate_limited_accounts > 0:
@@ -127,27 +137,26 @@ class CurrentStatisticsScheduler:
 
             # Получаем статистику (один раз для всех)
             message = await self.get_daily_stats_message(scheduled_time)
-            successful_sends = 0
-            failed_sends = 0
 
-            # Отправляем каждому администратору в личный чат
-            for admin in admin_users:
+            async def send_to_admin(admin) -> bool:
                 try:
                     await self.bot.send_message(admin.id, message)
                     logger.info(
                         f"Автоотчет {scheduled_time} отправлен пользователю {admin.first_name} (ID: {admin.id})")
-                    successful_sends += 1
-
-                    # Небольшая задержка между отправками, чтобы не превысить лимиты Telegram
-                    await asyncio.sleep(0.5)
-
+                    return True
                 except Exception as e:
                     logger.error(
                         f"Ошибка при отправке автоотчета пользователю {admin.first_name} (ID: {admin.id}): {e}")
-                    failed_sends += 1
+                    return False
+
+            # Отправляем всем администраторам параллельно, темп задают лимиты сессии бота
+            results = await asyncio.gather(*(send_to_admin(admin) for admin in admin_users))
+            successful_sends = sum(results)
+            failed_sends = len(results) - successful_sends
 
             logger.info(
                 f"Итоги отправки автоотчета {scheduled_time}: успешно {successful_sends}, ошибок {failed_sends}")
+            mark_scheduler_success("current_statistics")
 
         except Exception as e:
             logger.error(f"Ошибка при подготовке автоотчета {scheduled_time}: {e}")
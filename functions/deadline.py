@@ -0,0 +1,65 @@
+# functions/deadline.py
+"""
+Бюджет времени отчета. Дедлайн хранится в contextvar и действует на все вложенные вызовы:
+паузы (wb_sleep из functions/wb_client.py), в том числе ожидание лимитов WB и повторы после ошибок,
+не начинаются, если не успеют закончиться, а таймауты запросов к WB не превышают оставшееся время.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class DeadlineExceeded(ValueError):
+    """Время на отчет (или на магазин) истекло"""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + max(0.0, seconds)
+        # Хотя бы одна операция прервана из-за дедлайна: данные могут быть неполными
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def child(self, seconds: float) -> "Deadline":
+        """Вложенный бюджет (например, на один магазин), не выходящий за текущий"""
+        return Deadline(min(seconds, self.remaining()))
+
+
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("current_deadline",
+                                                                                     default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def check_deadline(wait: float = 0.0):
+    """Поднимает DeadlineExceeded, если операция длительностью wait секунд не успеет до дедлайна"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    remaining = deadline.remaining()
+    if remaining <= 0 or wait > remaining:
+        deadline.exceeded = True
+        raise DeadlineExceeded("Таймаут запроса: время на отчет истекло")
+
+
+def request_timeout(default: float) -> float:
+    """Таймаут запроса: не больше оставшегося времени отчета"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    check_deadline()
+    return min(default, deadline.remaining())
@@ -0,0 +1,246 @@
+# functions/funnel_backfill.py
+"""
+Фоновая загрузка истории воронки продаж по товарам.
+Для каждого магазина проходит назад по дням (окнами по 7 дней) до заданной глубины,
+запрашивая историю пачками nmId, и сохраняет дневные строки по товарам в БД.
+Прогресс сохраняется после каждой пачки, поэтому после рестарта загрузка продолжается.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from database.account_manager import AccountManager
+from database.product_daily_stats_manager import ProductDailyStatsManager
+from functions.metrics import mark_scheduler_success
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.wb_endpoints import ANALYTICS_API_URL
+from functions.wb_rate_limiter import wb_rate_limiter, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Ограничения эндпоинта истории: до 20 nmId и до 7 дней в одном запросе
+NM_IDS_PER_REQUEST = 20
+WINDOW_DAYS = 7
+CATALOG_PAGE_SIZE = 1000
+
+
+class FunnelBackfillWorker:
+    def __init__(self, session_maker, horizon_days: int = None, interval: int = None, max_retries: int = 5):
+        self.session_maker = session_maker
+        self.horizon_days = horizon_days or int(os.getenv("FUNNEL_BACKFILL_DAYS", "90"))
+        self.interval = interval or int(os.getenv("FUNNEL_BACKFILL_INTERVAL", "3600"))
+        self.max_retries = max_retries
+
+    async def _request(self, http: aiohttp.ClientSession, api_key: str, path: str, payload: Dict):
+        """POST к seller-analytics-api с низким приоритетом в общем бюджете токена"""
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "accept": "application/json"
+        }
+
+        for attempt in range(self.max_retries):
+            await wb_rate_limiter.acquire(api_key, "analytics", PRIORITY_BACKGROUND)
+
+            try:
+                async with http.post(f"{ANALYTICS_API_URL}{path}", headers=headers,
+                                     json=payload, timeout=60) as response:
+                    if response.status == 200:
+                        return await response.json()
+
+                    if response.status in (401, 403):
+                        raise ValueError("Неверный API ключ")
+
+                    if response.status == 429:
+                        retry_after = float(response.headers.get("Retry-After", 60))
+                        wb_rate_limiter.penalize(api_key, "analytics", retry_after)
+                        continue
+
+                    logger.warning(f"Бэкфилл: ошибка API {response.status} (попытка {attempt + 1})")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Бэкфилл: ошибка подключения (попытка {attempt + 1}): {e}")
+
+            await wb_sleep(30 * (attempt + 1), "wb_retry")
+
+        raise ValueError("Не удалось получить данные после всех попыток")
+
+    async def _load_catalog(self, http: aiohttp.ClientSession, api_key: str, day: date) -> Dict[int, str]:
+        """Получить все nmId магазина: {nm_id: vendor_code}"""
+        catalog = {}
+        offset = 0
+        day_str = day.strftime("%Y-%m-%d")
+
+        while True:
+            payload = {
+                "selectedPeriod": {"start": day_str, "end": day_str},
+                "nmIds": [],
+                "brandNames": [],
+                "subjectIds": [],
+                "tagIds": [],
+                "skipDeletedNm": False,
+                "orderBy": {"field": "openCard", "mode": "desc"},
+                "limit": CATALOG_PAGE_SIZE,
+                "offset": offset
+            }
+            data = await self._request(http, api_key, "/api/analytics/v3/sales-funnel/products", payload)
+            products = (data or {}).get("data", {}).get("products") or (data or {}).get("products") or []
+
+            for item in products:
+                product = item.get("product", {})
+                nm_id = product.get("nmId")
+                if nm_id:
+                    catalog[int(nm_id)] = product.get("vendorCode") or ""
+
+            if len(products) < CATALOG_PAGE_SIZE:
+                break
+            offset += CATALOG_PAGE_SIZE
+
+        return catalog
+
+    @staticmethod
+    def _parse_history(data, seller_account_id: int, catalog: Dict[int, str]) -> List[Dict]:
+        """Преобразовать ответ истории воронки в строки product_daily_stats"""
+        items = data.get("data", data) if isinstance(data, dict) else data
+        rows = []
+
+        for item in items or []:
+            product = item.get("product", {})
+            nm_id = product.get("nmId")
+            if not nm_id:
+                continue
+            article = product.get("vendorCode") or catalog.get(int(nm_id)) or None
+
+            for day in item.get("history", []):
+                stat_date = day.get("date") or day.get("dt")
+                if not stat_date:
+                    continue
+                rows.append({
+                    "seller_account_id": seller_account_id,
+                    "nm_id": int(nm_id),
+                    "supplier_article": article[:100] if article else None,
+                    "stat_date": date.fromisoformat(stat_date[:10]),
+                    "views": day.get("openCount", 0) or 0,
+                    "carts": day.get("cartCount", 0) or 0,
+                    "orders": day.get("orderCount", 0) or 0,
+                    "order_sum": day.get("orderSum", 0) or 0,
+                    "buyouts": day.get("buyoutCount", 0) or 0,
+                    "buyout_sum": day.get("buyoutSum", 0) or 0,
+                })
+
+        return rows
+
+    def _next_window(self, checkpoint, yesterday: date) -> Optional[Tuple[date, date]]:
+        """Выбрать следующее окно: сначала догоняем новые дни, затем идем вглубь истории"""
+        horizon_start = yesterday - timedelta(days=self.horizon_days - 1)
+
+        if checkpoint is None or checkpoint.newest_date is None:
+            return max(yesterday - timedelta(days=WINDOW_DAYS - 1), horizon_start), yesterday
+
+        if checkpoint.newest_date < yesterday:
+            start = checkpoint.newest_date + timedelta(days=1)
+            return start, min(start + timedelta(days=WINDOW_DAYS - 1), yesterday)
+
+        if checkpoint.oldest_date > horizon_start:
+            end = checkpoint.oldest_date - timedelta(days=1)
+            return max(end - timedelta(days=WINDOW_DAYS - 1), horizon_start), end
+
+        return None
+
+    async def backfill_account(self, account):
+        """Загрузить недостающую историю одного магазина"""
+        account_name = account.account_name or f"Магазин {account.id}"
+        yesterday = (datetime.now() - timedelta(days=1)).date()
+        catalog = None
+
+        async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as http:
+            while True:
+                async with self.session_maker() as session:
+                    checkpoint = await ProductDailyStatsManager(session).get_checkpoint(account.id)
+
+                if checkpoint and checkpoint.window_start:
+                    window = (checkpoint.window_start, checkpoint.window_end)
+                    last_nm_id = checkpoint.last_nm_id or 0
+                else:
+                    window = self._next_window(checkpoint, yesterday)
+                    last_nm_id = 0
+
+                if window is None:
+                    logger.info(f"[{account_name}] Бэкфилл: история загружена на {self.horizon_days} дн.")
+                    return
+
+                if catalog is None:
+                    catalog = await self._load_catalog(http, account.api_key, yesterday)
+                    logger.info(f"[{account_name}] Бэкфилл: товаров в каталоге {len(catalog)}")
+                    if not catalog:
+                        return
+
+                window_start, window_end = window
+                logger.info(f"[{account_name}] Бэкфилл окна {window_start} - {window_end}")
+
+                pending = sorted(nm_id for nm_id in catalog if nm_id > last_nm_id)
+                for i in range(0, len(pending), NM_IDS_PER_REQUEST):
+                    batch = pending[i:i + NM_IDS_PER_REQUEST]
+                    payload = {
+                        "selectedPeriod": {"start": window_start.isoformat(), "end": window_end.isoformat()},
+                        "nmIds": batch,
+                        "skipDeletedNm": False,
+                        "aggregationLevel": "day"
+                    }
+                    data = await self._request(http, account.api_key,
+                                               "/api/analytics/v3/sales-funnel/products/history", payload)
+                    rows = self._parse_history(data, account.id, catalog)
+
+                    # Строки и прогресс пишем в одной транзакции
+                    async with self.session_maker() as session:
+                        manager = ProductDailyStatsManager(session)
+                        await manager.bulk_upsert(rows)
+                        await manager.save_checkpoint(account.id, window_start=window_start,
+                                                      window_end=window_end, last_nm_id=batch[-1])
+                        await session.commit()
+
+                # Окно загружено полностью - расширяем диапазон
+                oldest = min(window_start, checkpoint.oldest_date) if checkpoint and checkpoint.oldest_date \
+                    else window_start
+                newest = max(window_end, checkpoint.newest_date) if checkpoint and checkpoint.newest_date \
+                    else window_end
+
+                async with self.session_maker() as session:
+                    await ProductDailyStatsManager(session).save_checkpoint(
+                        account.id, oldest_date=oldest, newest_date=newest,
+                        window_start=None, window_end=None, last_nm_id=None
+                    )
+                    await session.commit()
+
+    async def run_once(self):
+        """Один проход бэкфилла по всем магазинам (магазины параллельно, у каждого свой бюджет)"""
+        async with self.session_maker() as session:
+            accounts = await AccountManager(session).get_all_accounts()
+
+        results = await asyncio.gather(
+            *(self.backfill_account(account) for account in accounts),
+            return_exceptions=True
+        )
+
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                account_name = account.account_name or f"Магазин {account.id}"
+                logger.error(f"[{account_name}] Ошибка бэкфилла истории воронки: {result}")
+
+        mark_scheduler_success("funnel_backfill")
+
+    async def start_worker(self):
+        """Запустить фоновый бэкфилл"""
+        logger.info(f"Бэкфилл истории воронки запущен (глубина {self.horizon_days} дн.)")
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка бэкфилла истории воронки: {e}")
+
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,101 @@
+# functions/loop_monitor.py
+"""
+Монитор цикла событий. Корутина просыпается каждые LOOP_MONITOR_INTERVAL_MS и измеряет,
+насколько позже запланированного ее запустил цикл (задержка для всех обновлений и задач).
+Сторожевой поток замечает, что цикл не отвечает дольше LOOP_BLOCK_THRESHOLD_MS,
+и пишет в лог стек потока цикла - место, где выполняется блокирующий код.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from functions.metrics import event_loop_blocked, event_loop_blocked_seconds, event_loop_lag, event_loop_lag_max
+
+logger = logging.getLogger(__name__)
+
+STACK_DEPTH = 20
+
+
+def loop_monitor_enabled() -> bool:
+    return os.getenv("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = None, block_threshold: float = None, max_samples: int = None):
+        self.interval = interval or float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+        self.block_threshold = block_threshold or float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000
+        # Сколько разных стеков записывать за одну блокировку
+        self.max_samples = max_samples or int(os.getenv("LOOP_BLOCK_MAX_SAMPLES", "3"))
+        self.max_lag = 0.0
+        self.heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+
+    async def start_monitor(self):
+        """Запустить измерение задержки и сторожевой поток (работает до отмены задачи)"""
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stopped.clear()
+        watchdog = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        logger.info(f"Монитор цикла событий запущен (порог блокировки {self.block_threshold * 1000:.0f} мс)")
+
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self.heartbeat = now
+                self._observe(max(0.0, now - expected))
+        finally:
+            self._stopped.set()
+
+    def _observe(self, lag: float):
+        event_loop_lag.observe(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+            event_loop_lag_max.set(lag)
+        if lag >= self.block_threshold:
+            event_loop_blocked.inc()
+            event_loop_blocked_seconds.inc(lag)
+            logger.warning(f"Цикл событий был заблокирован {lag * 1000:.0f} мс")
+
+    def _watchdog(self):
+        """Поток вне цикла событий: снимает стек, пока цикл не отвечает"""
+        sampled_heartbeat = None
+        samples = 0
+        last_stack = None
+
+        while not self._stopped.wait(self.block_threshold / 2):
+            heartbeat = self.heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.block_threshold:
+                continue
+
+            if heartbeat != sampled_heartbeat:
+                # Новая блокировка
+                sampled_heartbeat = heartbeat
+                samples = 0
+                last_stack = None
+            if samples >= self.max_samples:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+            del frame
+            if stack == last_stack:
+                continue
+
+            samples += 1
+            last_stack = stack
+            logger.warning(f"Цикл событий не отвечает {blocked_for * 1000:.0f} мс, стек потока цикла:\n{stack}")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,62 @@
+# functions/message_state.py
+"""
+Последнее отправленное содержимое сообщений бота по (чат, message_id).
+Позволяет не отправлять правки, которые ничего не меняют, и прореживать правки прогресса.
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: Optional[str], reply_markup=None) -> str:
+    """Хэш видимого содержимого сообщения: текст и клавиатура"""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else ""
+    return hashlib.sha1(f"{text}\x00{markup}".encode()).hexdigest()
+
+
+class MessageStateTracker:
+    def __init__(self, progress_interval: float = 2.0, max_entries: int = 10000):
+        self.progress_interval = progress_interval
+        self.max_entries = max_entries
+        # {(chat_id, message_id): (хэш содержимого, время последней правки прогресса)}
+        self._messages: "OrderedDict[Tuple[int, int], Tuple[Optional[str], float]]" = OrderedDict()
+        self.suppressed_edits = 0
+
+    def _set(self, key: Tuple[int, int], digest: Optional[str], progress_at: float):
+        self._messages[key] = (digest, progress_at)
+        self._messages.move_to_end(key)
+        while len(self._messages) > self.max_entries:
+            self._messages.popitem(last=False)
+
+    def is_unchanged(self, chat_id: int, message_id: int, digest: str) -> bool:
+        state = self._messages.get((chat_id, message_id))
+        return state is not None and state[0] == digest
+
+    def remember(self, chat_id: int, message_id: int, digest: Optional[str]):
+        state = self._messages.get((chat_id, message_id))
+        self._set((chat_id, message_id), digest, state[1] if state else 0.0)
+
+    def forget(self, chat_id: int, message_id: int):
+        self._messages.pop((chat_id, message_id), None)
+
+    def progress_due(self, chat_id: int, message_id: int) -> bool:
+        """
+        Пора ли обновить сообщение о прогрессе: не чаще одного раза в progress_interval секунд.
+        Если да - время правки запоминается сразу
+        """
+        key = (chat_id, message_id)
+        state = self._messages.get(key)
+        now = time.monotonic()
+        if state is not None and now - state[1] < self.progress_interval:
+            return False
+        self._set(key, state[0] if state else None, now)
+        return True
+
+
+# Общий трекер на процесс
+message_state_tracker = MessageStateTracker(progress_interval=float(os.getenv("PROGRESS_EDIT_INTERVAL", "2")))
@@ -0,0 +1,288 @@
+# functions/metrics.py
+"""
+Метрики процесса в текстовом формате Prometheus, без внешних зависимостей.
+Значения обновляются в общих путях кода: клиентские сессии WB (TraceConfig), лимитер WB,
+паузы и повторы запросов, очередь отправки в Telegram, построение отчетов и планировщики.
+Отдаются HTTP-эндпоинтом из functions/metrics_server.py.
+Ограничители запросов WB (предохранитель магазинов, дедлайн отчета) - в functions/wb_client.py.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from database.account_registry import account_registry
+from database.instrumentation import LATENCY_BUCKETS, LatencyHistogram, pool_checkout_wait, statement_latency
+from functions.tracing import finish_span, start_span
+from functions.wb_endpoints import WB_ENDPOINT_GROUPS
+from storage.yesterday_statistics_storage import auto_report_data, user_data_store
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин в секундах: ответы WB и построение отчетов намного дольше запросов к БД
+WB_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+REPORT_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in list(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Значение задается кодом (set) или вычисляется при каждом чтении (function)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        values = dict(self._values)
+        if self.function is not None:
+            try:
+                values.update(self.function())
+            except Exception as e:
+                logger.warning(f"Метрика {self.name} не вычислена: {e}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values.items()]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS,
+                 children: Optional[Dict[Tuple[str, ...], LatencyHistogram]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Готовые гистограммы (например, из database/instrumentation.py) можно передать как есть
+        self._children: Dict[Tuple[str, ...], LatencyHistogram] = dict(children or {})
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        child = self._children.get(key)
+        if child is None:
+            child = LatencyHistogram(self.buckets)
+            self._children[key] = child
+        child.observe(seconds)
+
+    def time(self, **labels) -> _Timer:
+        """Контекстный менеджер: длительность блока попадает в гистограмму (в том числе при ошибке)"""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            snapshot = child.snapshot()
+            for bound, count in snapshot["buckets"]:
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(snapshot['sum'])}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS, children=None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets, children))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр на процесс
+registry = MetricsRegistry()
+
+wb_requests = registry.counter(
+    "wb_requests_total", "Запросы к WB API по группе эндпоинтов, магазину и статусу ответа",
+    ("group", "account", "status"))
+wb_request_duration = registry.histogram(
+    "wb_request_duration_seconds", "Время до ответа WB API по группе эндпоинтов и магазину",
+    ("group", "account"), WB_BUCKETS)
+sleep_seconds = registry.counter(
+    "sleep_seconds_total", "Время в паузах: лимиты, ожидание после 429, повторы после ошибок, паузы между запросами",
+    ("reason",))
+
+telegram_requests = registry.counter(
+    "telegram_requests_total", "Отправка и правка сообщений в Telegram по методу и результату (ok, retry_after, error)",
+    ("method", "result"))
+telegram_request_duration = registry.histogram(
+    "telegram_request_duration_seconds", "Время запроса к Telegram на отправку или правку сообщения", ("method",))
+
+report_run_duration = registry.histogram(
+    "report_run_duration_seconds", "Время построения отчета по всем магазинам", ("report",), REPORT_BUCKETS)
+report_store_duration = registry.histogram(
+    "report_store_duration_seconds", "Время построения отчета по одному магазину", ("report",), REPORT_BUCKETS)
+report_store_errors = registry.counter(
+    "report_store_errors_total", "Магазины, отчет по которым не построен из-за ошибки", ("report",))
+
+update_duration = registry.histogram(
+    "update_duration_seconds", "Время обработки обновления Telegram по обработчику", ("handler",), WB_BUCKETS)
+
+# Задержка цикла событий: сколько корутина ждала запуска сверх запланированного времени
+LOOP_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+event_loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "Задержка запуска задач в цикле событий (измеряется монитором цикла)", (),
+    LOOP_LAG_BUCKETS)
+event_loop_lag_max = registry.gauge(
+    "event_loop_lag_max_seconds", "Максимальная задержка цикла событий с момента запуска процесса")
+event_loop_blocked = registry.counter(
+    "event_loop_blocked_total", "Блокировки цикла событий дольше порога LOOP_BLOCK_THRESHOLD_MS")
+event_loop_blocked_seconds = registry.counter(
+    "event_loop_blocked_seconds_total", "Суммарное время блокировок цикла событий дольше порога")
+
+scheduler_last_success = registry.gauge(
+    "scheduler_last_success_timestamp_seconds", "Время последнего успешного прохода планировщика (unix)",
+    ("scheduler",))
+
+registry.gauge(
+    "yesterday_storage_entries", "Пользователи с сохраненным отчетом за вчера в памяти процесса", ("storage",),
+    function=lambda: {("user_data",): len(user_data_store), ("auto_report",): len(auto_report_data)})
+registry.histogram(
+    "db_statement_duration_seconds", "Время выполнения SQL-запросов по типу запроса", ("kind",),
+    children={(kind,): histogram for kind, histogram in statement_latency.items()})
+registry.histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание свободного соединения из пула", children={(): pool_checkout_wait})
+
+
+def mark_scheduler_success(scheduler: str):
+    scheduler_last_success.set(time.time(), scheduler=scheduler)
+
+
+async def tracked_sleep(seconds: float, reason: str):
+    """asyncio.sleep, время которого учитывается в sleep_seconds_total"""
+    started = time.monotonic()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sleep_seconds.inc(time.monotonic() - started, reason=reason)
+
+
+async def account_label(api_key: Optional[str]) -> str:
+    """ID магазина по токену из кэша магазинов (сам токен в метки не попадает)"""
+    account = await account_registry.find_by_api_key(api_key.removeprefix("Bearer ")) if api_key else None
+    return str(account.id) if account else "unknown"
+
+
+async def _observe_wb_request(trace_ctx, url, headers, status: str):
+    # Запрос к WB в трассе обновления, если он выполняется при обработке кнопки
+    finish_span(getattr(trace_ctx, "span", None), None if status.startswith("2") else status)
+    group = WB_ENDPOINT_GROUPS.get(url.path, "other")
+    account = await account_label(headers.get("Authorization"))
+    wb_requests.inc(group=group, account=account, status=status)
+    started = getattr(trace_ctx, "started", None)
+    if started is not None:
+        wb_request_duration.observe(time.perf_counter() - started, group=group, account=account)
+
+
+async def _on_wb_request_start(session, trace_ctx, params):
+    trace_ctx.started = time.perf_counter()
+    trace_ctx.span = start_span("wb", WB_ENDPOINT_GROUPS.get(params.url.path, params.url.path))
+
+
+async def _on_wb_request_end(session, trace_ctx, params):
+    await _observe_wb_request(trace_ctx, params.url, params.headers, str(params.response.status))
+
+
+async def _on_wb_request_exception(session, trace_ctx, params):
+    await _observe_wb_request(trace_ctx, params.url, params.headers, "error")
+
+
+# Метрики запросов клиентов WB API (подключается вместе с ограничителями: functions/wb_client.wb_trace_configs)
+wb_trace_config = aiohttp.TraceConfig()
+wb_trace_config.on_request_start.append(_on_wb_request_start)
+wb_trace_config.on_request_end.append(_on_wb_request_end)
+wb_trace_config.on_request_exception.append(_on_wb_request_exception)
@@ -0,0 +1,47 @@
+# functions/metrics_server.py
+"""
+HTTP-эндпоинт /metrics для Prometheus (отдельный aiohttp-сервер, работает и в режиме polling).
+Метрики собираются в functions/metrics.py, здесь добавляется только состояние пула соединений БД.
+Эндпоинт без авторизации и с метками магазинов, поэтому по умолчанию слушает только localhost;
+METRICS_HOST=0.0.0.0 - только за закрытой сетью или прокси с авторизацией.
+"""
+import logging
+import os
+
+from aiohttp import web
+
+from database.engine import engine
+from database.instrumentation import get_pool_status
+from functions.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry.gauge(
+    "db_pool_connections", "Соединения пула БД по состоянию (size, checked_out, overflow, checked_in)", ("state",),
+    function=lambda: {(state,): value for state, value in get_pool_status(engine.sync_engine).items()})
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def run_metrics_server() -> web.AppRunner:
+    """Запустить сервер метрик в фоне, возвращает runner для остановки"""
+    host = os.getenv("METRICS_HOST", "127.0.0.1")
+    port = int(os.getenv("METRICS_PORT", "9100"))
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Метрики доступны на {host}:{port}/metrics")
+    return runner
@@ -0,0 +1,296 @@
+# functions/orders_sales_sync.py
+"""
+Инкрементальная синхронизация заказов и продаж в таблицы orders и sales.
+Запросы идут с flag=0 от максимального сохраненного lastChangeDate, поэтому каждый проход
+скачивает только изменения. Строки на границе страниц повторяются и отсекаются upsert'ом.
+Статистика за сегодня/вчера/период считается SQL-агрегатами по сохраненным строкам.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from database.account_manager import AccountManager
+from database.models import Order, Sale
+from database.orders_sales_manager import OrdersSalesManager
+from functions.current_statistics import CurrentStatistics
+from functions.metrics import mark_scheduler_success
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.wb_endpoints import STATISTICS_API_URL
+from functions.wb_rate_limiter import wb_rate_limiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+# Максимум строк в одном ответе orders/sales: меньше - значит это последняя страница
+MAX_PAGE_ROWS = 80000
+
+
+def orders_sync_enabled() -> bool:
+    return os.getenv("ORDERS_SYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        # Даты orders/sales приходят по Москве, храним как есть без таймзоны
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _truncate(value, length: int) -> Optional[str]:
+    return str(value)[:length] if value else None
+
+
+def convert_order(seller_account_id: int, item: Dict) -> Optional[Dict]:
+    """Преобразовать строку ответа /orders в строку таблицы orders"""
+    order_date = _parse_datetime(item.get("date"))
+    last_change_date = _parse_datetime(item.get("lastChangeDate"))
+    if not item.get("srid") or not order_date or not last_change_date:
+        return None
+
+    cancel_date = _parse_datetime(item.get("cancelDate"))
+    return {
+        "seller_account_id": seller_account_id,
+        "srid": _truncate(item.get("srid"), 100),
+        "g_number": _truncate(item.get("gNumber"), 100),
+        "order_date": order_date,
+        "last_change_date": last_change_date,
+        "nm_id": item.get("nmId") or None,
+        "supplier_article": _truncate(item.get("supplierArticle"), 100),
+        "warehouse_name": _truncate(item.get("warehouseName"), 100),
+        "region_name": _truncate(item.get("regionName"), 100),
+        "quantity": int(item.get("quantity", 1) or 1),
+        "total_price": float(item.get("totalPrice") or 0),
+        "discount_percent": int(item.get("discountPercent") or 0),
+        "price_with_disc": float(item.get("priceWithDisc") or 0),
+        "finished_price": float(item.get("finishedPrice") or 0),
+        "is_cancel": bool(item.get("isCancel", False)),
+        # WB отдает 0001-01-01 для неотмененных заказов
+        "cancel_date": cancel_date if cancel_date and cancel_date.year > 1 else None,
+    }
+
+
+def convert_sale(seller_account_id: int, item: Dict) -> Optional[Dict]:
+    """Преобразовать строку ответа /sales в строку таблицы sales"""
+    sale_date = _parse_datetime(item.get("date"))
+    last_change_date = _parse_datetime(item.get("lastChangeDate"))
+    if not item.get("srid") or not item.get("saleID") or not sale_date or not last_change_date:
+        return None
+
+    return {
+        "seller_account_id": seller_account_id,
+        "srid": _truncate(item.get("srid"), 100),
+        "sale_id": _truncate(item.get("saleID"), 50),
+        "sale_date": sale_date,
+        "last_change_date": last_change_date,
+        "nm_id": item.get("nmId") or None,
+        "supplier_article": _truncate(item.get("supplierArticle"), 100),
+        "warehouse_name": _truncate(item.get("warehouseName"), 100),
+        "region_name": _truncate(item.get("regionName"), 100),
+        "quantity": int(item.get("quantity", 1) or 1),
+        "total_price": float(item.get("totalPrice") or 0),
+        "price_with_disc": float(item.get("priceWithDisc") or 0),
+        "finished_price": float(item.get("finishedPrice") or 0),
+        "for_pay": float(item.get("forPay") or 0),
+        "is_realization": bool(item.get("isRealization", True)),
+    }
+
+
+# Для каждого вида данных: эндпоинт, модель, преобразование, ключ строки и поле состояния синхронизации
+SYNC_KINDS = {
+    "orders": ("/api/v1/supplier/orders", Order, convert_order, ("srid",), "orders_synced_at"),
+    "sales": ("/api/v1/supplier/sales", Sale, convert_sale, ("srid", "sale_id"), "sales_synced_at"),
+}
+
+
+class OrdersSalesSync:
+    def __init__(self, api_key: str, priority: int = PRIORITY_BACKGROUND, horizon_days: int = None,
+                 max_retries: int = 5):
+        self.api_key = api_key
+        self.base_url = STATISTICS_API_URL
+        self.headers = {
+            "Authorization": api_key,
+            "Content-Type": "application/json"
+        }
+        self.priority = priority
+        # Глубина первой загрузки магазина (WB хранит заказы и продажи 90 дней)
+        self.horizon_days = horizon_days or int(os.getenv("ORDERS_SYNC_DAYS", "30"))
+        self.max_retries = max_retries
+
+    async def _fetch_page(self, http: aiohttp.ClientSession, path: str, group: str,
+                          date_from: datetime) -> List[Dict]:
+        """Запросить все строки с lastChangeDate >= date_from (до MAX_PAGE_ROWS)"""
+        params = {"dateFrom": date_from.strftime("%Y-%m-%dT%H:%M:%S"), "flag": 0}
+
+        for attempt in range(self.max_retries):
+            await wb_rate_limiter.acquire(self.api_key, group, self.priority)
+
+            try:
+                async with http.get(f"{self.base_url}{path}", headers=self.headers,
+                                    params=params, timeout=120) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data if isinstance(data, list) else []
+
+                    if response.status == 401:
+                        raise ValueError("Неверный API ключ")
+
+                    if response.status == 429:
+                        retry_after = float(response.headers.get("X-Ratelimit-Retry")
+                                            or response.headers.get("Retry-After") or 60)
+                        wb_rate_limiter.penalize(self.api_key, group, retry_after)
+                        continue
+
+                    logger.warning(f"Синхронизация {group}: ошибка API {response.status} (попытка {attempt + 1})")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Синхронизация {group}: ошибка подключения (попытка {attempt + 1}): {e}")
+
+            await wb_sleep(30 * (attempt + 1), "wb_retry")
+
+        raise ValueError("Не удалось получить данные после всех попыток")
+
+    async def sync(self, session_maker, seller_account_id: int, kind: str) -> int:
+        """
+        Догрузить изменения заказов или продаж с последнего сохраненного lastChangeDate.
+        Возвращает количество записанных строк.
+        """
+        path, model, convert, key_fields, synced_field = SYNC_KINDS[kind]
+
+        async with session_maker() as session:
+            date_from = await OrdersSalesManager(session).get_last_change_date(model, seller_account_id)
+        if date_from is None:
+            date_from = datetime.combine(datetime.now().date() - timedelta(days=self.horizon_days),
+                                         datetime.min.time())
+
+        total_rows = 0
+
+        async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as http:
+            while True:
+                data = await self._fetch_page(http, path, kind, date_from)
+                page_size = len(data)
+
+                # Одна строка может прийти дважды (граница страниц) - оставляем самую свежую версию
+                unique_rows = {}
+                for item in data:
+                    row = convert(seller_account_id, item)
+                    if row is None:
+                        continue
+                    key = tuple(row[field] for field in key_fields)
+                    current = unique_rows.get(key)
+                    if current is None or current["last_change_date"] <= row["last_change_date"]:
+                        unique_rows[key] = row
+                del data
+
+                rows = list(unique_rows.values())
+                next_from = max((row["last_change_date"] for row in rows), default=date_from)
+
+                async with session_maker() as session:
+                    manager = OrdersSalesManager(session)
+                    if kind == "orders":
+                        await manager.bulk_upsert_orders(rows)
+                    else:
+                        await manager.bulk_upsert_sales(rows)
+                    await session.commit()
+
+                total_rows += len(rows)
+
+                # Неполная страница - изменений больше нет; без сдвига lastChangeDate продолжать нельзя
+                if page_size < MAX_PAGE_ROWS or next_from <= date_from:
+                    break
+                date_from = next_from
+
+        async with session_maker() as session:
+            await OrdersSalesManager(session).mark_synced(seller_account_id, synced_field)
+            await session.commit()
+
+        logger.info(f"Синхронизация {kind} магазина {seller_account_id}: записано {total_rows} строк")
+        return total_rows
+
+    async def sync_account(self, session_maker, seller_account_id: int):
+        """Синхронизировать заказы и продажи магазина"""
+        await self.sync(session_maker, seller_account_id, "orders")
+        await self.sync(session_maker, seller_account_id, "sales")
+
+
+async def sync_if_stale(session_maker, account, kinds=("orders", "sales")):
+    """Догрузить изменения, если фоновая синхронизация давно не обновляла данные магазина"""
+    max_age = timedelta(seconds=int(os.getenv("ORDERS_SYNC_MAX_AGE", "1200")))
+
+    async with session_maker() as session:
+        state = await OrdersSalesManager(session).get_sync_state(account.id)
+
+    now = datetime.now()
+    sync = OrdersSalesSync(account.api_key, priority=PRIORITY_INTERACTIVE)
+    for kind in kinds:
+        synced_at = getattr(state, SYNC_KINDS[kind][4]) if state else None
+        if not synced_at or now - synced_at > max_age:
+            await sync.sync(session_maker, account.id, kind)
+
+
+async def get_period_stats(session_maker, account, date_from: date, date_to: date) -> Dict[str, Dict]:
+    """
+    Заказы и выкупы магазина за период из БД.
+    Если фоновая синхронизация давно не обновляла данные, сначала догружаем изменения.
+    """
+    await sync_if_stale(session_maker, account)
+
+    async with session_maker() as session:
+        manager = OrdersSalesManager(session)
+        orders_quantity, orders_amount = await manager.get_orders_totals(account.id, date_from, date_to)
+        sales_quantity, sales_amount = await manager.get_sales_totals(account.id, date_from, date_to)
+
+    return {
+        "orders": {"quantity": orders_quantity, "amount": orders_amount},
+        "sales": {"quantity": sales_quantity, "amount": sales_amount}
+    }
+
+
+async def get_today_stats(session_maker, account) -> Dict[str, Dict]:
+    """Статистика за сегодня: из БД, а при выключенной синхронизации - напрямую из API"""
+    if not orders_sync_enabled():
+        return await CurrentStatistics(account.api_key).get_today_stats_for_message()
+
+    today = datetime.now().date()
+    return await get_period_stats(session_maker, account, today, today)
+
+
+class OrdersSalesSyncWorker:
+    def __init__(self, session_maker, interval: int = None):
+        self.session_maker = session_maker
+        self.interval = interval or int(os.getenv("ORDERS_SYNC_INTERVAL", "600"))
+
+    async def run_once(self):
+        """Один проход синхронизации по всем магазинам (магазины параллельно, у каждого свой бюджет)"""
+        async with self.session_maker() as session:
+            accounts = await AccountManager(session).get_all_accounts()
+
+        results = await asyncio.gather(
+            *(OrdersSalesSync(account.api_key).sync_account(self.session_maker, account.id)
+              for account in accounts),
+            return_exceptions=True
+        )
+
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                account_name = account.account_name or f"Магазин {account.id}"
+                logger.error(f"[{account_name}] Ошибка синхронизации заказов и продаж: {result}")
+
+        mark_scheduler_success("orders_sales_sync")
+
+    async def start_worker(self):
+        """Запустить фоновую синхронизацию"""
+        logger.info(f"Синхронизация заказов и продаж запущена (интервал {self.interval} сек.)")
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации заказов и продаж: {e}")
+
+            await asyncio.sleep(self.interval)
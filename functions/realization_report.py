@@ -0,0 +1,211 @@
+# functions/realization_report.py
+"""
+Асинхронная загрузка отчета о реализации (/api/v5/supplier/reportDetailByPeriod).
+Страницы запрашиваются по rrdid и сразу пишутся в БД, в памяти держится только одна страница.
+Последний rrd_id сохраняется вместе со страницей, поэтому прерванная загрузка продолжается с того же места.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from database.realization_manager import RealizationManager
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.wb_endpoints import STATISTICS_API_URL
+from functions.wb_rate_limiter import wb_rate_limiter, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Денежные поля строки отчета, которые сохраняем в БД
+MONEY_FIELDS = (
+    "retail_price_withdisc_rub", "retail_amount", "ppvz_for_pay", "ppvz_sales_commission",
+    "ppvz_vw", "ppvz_vw_nds", "acquiring_fee", "delivery_rub", "storage_fee", "penalty",
+    "deduction", "acceptance", "additional_payment",
+)
+
+
+def _parse_date(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        # WB отдает время с таймзоной, в БД храним без нее
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _truncate(value, length: int) -> Optional[str]:
+    return str(value)[:length] if value else None
+
+
+class RealizationReportLoader:
+    def __init__(self, api_key: str, page_limit: int = None, priority: int = PRIORITY_BACKGROUND,
+                 max_retries: int = 5):
+        self.api_key = api_key
+        self.base_url = STATISTICS_API_URL
+        self.headers = {
+            "Authorization": api_key,
+            "Content-Type": "application/json"
+        }
+        # Размер страницы ограничивает память: одна страница в памяти в каждый момент времени
+        self.page_limit = page_limit or int(os.getenv("REALIZATION_PAGE_LIMIT", "20000"))
+        # Через столько дней после конца периода пустой отчет считается окончательным (продаж не было)
+        self.empty_grace_days = int(os.getenv("REALIZATION_EMPTY_GRACE_DAYS", "3"))
+        self.priority = priority
+        self.max_retries = max_retries
+
+    @staticmethod
+    def convert_row(seller_account_id: int, item: Dict) -> Dict:
+        """Преобразовать строку ответа WB в строку таблицы realization_report_rows"""
+        row = {
+            "seller_account_id": seller_account_id,
+            "rrd_id": int(item.get("rrd_id") or 0),
+            "realizationreport_id": item.get("realizationreport_id"),
+            "report_date_from": _parse_date(item.get("date_from")),
+            "report_date_to": _parse_date(item.get("date_to")),
+            "rr_dt": _parse_date(item.get("rr_dt")),
+            "sale_dt": _parse_datetime(item.get("sale_dt")),
+            "nm_id": item.get("nm_id") or None,
+            "sa_name": _truncate(item.get("sa_name"), 100),
+            "subject_name": _truncate(item.get("subject_name"), 150),
+            "brand_name": _truncate(item.get("brand_name"), 150),
+            "doc_type_name": _truncate(item.get("doc_type_name"), 50),
+            "supplier_oper_name": _truncate(item.get("supplier_oper_name"), 100),
+            "srid": _truncate(item.get("srid"), 100),
+            "quantity": int(item.get("quantity") or 0),
+            "delivery_amount": int(item.get("delivery_amount") or 0),
+            "return_amount": int(item.get("return_amount") or 0),
+        }
+        for field in MONEY_FIELDS:
+            row[field] = float(item.get(field) or 0)
+        return row
+
+    async def _fetch_page(self, http: aiohttp.ClientSession, params: Dict) -> List[Dict]:
+        """Запросить одну страницу отчета с учетом лимитов токена"""
+        url = f"{self.base_url}/api/v5/supplier/reportDetailByPeriod"
+
+        for attempt in range(self.max_retries):
+            await wb_rate_limiter.acquire(self.api_key, "realization", self.priority)
+
+            try:
+                async with http.get(url, headers=self.headers, params=params, timeout=300) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data if isinstance(data, list) else []
+
+                    if response.status == 204:
+                        return []
+
+                    if response.status == 401:
+                        raise ValueError("Неверный API ключ")
+
+                    if response.status == 429:
+                        retry_after = float(response.headers.get("X-Ratelimit-Retry")
+                                            or response.headers.get("Retry-After") or 60)
+                        wb_rate_limiter.penalize(self.api_key, "realization", retry_after)
+                        continue
+
+                    logger.warning(f"Отчет о реализации: ошибка API {response.status} (попытка {attempt + 1})")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Отчет о реализации: ошибка подключения (попытка {attempt + 1}): {e}")
+
+            await wb_sleep(30 * (attempt + 1), "wb_retry")
+
+        raise ValueError("Не удалось получить данные после всех попыток")
+
+    async def ingest_period(
+            self,
+            session_maker,
+            seller_account_id: int,
+            date_from: date,
+            date_to: date,
+            period: str = "weekly"
+    ) -> int:
+        """
+        Загрузить отчет за период в БД без ограничения на число строк.
+        Возвращает количество строк, записанных за этот запуск.
+        """
+        async with session_maker() as session:
+            state = await RealizationManager(session).get_sync_state(
+                seller_account_id, date_from, date_to, period
+            )
+
+        if state and state.completed:
+            logger.info(f"Отчет о реализации {date_from} - {date_to} уже загружен ({state.rows_loaded} строк)")
+            return 0
+
+        rrdid = state.last_rrd_id if state else 0
+        total_rows = 0
+        page = 1
+
+        logger.info(f"Загрузка отчета о реализации {date_from} - {date_to}, начиная с rrdid={rrdid}")
+
+        async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as http:
+            while True:
+                params = {
+                    "dateFrom": date_from.isoformat(),
+                    "dateTo": date_to.isoformat(),
+                    "limit": self.page_limit,
+                    "rrdid": rrdid,
+                    "period": period
+                }
+                data = await self._fetch_page(http, params)
+
+                # Конец отчета определяется по размеру страницы WB, а не по числу сохраненных строк:
+                # строки без rrd_id отбрасываются, но занимают место на странице
+                page_size = len(data)
+                rows = [self.convert_row(seller_account_id, item) for item in data if item.get("rrd_id")]
+                del data
+
+                last_rrd_id = max((row["rrd_id"] for row in rows), default=rrdid)
+                has_more = page_size == self.page_limit and last_rrd_id != rrdid
+                loaded_before = state.rows_loaded if state else 0
+                if loaded_before + total_rows + page_size > 0:
+                    completed = not has_more
+                else:
+                    # Пустой отчет сразу после конца периода означает, что WB его еще не сформировал;
+                    # позже - что продаж за период не было, и повторно его не запрашиваем
+                    completed = date.today() >= date_to + timedelta(days=self.empty_grace_days)
+
+                # Страница и прогресс записываются в одной транзакции
+                async with session_maker() as session:
+                    manager = RealizationManager(session)
+                    await manager.bulk_insert_rows(rows)
+                    await manager.save_sync_state(seller_account_id, date_from, date_to, period,
+                                                  last_rrd_id=last_rrd_id, rows_added=len(rows),
+                                                  completed=completed)
+                    await session.commit()
+
+                total_rows += len(rows)
+                logger.info(f"Отчет о реализации: страница {page}, строк {len(rows)}, всего {total_rows}")
+
+                if not has_more:
+                    break
+
+                rrdid = last_rrd_id
+                page += 1
+
+        logger.info(f"Отчет о реализации {date_from} - {date_to} загружен: {total_rows} строк")
+        return total_rows
+
+    async def is_period_loaded(self, session_maker, seller_account_id: int, date_from: date, date_to: date,
+                               period: str = "weekly") -> bool:
+        """Загружен ли отчет за период полностью"""
+        async with session_maker() as session:
+            state = await RealizationManager(session).get_sync_state(
+                seller_account_id, date_from, date_to, period
+            )
+        return bool(state and state.completed)
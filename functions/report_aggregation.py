@@ -0,0 +1,168 @@
+# functions/report_aggregation.py
+"""
+Чистые функции агрегации данных WB для отчетов: на вход - строки ответов API, на выход - компактный
+снимок магазина. Выполняются в пуле процессов (functions/compute_pool.py), поэтому модуль
+не импортирует ничего, кроме стандартной библиотеки, а аргументы и результаты - простые словари и списки.
+Строки воронки сжимаются в кортежи при получении каждой страницы: так их дешевле передавать в пул.
+"""
+import json
+from typing import Dict, List, Tuple
+
+# Сколько товаров показывать в отчете (остальные только сохраняются в БД)
+TOP_PRODUCTS = 50
+
+# Примерный размер строки /api/v1/supplier/sales в JSON - для оценки объема страницы по размеру ответа
+SALES_ROW_BYTES = 900
+
+# Строка воронки: nm_id, vendor_code, title, brand, category, views, carts, orders, order_sum
+FunnelRow = Tuple[int, str, str, str, str, int, int, int, float]
+
+
+def empty_funnel_snapshot(date_str: str) -> Dict:
+    return {
+        "date": date_str,
+        "total_products": 0,
+        "total_views": 0,
+        "total_carts": 0,
+        "total_orders": 0,
+        "total_order_sum": 0.0,
+        "active_products": 0,
+        "products_with_sales": 0,
+        "products": [],
+        "all_products": []
+    }
+
+
+def compact_funnel_rows(products: List[Dict]) -> List[FunnelRow]:
+    """Нужные для отчета поля из страницы ответа воронки продаж (sales-funnel/products)"""
+    rows = []
+    for item in products:
+        product = item.get("product", {})
+        statistic = item.get("statistic", {}).get("selected", {})
+        title = product.get("title", "")
+        rows.append((
+            product.get("nmId"),
+            product.get("vendorCode", ""),
+            title[:100] if title else "",
+            product.get("brandName", ""),
+            product.get("subjectName", ""),
+            statistic.get("openCount", 0),
+            statistic.get("cartCount", 0),
+            statistic.get("orderCount", 0),
+            statistic.get("orderSum", 0),
+        ))
+    return rows
+
+
+def aggregate_funnel_products(all_data: List[FunnelRow], date_str: str) -> Dict:
+    """Статистика по товарам за день из сжатых строк воронки продаж"""
+    if not all_data:
+        return empty_funnel_snapshot(date_str)
+
+    product_stats = {}
+    total_views = 0
+    total_carts = 0
+    total_orders = 0
+    total_order_sum = 0.0
+    active_products = 0
+    products_with_sales = 0
+
+    for nm_id, vendor_code, title, brand, category, views, carts, orders, order_sum in all_data:
+        if views > 0 or carts > 0 or orders > 0:
+            active_products += 1
+        if orders > 0:
+            products_with_sales += 1
+
+        # Используем vendorCode или nmId как ключ
+        article = vendor_code if vendor_code else str(nm_id)
+
+        stats = product_stats.get(article)
+        if stats is None:
+            stats = product_stats[article] = {
+                'nm_id': nm_id,
+                'vendor_code': vendor_code,
+                'title': title,
+                'brand': brand,
+                'category': category,
+                'views': 0,
+                'carts': 0,
+                'orders': 0,
+                'order_sum': 0.0,
+                'conversion_to_cart': 0.0,
+                'conversion_to_order': 0.0
+            }
+
+        stats['views'] += views
+        stats['carts'] += carts
+        stats['orders'] += orders
+        stats['order_sum'] += order_sum
+
+        if views > 0:
+            stats['conversion_to_cart'] = (carts / views) * 100
+        if carts > 0:
+            stats['conversion_to_order'] = (orders / carts) * 100
+
+        total_views += views
+        total_carts += carts
+        total_orders += orders
+        total_order_sum += order_sum
+
+    # Товары с заказами, по сумме заказов
+    sorted_products = sorted(
+        ((article, stats) for article, stats in product_stats.items() if stats['order_sum'] != 0),
+        key=lambda x: x[1]['order_sum'],
+        reverse=True
+    )
+    formatted_products = [{
+        'article': article,
+        'nm_id': stats['nm_id'],
+        'title': stats['title'],
+        'brand': stats['brand'],
+        'category': stats['category'],
+        'views': stats['views'],
+        'carts': stats['carts'],
+        'orders': stats['orders'],
+        'order_sum': stats['order_sum'],
+        'conversion_to_cart': stats['conversion_to_cart'],
+        'conversion_to_order': stats['conversion_to_order']
+    } for article, stats in sorted_products]
+
+    return {
+        "date": date_str,
+        "total_products": len(all_data),
+        "total_articles": len(product_stats),
+        "total_views": total_views,
+        "total_carts": total_carts,
+        "total_orders": total_orders,
+        "total_order_sum": total_order_sum,
+        "active_products": active_products,
+        "products_with_sales": products_with_sales,
+        "products": formatted_products[:TOP_PRODUCTS],
+        "all_products": formatted_products,
+        "overall_cart_conversion": (total_carts / total_views * 100) if total_views > 0 else 0,
+        "overall_order_conversion": (total_orders / total_carts * 100) if total_carts > 0 else 0
+    }
+
+
+def summarize_sales_page(body: bytes) -> Dict:
+    """Разбор страницы /api/v1/supplier/sales: число строк, выкупы и lastChangeDate для следующей страницы"""
+    sales = json.loads(body) or []
+    quantity_total = 0
+    amount_total = 0.0
+    buyout_records = 0
+
+    for sale in sales:
+        # isRealization = True означает выкуп товара
+        if sale.get("isRealization", True):
+            buyout_records += 1
+            quantity = sale.get("quantity", 1)
+            quantity_total += quantity
+            amount_total += float(sale.get("priceWithDisc", 0)) * quantity
+
+    return {
+        "records": len(sales),
+        "last_change_date": sales[-1].get("lastChangeDate", "") if sales else "",
+        "buyout_records": buyout_records,
+        "total_buyouts_quantity": quantity_total,
+        "total_buyouts_amount": amount_total,
+    }
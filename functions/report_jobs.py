@@ -0,0 +1,496 @@
+# functions/report_jobs.py
+"""
+Построение отчета за вчера по магазинам вне процесса бота.
+Бот ставит задания в очередь report_jobs и ждет уведомления о выполнении (LISTEN report_jobs_done),
+процессы worker.py забирают задания, обходят WB API, сохраняют товары и записывают снимок магазина.
+Без очереди (REPORT_QUEUE_ENABLED=false) те же снимки строятся прямо в процессе бота.
+У отчета есть общий бюджет времени и бюджет на магазин (functions/deadline.py): магазины, которые
+не успели, попадают в отчет с отметкой timed_out. Отчет можно отменить кнопкой под сообщением о загрузке.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import time
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.account_manager import AccountManager
+from database.product_manager import ProductManager
+from database.report_job_manager import DONE_JOBS_CHANNEL, NEW_JOBS_CHANNEL, STATUS_FAILED, ReportJobManager
+from functions.account_health import account_health
+from functions.deadline import Deadline, DeadlineExceeded, deadline_scope
+from functions.metrics import report_store_duration, report_store_errors
+from functions.wb_client import wb_sleep
+from functions.yesterday_product_statistics import YesterdayProductStatistics
+
+logger = logging.getLogger(__name__)
+
+JOB_YESTERDAY_STORE = "yesterday_store"
+
+# Вызывается по мере выполнения: (готово магазинов, всего магазинов)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class ReportCancelled(Exception):
+    """Отчет отменен пользователем"""
+
+
+def report_budget(auto_report: bool = False) -> Deadline:
+    """Бюджет времени на весь отчет: ручной запрос - REPORT_BUDGET, автоотчет - AUTO_REPORT_BUDGET"""
+    if auto_report:
+        return Deadline(float(os.getenv("AUTO_REPORT_BUDGET", "3600")))
+    return Deadline(float(os.getenv("REPORT_BUDGET", "900")))
+
+
+def store_budget() -> float:
+    return float(os.getenv("REPORT_STORE_BUDGET", "300"))
+
+
+def report_queue_enabled() -> bool:
+    return os.getenv("REPORT_QUEUE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def _asyncpg_dsn() -> str:
+    return make_url(os.getenv('DB_URL')).set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+def store_error_data(account_name: str, error_message: str) -> Dict:
+    """Снимок магазина, отчет по которому не построен"""
+    if "Неверный API ключ" in error_message:
+        display_error = "Неверный API ключ"
+    elif "Превышен лимит запросов" in error_message:
+        display_error = "Превышен лимит запросов API"
+    elif "Таймаут запроса" in error_message:
+        display_error = "Таймаут запроса"
+    else:
+        display_error = "Ошибка подключения к API"
+
+    return {
+        "account_name": account_name,
+        "error": True,
+        "error_message": error_message,
+        "display_error": display_error
+    }
+
+
+def timed_out_store_data(account_name: str, error_message: str) -> Dict:
+    """Снимок магазина, который не успел построиться до дедлайна"""
+    store_data = store_error_data(account_name, error_message)
+    store_data["timed_out"] = True
+    return store_data
+
+
+async def build_store_with_budget(session: AsyncSession, account, deadline: Deadline) -> Dict:
+    """
+    Снимок магазина в пределах бюджета: запросы и паузы ограничены дедлайном, выполняющийся запрос
+    отменяется по его истечении. Если часть данных не успела загрузиться, снимок помечается timed_out.
+    """
+    account_name = account.account_name or f"Магазин {account.id}"
+    try:
+        async with asyncio.timeout(deadline.remaining()):
+            with deadline_scope(deadline):
+                store_data = await build_yesterday_store_data(session, account)
+    except (TimeoutError, DeadlineExceeded):
+        logger.warning(f"[{account_name}] Время на магазин истекло")
+        return timed_out_store_data(account_name, "Таймаут запроса: время на магазин истекло")
+
+    if deadline.exceeded:
+        # Часть запросов прервана дедлайном: показываем то, что успели получить
+        store_data["timed_out"] = True
+    return store_data
+
+
+def is_successful_store(store_data: Dict) -> bool:
+    """Магазин считается успешным, если за день есть заказы или выкупы"""
+    if store_data.get("error", False):
+        return False
+    return (store_data.get("funnel_stats", {}).get("total_orders", 0) > 0 or
+            store_data.get("recommended_stats", {}).get("total_buyouts", 0) > 0)
+
+
+async def build_yesterday_store_data(session: AsyncSession, account) -> Dict:
+    """
+    Статистика магазина за вчера для отображения (без названий товаров - их подставляет бот).
+    Товары из статистики сохраняются в БД. Ошибка получения основной статистики поднимается дальше.
+    """
+    account_name = account.account_name or f"Магазин {account.id}"
+
+    # Магазин с отклоненным ключом или недоступный после серии ошибок сразу отмечается ошибкой
+    await account_health.check(account.id, account.api_key)
+
+    # Получаем комбинированную статистику для текущего магазина
+    yesterday_stats = YesterdayProductStatistics(account.api_key)
+    combined_stats = await yesterday_stats.get_combined_yesterday_stats()
+
+    funnel_stats = combined_stats.get("funnel_stats", {})
+    sales_stats = combined_stats.get("sales_stats", {})
+    recommended_stats = combined_stats.get("recommended_stats", {})
+
+    logger.info(f"[{account_name}] Товаров: {funnel_stats.get('total_products', 0)}")
+    logger.info(f"[{account_name}] Заказов: {funnel_stats.get('total_orders', 0)}")
+    logger.info(
+        f"[{account_name}] Выкупов: {recommended_stats.get('total_buyouts', 0)} шт. на {recommended_stats.get('total_buyout_sum', 0):.2f} руб.")
+
+    # Получаем детальные данные по товарам
+    try:
+        stats_obj = YesterdayProductStatistics(account.api_key)
+        detailed_stats = await stats_obj.get_yesterday_product_stats()
+
+        # Сохраняем товары в БД одной пачкой
+        product_manager = ProductManager(session)
+        try:
+            saved_products_count = await product_manager.bulk_upsert_products(
+                account.id, detailed_stats.get("all_products", [])
+            )
+            logger.info(f"[{account_name}] Сохранено товаров: {saved_products_count}")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении товаров: {e}")
+
+    except Exception as e:
+        logger.error(f"[{account_name}] Ошибка при получении детальных данных: {e}")
+        detailed_stats = {}
+
+    # Товары с активностью
+    products_with_activity = []
+    try:
+        # Товары с заказами (топ), если их нет - все товары
+        products_with_orders = detailed_stats.get("products", []) or detailed_stats.get("all_products", [])
+        products_with_activity = [p for p in products_with_orders if
+                                  p.get('orders', 0) > 0 or p.get('buyouts', 0) > 0]
+
+        # СОРТИРУЕМ ТОВАРЫ ПО КОЛИЧЕСТВУ ЗАКАЗОВ (от большего к меньшему)
+        products_with_activity.sort(key=lambda x: x.get('orders', 0), reverse=True)
+
+    except Exception as e:
+        logger.error(f"[{account_name}] Ошибка при получении товаров с активностью: {e}")
+        products_with_activity = []
+
+    # Полная детальная статистика в снимок не входит: при отображении она не используется
+    return {
+        "account_name": account_name,
+        "account_id": account.id,
+        "products_with_activity": products_with_activity,
+        "funnel_stats": funnel_stats,
+        "sales_stats": sales_stats,
+        "recommended_stats": recommended_stats,
+        "total_views": detailed_stats.get("total_views", 0) if detailed_stats else 0,
+        "total_carts": detailed_stats.get("total_carts", 0) if detailed_stats else 0,
+        "overall_cart_conversion": detailed_stats.get("overall_cart_conversion", 0) if detailed_stats else 0,
+        "overall_order_conversion": detailed_stats.get("overall_order_conversion", 0) if detailed_stats else 0,
+        "has_activity": len(products_with_activity) > 0
+    }
+
+
+class ReportJobEvents:
+    """LISTEN report_jobs_done на отдельном соединении: будит всех, кто ждет выполнения заданий"""
+
+    def __init__(self, retry_interval: float = 10):
+        self.retry_interval = retry_interval
+        self._event = asyncio.Event()
+        self.connected = False
+
+    def _on_notify(self, connection, pid, channel, payload):
+        # Каждый ожидающий сам проверит свои задания в БД
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def start_listener(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(_asyncpg_dsn())
+                await connection.add_listener(DONE_JOBS_CHANNEL, self._on_notify)
+                self.connected = True
+                logger.info("Подписка на выполнение заданий отчетов активна")
+
+                while not connection.is_closed():
+                    await asyncio.sleep(self.retry_interval)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Подписка на выполнение заданий отчетов прервана: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(self.retry_interval)
+
+
+# Общая подписка на процесс бота
+report_job_events = ReportJobEvents()
+
+
+async def queue_yesterday_stores(session_maker, accounts, on_progress: Optional[ProgressCallback] = None,
+                                 timeout: float = None) -> List[Dict]:
+    """
+    Поставить задания по магазинам и дождаться снимков (в порядке accounts).
+    Магазины, по которым задание не выполнено за timeout секунд, возвращаются с отметкой timed_out.
+    При отмене ожидания еще не начатые задания снимаются с очереди, если их не ждут другие отчеты.
+    """
+    timeout = timeout if timeout is not None else float(os.getenv("REPORT_JOB_TIMEOUT", "1800"))
+    # Без подписки на уведомления (соединение потеряно) статус проверяется чаще
+    poll_interval = float(os.getenv("REPORT_JOB_POLL_INTERVAL", "30"))
+    report_date = date.today() - timedelta(days=1)
+
+    async with session_maker() as session:
+        job_ids = await ReportJobManager(session).enqueue(
+            JOB_YESTERDAY_STORE, [account.id for account in accounts], report_date,
+            reuse_seconds=int(os.getenv("REPORT_JOB_REUSE_SECONDS", "600"))
+        )
+
+    deadline = time.monotonic() + timeout
+    finished = 0
+    try:
+        while True:
+            async with session_maker() as session:
+                done = await ReportJobManager(session).count_finished(job_ids)
+
+            if done != finished:
+                finished = done
+                if on_progress is not None:
+                    await on_progress(finished, len(job_ids))
+            if finished >= len(set(job_ids)) or time.monotonic() >= deadline:
+                break
+
+            wait_time = poll_interval if report_job_events.connected else min(poll_interval, 5)
+            await report_job_events.wait(min(wait_time, max(0.0, deadline - time.monotonic())))
+
+    except asyncio.CancelledError:
+        # Задания, которые еще не взяты в работу и которых не ждут другие отчеты, больше никому не нужны
+        async with session_maker() as session:
+            cancelled = await ReportJobManager(session).release(JOB_YESTERDAY_STORE, job_ids, cancel=True)
+        logger.info(f"Отчет отменен, снято с очереди заданий: {cancelled}")
+        raise
+
+    async with session_maker() as session:
+        await ReportJobManager(session).release(JOB_YESTERDAY_STORE, job_ids)
+
+    async with session_maker() as session:
+        jobs = await ReportJobManager(session).get_jobs(job_ids)
+
+    stores = []
+    for account, job_id in zip(accounts, job_ids):
+        account_name = account.account_name or f"Магазин {account.id}"
+        job = jobs.get(job_id)
+        if job is not None and job.result is not None:
+            stores.append(job.result)
+        elif job is not None and job.status == STATUS_FAILED:
+            stores.append(store_error_data(account_name, job.error or "Неизвестная ошибка"))
+        else:
+            stores.append(timed_out_store_data(account_name, "Таймаут запроса: задание не выполнено вовремя"))
+    return stores
+
+
+async def collect_yesterday_stores(session_maker, accounts, report: str, deadline: Deadline,
+                                   on_progress: Optional[ProgressCallback] = None) -> List[Dict]:
+    """
+    Снимки магазинов за вчера (в порядке accounts): через очередь заданий, если она включена,
+    иначе обходом магазинов в текущем процессе. Магазины, не успевшие до дедлайна, помечаются timed_out.
+    """
+    if report_queue_enabled():
+        return await queue_yesterday_stores(session_maker, accounts, on_progress, timeout=deadline.remaining())
+
+    stores = []
+    async with session_maker() as session:
+        for account_index, account in enumerate(accounts, 1):
+            account_name = account.account_name or f"Магазин {account.id}"
+            if deadline.expired:
+                stores.append(timed_out_store_data(account_name, "Таймаут запроса: время на отчет истекло"))
+                continue
+
+            logger.info(f"[{account_index}/{len(accounts)}] Обрабатываю магазин: {account_name}")
+            if on_progress is not None:
+                await on_progress(account_index - 1, len(accounts))
+            store_started = time.perf_counter()
+
+            try:
+                stores.append(await build_store_with_budget(session, account, deadline.child(store_budget())))
+            except Exception as e:
+                logger.error(f"[{account_name}] Ошибка при получении статистики: {e}")
+                report_store_errors.inc(report=report)
+                stores.append(store_error_data(account_name, str(e)))
+
+            report_store_duration.observe(time.perf_counter() - store_started, report=report)
+
+            # Задержка между запросами к разным магазинам
+            if account_index < len(accounts) and deadline.remaining() > 5:
+                await wb_sleep(5, "wb_pacing")
+
+    return stores
+
+
+async def add_custom_names(session: AsyncSession, stores: List[Dict]):
+    """Названия товаров (общий кэш процесса, в отчете хранится ссылка)"""
+    product_manager = ProductManager(session)
+    for store_data in stores:
+        if not store_data.get("error", False):
+            store_data["custom_names"] = await product_manager.get_custom_names_dict(store_data["account_id"])
+
+
+# Ссылки на фоновые отчеты, чтобы задачи не собрал сборщик мусора
+_report_tasks = set()
+
+# Выполняющиеся обходы магазинов, которые можно отменить кнопкой: ключ - "chat_id:message_id"
+_cancellable_reports: Dict[str, asyncio.Task] = {}
+
+
+async def run_cancellable(key: str, coro):
+    """
+    Выполнить обход магазинов с возможностью отмены через cancel_report(key).
+    Отмена прерывает выполняющиеся запросы и паузы; поднимается ReportCancelled.
+    """
+    task = asyncio.create_task(coro)
+    _cancellable_reports[key] = task
+    try:
+        await asyncio.wait({task})
+    finally:
+        _cancellable_reports.pop(key, None)
+        # Если отменили того, кто ждет, обход тоже останавливается
+        task.cancel()
+
+    if task.cancelled():
+        raise ReportCancelled()
+    return task.result()
+
+
+def cancel_report(key: str) -> bool:
+    """Отменить обход магазинов. False - отчет уже завершен"""
+    task = _cancellable_reports.get(key)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    return True
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """
+    Построить отчет вне обработчика обновления: обработчик сразу освобождается,
+    трассировка обновления (functions/tracing.py) на фоновую задачу не распространяется
+    """
+    task = asyncio.create_task(coro, context=contextvars.Context())
+    _report_tasks.add(task)
+    task.add_done_callback(_report_tasks.discard)
+    return task
+
+
+class ReportWorker:
+    """Процесс-исполнитель заданий (worker.py): несколько заданий параллельно, новые - по NOTIFY"""
+
+    def __init__(self, session_maker, concurrency: int = None, poll_interval: float = None):
+        self.session_maker = session_maker
+        self.concurrency = concurrency or int(os.getenv("REPORT_WORKER_CONCURRENCY", "4"))
+        self.poll_interval = poll_interval or float(os.getenv("REPORT_WORKER_POLL_INTERVAL", "30"))
+        self.job_timeout = int(os.getenv("REPORT_JOB_TIMEOUT", "1800"))
+        self.max_attempts = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", "3"))
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._new_jobs = asyncio.Event()
+
+    def _on_new_jobs(self, connection, pid, channel, payload):
+        self._new_jobs.set()
+
+    async def run_job(self, job) -> None:
+        """Выполнить задание и записать результат (ошибка магазина - тоже результат)"""
+        started = time.perf_counter()
+        result, error = None, None
+
+        async with self.session_maker() as session:
+            account = await AccountManager(session).get_account_by_id(job.seller_account_id)
+            if account is None:
+                error = "Магазин удален"
+            elif job.kind == JOB_YESTERDAY_STORE:
+                try:
+                    result = await build_store_with_budget(session, account, Deadline(store_budget()))
+                except Exception as e:
+                    logger.error(f"[{account.account_name or account.id}] Ошибка задания {job.id}: {e}")
+                    report_store_errors.inc(report="yesterday_job")
+                    result = store_error_data(account.account_name or f"Магазин {account.id}", str(e))
+            else:
+                error = f"Неизвестный тип задания: {job.kind}"
+
+        report_store_duration.observe(time.perf_counter() - started, report="yesterday_job")
+
+        async with self.session_maker() as session:
+            finished = await ReportJobManager(session).finish(job.id, self.name, result=result, error=error)
+        if not finished:
+            logger.warning(f"Задание {job.id} вернулось в очередь и выполняется другим процессом, результат отброшен")
+            return
+        logger.info(f"Задание {job.id} ({job.kind}, магазин {job.seller_account_id}) выполнено "
+                    f"за {time.perf_counter() - started:.1f} сек.")
+
+    async def _claim(self):
+        async with self.session_maker() as session:
+            return await ReportJobManager(session).claim(self.name)
+
+    async def _run_slot(self):
+        while True:
+            job = await self._claim()
+            if job is None:
+                self._new_jobs.clear()
+                try:
+                    await asyncio.wait_for(self._new_jobs.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Задание останется running и вернется в очередь через requeue_stale
+                logger.error(f"Не удалось выполнить задание {job.id}: {e}")
+
+    async def _maintenance(self):
+        """Возврат зависших заданий в очередь и удаление старых"""
+        while True:
+            try:
+                async with self.session_maker() as session:
+                    manager = ReportJobManager(session)
+                    requeued = await manager.requeue_stale(self.job_timeout, self.max_attempts)
+                    if requeued:
+                        logger.warning(f"Возвращено в очередь зависших заданий: {requeued}")
+                    await manager.delete_finished_before(int(os.getenv("REPORT_JOB_RETENTION_DAYS", "7")))
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания очереди заданий: {e}")
+            await asyncio.sleep(self.job_timeout / 4)
+
+    async def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(_asyncpg_dsn())
+                await connection.add_listener(NEW_JOBS_CHANNEL, self._on_new_jobs)
+                # Пока соединения не было, уведомления могли потеряться
+                self._new_jobs.set()
+                while not connection.is_closed():
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Подписка на новые задания прервана: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.poll_interval)
+
+    async def start_worker(self):
+        logger.info(f"Исполнитель заданий {self.name} запущен (параллельно {self.concurrency})")
+        await asyncio.gather(
+            self._listen(),
+            self._maintenance(),
+            *(self._run_slot() for _ in range(self.concurrency)),
+        )
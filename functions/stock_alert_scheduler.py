@@ -0,0 +1,122 @@
+# functions/stock_alert_scheduler.py
+import asyncio
+import logging
+from datetime import datetime
+from typing import List
+
+import pytz
+from aiogram import Bot
+from aiogram.types import ChatMemberAdministrator, ChatMemberOwner
+
+from database.account_manager import AccountManager
+from functions.metrics import mark_scheduler_success
+from functions.orders_sales_sync import orders_sync_enabled
+from functions.stock_forecast import get_store_cover
+
+logger = logging.getLogger(__name__)
+
+
+class StockAlertScheduler:
+    def __init__(self, bot: Bot, session_maker, admin_chat_id: int):
+        self.bot = bot
+        self.session_maker = session_maker
+        self.admin_chat_id = admin_chat_id
+        # Устанавливаем московскую временную зону
+        self.moscow_tz = pytz.timezone('Europe/Moscow')
+
+    async def get_admin_users_from_chat(self):
+        """Получить список администраторов и владельца группы"""
+        admin_users = []
+
+        try:
+            chat_admins = await self.bot.get_chat_administrators(self.admin_chat_id)
+            for admin in chat_admins:
+                if isinstance(admin, (ChatMemberAdministrator, ChatMemberOwner)) and not admin.user.is_bot:
+                    admin_users.append(admin.user)
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка администраторов для оповещения об остатках: {e}")
+
+        return admin_users
+
+    async def get_low_stock_messages(self) -> List[str]:
+        """
+        Сформировать оповещение по магазинам, где есть заканчивающиеся артикулы, разбитое на сообщения
+        в пределах ограничения Telegram. Пустой список - оповещать не о чем
+        """
+        from handlers.stock_handlers import format_store_cover, get_low_stock_days, pack_messages
+
+        if not orders_sync_enabled():
+            # Без продаж запас в днях не посчитать: оповещение ничего бы не показало
+            logger.warning("Оповещение об остатках пропущено: синхронизация продаж отключена (ORDERS_SYNC_ENABLED)")
+            return []
+
+        threshold = get_low_stock_days()
+
+        async with self.session_maker() as session:
+            all_accounts = await AccountManager(session).get_all_accounts()
+
+        header = f"<b>⚠️ Заканчиваются остатки</b>\n<i>Запас меньше {threshold:g} дн.</i>\n\n"
+        blocks = []
+
+        for account in all_accounts:
+            account_name = account.account_name or f"Магазин {account.id}"
+
+            try:
+                _, items = await get_store_cover(self.session_maker, account)
+            except Exception as e:
+                logger.error(f"[{account_name}] Ошибка при расчете запаса для оповещения: {e}")
+                continue
+
+            if any(item["days_of_cover"] < threshold for item in items):
+                blocks.append(format_store_cover(account_name, items, threshold))
+
+        return pack_messages(header, blocks) if blocks else []
+
+    async def send_low_stock_alert(self):
+        """Разослать оповещение о заканчивающихся остатках администраторам"""
+        messages = await self.get_low_stock_messages()
+
+        if not messages:
+            logger.info("Заканчивающихся остатков нет, оповещение не отправляется")
+            mark_scheduler_success("stock_alert")
+            return
+
+        admin_users = await self.get_admin_users_from_chat()
+
+        async def send_to_admin(admin):
+            try:
+                for text in messages:
+                    await self.bot.send_message(admin.id, text)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке оповещения об остатках {admin.first_name} (ID: {admin.id}): {e}")
+
+        await asyncio.gather(*(send_to_admin(admin) for admin in admin_users))
+
+        logger.info(f"Оповещение об остатках отправлено {len(admin_users)} администраторам")
+        mark_scheduler_success("stock_alert")
+
+    def get_moscow_time(self):
+        """Получить текущее московское время"""
+        return datetime.now(self.moscow_tz)
+
+    async def start_scheduler(self):
+        """Запустить ежедневное оповещение о заканчивающихся остатках"""
+        logger.info("Планировщик оповещений об остатках запущен")
+
+        # Отправка в 11:00 по Москве
+        target_hour = 11
+        target_minute = 0
+
+        while True:
+            now = self.get_moscow_time()
+
+            if now.hour == target_hour and now.minute == target_minute:
+                try:
+                    await self.send_low_stock_alert()
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке оповещения об остатках: {e}")
+
+                # Ждем 61 секунду чтобы не запустить повторно
+                await asyncio.sleep(61)
+
+            await asyncio.sleep(30)
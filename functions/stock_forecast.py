@@ -0,0 +1,230 @@
+# functions/stock_forecast.py
+"""
+Снимки остатков по складам и прогноз запаса в днях.
+Остатки /api/v1/supplier/stocks сворачиваются до строки на артикул и склад и пишутся одним upsert'ом.
+Запас в днях = остаток / средние продажи в день за последние 30 дней (строки таблицы sales),
+расчет векторный по всем артикулам магазина сразу.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from database.account_manager import AccountManager
+from database.orders_sales_manager import OrdersSalesManager
+from database.stock_manager import StockManager
+from functions.orders_sales_sync import orders_sync_enabled, sync_if_stale
+from functions.metrics import mark_scheduler_success
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.wb_endpoints import STATISTICS_API_URL
+from functions.wb_rate_limiter import wb_rate_limiter, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+STOCK_COLUMNS = ["nm_id", "article", "warehouse_name", "quantity", "in_way_to_client"]
+SOLD_COLUMNS = ["nm_id", "sold_article", "sold"]
+
+
+def get_velocity_days() -> int:
+    return int(os.getenv("STOCK_VELOCITY_DAYS", "30"))
+
+
+def compute_days_of_cover(stock_rows: List[tuple], sold_rows: List[tuple], window_days: int) -> List[Dict]:
+    """
+    Рассчитать запас в днях по артикулам.
+
+    stock_rows - строки снимка по складам, sold_rows - выкупы по артикулам за window_days дней.
+    Артикулы с продажами, но без остатков, попадают в результат с нулевым запасом.
+    Результат отсортирован по запасу в днях (сначала заканчивающиеся).
+    """
+    stocks = pd.DataFrame(stock_rows, columns=STOCK_COLUMNS)
+    sold = pd.DataFrame(sold_rows, columns=SOLD_COLUMNS)
+
+    if stocks.empty and sold.empty:
+        return []
+
+    stocks["has_stock"] = stocks["quantity"] > 0
+    by_article = stocks.groupby("nm_id", sort=False).agg(
+        article=("article", "max"),
+        quantity=("quantity", "sum"),
+        in_way_to_client=("in_way_to_client", "sum"),
+        warehouses=("has_stock", "sum"),
+    )
+    frame = by_article.join(sold.set_index("nm_id"), how="outer").reset_index()
+
+    frame["article"] = frame["article"].fillna(frame["sold_article"]).fillna("")
+    for column in ("quantity", "in_way_to_client", "warehouses", "sold"):
+        frame[column] = pd.to_numeric(frame[column]).fillna(0).astype(int)
+
+    quantity = frame["quantity"].to_numpy(dtype=float)
+    velocity = frame["sold"].to_numpy(dtype=float) / window_days
+    # Без продаж за период запас бесконечный
+    days_of_cover = np.divide(quantity, velocity, out=np.full_like(quantity, np.inf), where=velocity > 0)
+
+    frame["velocity"] = np.round(velocity, 2)
+    frame["days_of_cover"] = np.round(days_of_cover, 1)
+    frame = frame.drop(columns="sold_article").sort_values(["days_of_cover", "sold"], ascending=[True, False])
+
+    records = frame.to_dict("records")
+    for record in records:
+        record["nm_id"] = int(record["nm_id"])
+    return records
+
+
+class StockSnapshotLoader:
+    def __init__(self, api_key: str, priority: int = PRIORITY_BACKGROUND, max_retries: int = 5):
+        self.api_key = api_key
+        self.base_url = STATISTICS_API_URL
+        self.headers = {
+            "Authorization": api_key,
+            "Content-Type": "application/json"
+        }
+        self.priority = priority
+        self.max_retries = max_retries
+
+    async def _fetch_stocks(self) -> List[Dict]:
+        """Все текущие остатки магазина (строка на баркод и склад)"""
+        url = f"{self.base_url}/api/v1/supplier/stocks"
+        # Старая дата - получаем полный остаток, а не только изменившиеся строки
+        params = {"dateFrom": "2019-06-20"}
+
+        async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as http:
+            for attempt in range(self.max_retries):
+                await wb_rate_limiter.acquire(self.api_key, "stocks", self.priority)
+
+                try:
+                    async with http.get(url, headers=self.headers, params=params, timeout=120) as response:
+                        if response.status == 200:
+                            data = await response.json()
+                            return data if isinstance(data, list) else []
+
+                        if response.status == 401:
+                            raise ValueError("Неверный API ключ")
+
+                        if response.status == 429:
+                            retry_after = float(response.headers.get("X-Ratelimit-Retry")
+                                                or response.headers.get("Retry-After") or 60)
+                            wb_rate_limiter.penalize(self.api_key, "stocks", retry_after)
+                            continue
+
+                        logger.warning(f"Остатки: ошибка API {response.status} (попытка {attempt + 1})")
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Остатки: ошибка подключения (попытка {attempt + 1}): {e}")
+
+                await wb_sleep(30 * (attempt + 1), "wb_retry")
+
+        raise ValueError("Не удалось получить данные после всех попыток")
+
+    @staticmethod
+    def convert_stocks(seller_account_id: int, snapshot_date: date, items: List[Dict]) -> List[Dict]:
+        """Свернуть строки по баркодам до строки на артикул и склад"""
+        rows = {}
+        for item in items:
+            nm_id = item.get("nmId")
+            if not nm_id:
+                continue
+            warehouse_name = str(item.get("warehouseName") or "")[:100]
+            key = (int(nm_id), warehouse_name)
+
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "seller_account_id": seller_account_id,
+                    "snapshot_date": snapshot_date,
+                    "nm_id": int(nm_id),
+                    "supplier_article": None,
+                    "warehouse_name": warehouse_name,
+                    "quantity": 0,
+                    "in_way_to_client": 0,
+                    "in_way_from_client": 0,
+                }
+            if row["supplier_article"] is None and item.get("supplierArticle"):
+                row["supplier_article"] = str(item["supplierArticle"])[:100]
+            row["quantity"] += int(item.get("quantity") or 0)
+            row["in_way_to_client"] += int(item.get("inWayToClient") or 0)
+            row["in_way_from_client"] += int(item.get("inWayFromClient") or 0)
+
+        return list(rows.values())
+
+    async def take_snapshot(self, session_maker, seller_account_id: int) -> int:
+        """Сохранить снимок остатков магазина за сегодня. Возвращает число строк снимка"""
+        items = await self._fetch_stocks()
+        rows = self.convert_stocks(seller_account_id, datetime.now().date(), items)
+        del items
+
+        async with session_maker() as session:
+            await StockManager(session).bulk_upsert_snapshot(rows)
+            await session.commit()
+
+        logger.info(f"Снимок остатков магазина {seller_account_id}: {len(rows)} строк")
+        return len(rows)
+
+
+async def get_store_cover(session_maker, account, priority: int = PRIORITY_BACKGROUND) -> Tuple[date, List[Dict]]:
+    """
+    Запас в днях по артикулам магазина на последний снимок.
+    Если сегодня снимка еще не было, он делается перед расчетом.
+    """
+    today = datetime.now().date()
+    window_days = get_velocity_days()
+
+    async with session_maker() as session:
+        snapshot_date = await StockManager(session).get_latest_snapshot_date(account.id)
+
+    if snapshot_date != today:
+        await StockSnapshotLoader(account.api_key, priority=priority).take_snapshot(session_maker, account.id)
+        snapshot_date = today
+
+    if orders_sync_enabled():
+        await sync_if_stale(session_maker, account, kinds=("sales",))
+
+    async with session_maker() as session:
+        stock_rows = await StockManager(session).get_snapshot(account.id, snapshot_date)
+        # Скорость продаж по полным дням, без текущего
+        sold_rows = await OrdersSalesManager(session).get_sold_by_article(
+            account.id, today - timedelta(days=window_days), today - timedelta(days=1)
+        )
+
+    return snapshot_date, compute_days_of_cover(stock_rows, sold_rows, window_days)
+
+
+class StockSnapshotWorker:
+    def __init__(self, session_maker, interval: int = None):
+        self.session_maker = session_maker
+        self.interval = interval or int(os.getenv("STOCK_SNAPSHOT_INTERVAL", "10800"))
+
+    async def run_once(self):
+        """Снимок остатков всех магазинов (магазины параллельно, у каждого свой бюджет)"""
+        async with self.session_maker() as session:
+            accounts = await AccountManager(session).get_all_accounts()
+
+        results = await asyncio.gather(
+            *(StockSnapshotLoader(account.api_key).take_snapshot(self.session_maker, account.id)
+              for account in accounts),
+            return_exceptions=True
+        )
+
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                account_name = account.account_name or f"Магазин {account.id}"
+                logger.error(f"[{account_name}] Ошибка снимка остатков: {result}")
+
+        mark_scheduler_success("stock_snapshot")
+
+    async def start_worker(self):
+        """Запустить периодические снимки остатков"""
+        logger.info(f"Снимки остатков запущены (интервал {self.interval} сек.)")
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка снимков остатков: {e}")
+
+            await asyncio.sleep(self.interval)
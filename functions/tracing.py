@@ -0,0 +1,222 @@
+# functions/tracing.py
+"""
+Трассировка обработки обновлений: время от получения обновления до ответа с разбивкой
+на запросы к WB API, SQL-запросы и вызовы Telegram API.
+Трасса обновления хранится в contextvar и доступна во всех корутинах обработчика,
+самые медленные обновления сохраняются в кольцевом буфере (команда /slow, JSON-дамп).
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SPAN_KINDS = ("wb", "db", "telegram")
+
+
+class Span:
+    __slots__ = ("kind", "name", "offset", "duration", "error")
+
+    def __init__(self, kind: str, name: str, offset: float):
+        self.kind = kind
+        self.name = name
+        # Начало относительно начала обновления, секунды
+        self.offset = offset
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "offset_ms": round(self.offset * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "error": self.error,
+        }
+
+
+class UpdateTrace:
+    """Трасса одного обновления: обработчик, общее время и вложенные операции"""
+
+    def __init__(self, update_id: Optional[int], update_type: str, user_id: Optional[int], max_spans: int):
+        self.update_id = update_id
+        self.update_type = update_type
+        self.user_id = user_id
+        self.handler: Optional[str] = None
+        self.received_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.spans: List[Span] = []
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        # Итоги по типам операций считаются всегда, даже если отдельные спаны отброшены
+        self.totals: Dict[str, List[float]] = {kind: [0, 0.0] for kind in SPAN_KINDS}
+
+    @property
+    def finished(self) -> bool:
+        return self.duration is not None
+
+    def start_span(self, kind: str, name: str) -> Optional[Span]:
+        if self.finished:
+            # Фоновая задача, запущенная обработчиком, пережила обновление
+            return None
+        span = Span(kind, name, time.perf_counter() - self.started)
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+        return span
+
+    def finish_span(self, span: Span, error: Optional[str] = None):
+        span.duration = time.perf_counter() - self.started - span.offset
+        span.error = error
+        totals = self.totals.setdefault(span.kind, [0, 0.0])
+        totals[0] += 1
+        totals[1] += span.duration
+
+    def finish(self, error: Optional[str] = None):
+        self.duration = time.perf_counter() - self.started
+        self.error = error
+
+    def to_dict(self) -> Dict:
+        return {
+            "update_id": self.update_id,
+            "update_type": self.update_type,
+            "user_id": self.user_id,
+            "handler": self.handler,
+            "received_at": self.received_at.isoformat(timespec="seconds"),
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "error": self.error,
+            "totals": {kind: {"count": count, "duration_ms": round(total * 1000, 1)}
+                       for kind, (count, total) in self.totals.items()},
+            "dropped_spans": self.dropped_spans,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+current_trace: contextvars.ContextVar[Optional[UpdateTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_span(kind: str, name: str) -> Optional[Span]:
+    """Начать операцию в трассе текущего обновления (None, если обновления нет)"""
+    trace = current_trace.get()
+    return trace.start_span(kind, name) if trace is not None else None
+
+
+def finish_span(span: Optional[Span], error: Optional[str] = None):
+    trace = current_trace.get()
+    if span is not None and trace is not None:
+        trace.finish_span(span, error)
+
+
+@contextmanager
+def trace_span(kind: str, name: str):
+    span = start_span(kind, name)
+    try:
+        yield span
+    except BaseException as e:
+        finish_span(span, type(e).__name__)
+        raise
+    finish_span(span)
+
+
+class SlowUpdateLog:
+    """Кольцевой буфер медленных обновлений и сводка по обработчикам"""
+
+    def __init__(self, threshold_seconds: float = None, size: int = None):
+        self.threshold = threshold_seconds if threshold_seconds is not None else \
+            float(os.getenv("TRACE_SLOW_UPDATE_MS", "1000")) / 1000
+        self.traces: Deque[UpdateTrace] = deque(maxlen=size or int(os.getenv("TRACE_BUFFER_SIZE", "50")))
+        # Обработчик -> [обновлений, суммарное время, максимальное время]
+        self.handlers: Dict[str, List[float]] = {}
+
+    def record(self, trace: UpdateTrace):
+        stats = self.handlers.setdefault(trace.handler or "unhandled", [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += trace.duration
+        stats[2] = max(stats[2], trace.duration)
+
+        if trace.duration >= self.threshold:
+            self.traces.append(trace)
+            logger.warning(f"Медленное обновление {trace.update_id} ({trace.handler}): "
+                           f"{trace.duration * 1000:.0f} мс, {self._totals_text(trace)}")
+
+    def slowest(self, limit: int = 10) -> List[UpdateTrace]:
+        return sorted(self.traces, key=lambda trace: trace.duration, reverse=True)[:limit]
+
+    def clear(self):
+        self.traces.clear()
+        self.handlers.clear()
+
+    @staticmethod
+    def _totals_text(trace: UpdateTrace) -> str:
+        return ", ".join(f"{kind} {count} за {total * 1000:.0f} мс" for kind, (count, total) in trace.totals.items())
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "threshold_ms": self.threshold * 1000,
+            "handlers": {name: {"count": count, "total_ms": round(total * 1000, 1), "max_ms": round(peak * 1000, 1)}
+                         for name, (count, total, peak) in self.handlers.items()},
+            "slowest": [trace.to_dict() for trace in self.slowest(len(self.traces))],
+        }, ensure_ascii=False, indent=2)
+
+    def summary_text(self, limit: int = 10) -> str:
+        """Текст для администратора: самые медленные обновления и самые затратные обработчики"""
+        if not self.handlers:
+            return "Обновлений еще не было"
+
+        lines = [f"<b>🐢 Медленные обновления</b> (порог {self.threshold * 1000:.0f} мс)\n"]
+        slowest = self.slowest(limit)
+        if not slowest:
+            lines.append("Медленных обновлений нет")
+        for trace in slowest:
+            lines.append(f"• {trace.received_at:%d.%m %H:%M:%S} <code>{trace.handler or 'unhandled'}</code> "
+                         f"{trace.duration * 1000:.0f} мс{' ❌' if trace.error else ''}\n"
+                         f"  {self._totals_text(trace)}")
+
+        lines.append("\n<b>Обработчики по суммарному времени</b>")
+        by_total = sorted(self.handlers.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        for name, (count, total, peak) in by_total:
+            lines.append(f"• <code>{name}</code>: {count} шт., среднее {total / count * 1000:.0f} мс, "
+                         f"макс. {peak * 1000:.0f} мс")
+        return "\n".join(lines)
+
+
+# Общий буфер на процесс
+slow_updates = SlowUpdateLog()
+
+
+def install_db_tracing(engine: Engine):
+    """SQL-запросы попадают в трассу текущего обновления (engine.sync_engine для async)"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Стек нужен и для соединений вне обновлений, чтобы after_cursor_execute снимал свою метку
+    conn.info.setdefault("trace_spans", []).append(start_span("db", statement.lstrip()[:80]))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        finish_span(spans.pop())
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("trace_spans"):
+        finish_span(conn.info["trace_spans"].pop(), type(exception_context.original_exception).__name__)
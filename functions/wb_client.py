@@ -0,0 +1,60 @@
+# functions/wb_client.py
+"""
+Ограничители клиентских сессий WB API, отдельно от метрик:
+- дедлайн отчета (functions/deadline.py): запросы и паузы, которые не успеют до дедлайна, не начинаются;
+- предохранитель магазинов (functions/account_health.py): запросы к магазину с отклоненным ключом
+  или недоступному после серии ошибок не отправляются, результаты запросов учитываются.
+Клиенты передают в aiohttp.ClientSession(trace_configs=wb_trace_configs): сначала ограничители,
+затем метрики, поэтому отклоненный запрос не попадает в метрики запросов.
+"""
+import logging
+
+import aiohttp
+
+from functions.account_health import AccountUnavailableError, account_health
+from functions.deadline import check_deadline
+from functions.metrics import account_label, registry, tracked_sleep, wb_trace_config
+
+logger = logging.getLogger(__name__)
+
+wb_circuit_rejections = registry.counter(
+    "wb_circuit_rejections_total", "Запросы к WB API, не отправленные из-за открытого предохранителя магазина",
+    ("account", "reason"))
+registry.gauge(
+    "wb_account_health_state", "Состояние доступа магазина к WB API: 0 - healthy, 1 - degraded, 2 - open",
+    ("account",), function=account_health.state_values)
+
+
+async def wb_sleep(seconds: float, reason: str):
+    """Пауза перед запросом к WB (лимиты, повторы, паузы между магазинами).
+    Пауза, которая не закончится до дедлайна отчета, не начинается"""
+    check_deadline(seconds)
+    await tracked_sleep(seconds, reason)
+
+
+async def _on_request_start(session, trace_ctx, params):
+    # Запрос после дедлайна отчета не отправляется
+    check_deadline()
+    # Магазин с отклоненным ключом или недоступный после серии ошибок: запрос не отправляется
+    try:
+        await account_health.before_request(params.headers.get("Authorization"))
+    except AccountUnavailableError as e:
+        wb_circuit_rejections.inc(account=await account_label(params.headers.get("Authorization")), reason=e.reason)
+        raise
+
+
+async def _on_request_end(session, trace_ctx, params):
+    await account_health.after_response(params.headers.get("Authorization"), params.response.status)
+
+
+async def _on_request_exception(session, trace_ctx, params):
+    await account_health.after_exception(params.headers.get("Authorization"), params.exception)
+
+
+wb_guard_trace_config = aiohttp.TraceConfig()
+wb_guard_trace_config.on_request_start.append(_on_request_start)
+wb_guard_trace_config.on_request_end.append(_on_request_end)
+wb_guard_trace_config.on_request_exception.append(_on_request_exception)
+
+# Передается в aiohttp.ClientSession(trace_configs=...) всех клиентов WB API
+wb_trace_configs = [wb_guard_trace_config, wb_trace_config]
@@ -0,0 +1,19 @@
+# functions/wb_endpoints.py
+"""
+Базовые адреса WB API. Переопределяются через окружение, например
+для работы с локальным симулятором (benchmarks/wb_simulator.py).
+"""
+import os
+
+STATISTICS_API_URL = os.getenv("WB_STATISTICS_API_URL", "https://statistics-api.wildberries.ru").rstrip("/")
+ANALYTICS_API_URL = os.getenv("WB_ANALYTICS_API_URL", "https://seller-analytics-api.wildberries.ru").rstrip("/")
+
+# Группа лимитов (functions/wb_rate_limiter.py) для каждого пути WB API
+WB_ENDPOINT_GROUPS = {
+    "/api/v1/supplier/orders": "orders",
+    "/api/v1/supplier/sales": "sales",
+    "/api/v1/supplier/stocks": "stocks",
+    "/api/v5/supplier/reportDetailByPeriod": "realization",
+    "/api/analytics/v3/sales-funnel/products": "analytics",
+    "/api/analytics/v3/sales-funnel/products/history": "analytics",
+}
@@ -0,0 +1,120 @@
+# functions/wb_rate_limiter.py
+"""
+Общий бюджет запросов к WB API для каждого токена.
+Интерактивные запросы (кнопки бота) всегда обслуживаются раньше фоновых задач,
+а фоновые задачи не расходят последние токены в корзине.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+from functions.wb_client import wb_sleep
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Лимиты по группам эндпоинтов: (запросов в минуту, размер всплеска)
+WB_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "analytics": (3, 3),  # seller-analytics-api: 3 запроса в минуту, интервал 20 секунд
+    "realization": (1, 1),  # reportDetailByPeriod: 1 запрос в минуту
+    "orders": (1, 1),  # /api/v1/supplier/orders: 1 запрос в минуту
+    "sales": (1, 1),  # /api/v1/supplier/sales: 1 запрос в минуту
+    "stocks": (1, 1),  # /api/v1/supplier/stocks: 1 запрос в минуту
+}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int, background_reserve: int = 1,
+                 sleep_reason: str = "wb_rate_limiter"):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # Сколько токенов фоновые задачи обязаны оставить интерактивным запросам
+        self.background_reserve = max(0, min(background_reserve, burst - 1))
+        self.interactive_waiting = 0
+        # Причина ожидания в метрике sleep_seconds_total
+        self.sleep_reason = sleep_reason
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _try_take(self, priority: int) -> float:
+        """Забрать токен. Возвращает 0, если токен получен, иначе время ожидания в секундах"""
+        self._refill()
+
+        if priority == PRIORITY_INTERACTIVE:
+            required = 1.0
+        else:
+            # Пока есть ожидающие интерактивные запросы - фоновые не получают ничего
+            if self.interactive_waiting > 0:
+                return 1.0 / self.rate
+            required = 1.0 + self.background_reserve
+
+        if self.tokens >= required:
+            self.tokens -= 1.0
+            return 0.0
+
+        return (required - self.tokens) / self.rate
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        is_interactive = priority == PRIORITY_INTERACTIVE
+        if is_interactive:
+            self.interactive_waiting += 1
+        try:
+            while True:
+                wait_time = self._try_take(priority)
+                if wait_time <= 0:
+                    return
+                await wb_sleep(wait_time, self.sleep_reason)
+        finally:
+            if is_interactive:
+                self.interactive_waiting -= 1
+
+    def block_for(self, seconds: float):
+        """Запретить запросы на указанное время (например, после 429 с Retry-After)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class WBRateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, int]] = None):
+        self.limits = limits or WB_RATE_LIMITS
+        self.background_reserve = int(os.getenv("WB_BACKGROUND_RESERVE", "1"))
+        # Множитель лимитов: для работы с локальным симулятором WB (benchmarks/wb_simulator.py)
+        self.rate_scale = float(os.getenv("WB_RATE_LIMIT_SCALE", "1"))
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def _get_bucket(self, api_key: str, group: str) -> TokenBucket:
+        # Ключи храним в виде хэша, чтобы не держать токены в словаре лимитов
+        token_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        key = (token_id, group)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if group not in self.limits:
+                raise ValueError(f"Неизвестная группа лимитов WB API: {group}")
+            rate_per_minute, burst = self.limits[group]
+            bucket = TokenBucket(rate_per_minute * self.rate_scale, burst, self.background_reserve)
+            self._buckets[key] = bucket
+
+        return bucket
+
+    async def acquire(self, api_key: str, group: str, priority: int = PRIORITY_INTERACTIVE):
+        """Дождаться разрешения на запрос к группе эндпоинтов WB для данного токена"""
+        await self._get_bucket(api_key, group).acquire(priority)
+
+    def penalize(self, api_key: str, group: str, seconds: float):
+        """Учесть ответ 429: все запросы этого токена к группе ждут указанное время"""
+        logger.warning(f"WB API ({group}): лимит превышен, пауза {seconds:.0f} сек для токена")
+        self._get_bucket(api_key, group).block_for(seconds)
+
+
+# Общий лимитер на процесс
+wb_rate_limiter = WBRateLimiter()
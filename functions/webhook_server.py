@@ -0,0 +1,127 @@
+# functions/webhook_server.py
+"""
+Режим вебхука: встроенный aiohttp-сервер принимает обновления от Telegram.
+Обновления обрабатываются параллельно в фоне (ответ Telegram отдается сразу),
+при остановке сервер перестает принимать новые обновления и дожидается текущих.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import signal
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def webhook_mode_enabled() -> bool:
+    return os.getenv("BOT_MODE", "polling").lower() == "webhook"
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука с ограничением параллельности и корректным завершением"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str,
+                 max_concurrent_updates: int, drain_timeout: float, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self.drain_timeout = drain_timeout
+        self.draining = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Во время остановки отвечаем ошибкой: Telegram повторит доставку после рестарта
+        if self.draining:
+            return web.Response(text="Shutting down", status=503)
+        return await super().handle(request)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self.semaphore:
+            await super()._background_feed_update(bot, update)
+
+    async def close(self) -> None:
+        """Дождаться обработки принятых обновлений и закрыть сессию бота"""
+        self.draining = True
+        pending = set(self._background_feed_update_tasks)
+
+        if pending:
+            logger.info(f"Завершаю обработку {len(pending)} обновлений...")
+            done, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            if not_done:
+                logger.warning(f"Не дождались {len(not_done)} обновлений за {self.drain_timeout} сек., отменяю")
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
+
+        await super().close()
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates):
+    """Запустить aiohttp-сервер вебхука и работать до SIGTERM/SIGINT"""
+    base_url = os.getenv("WEBHOOK_URL")
+    if not base_url:
+        raise ValueError("WEBHOOK_URL не задан для режима вебхука")
+
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    secret_token = os.getenv("WEBHOOK_SECRET")
+    if not secret_token:
+        # Токен передается Telegram при каждом запуске, поэтому случайный тоже работает
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET не задан, использую случайный секрет")
+
+    app = web.Application()
+    app.router.add_get("/healthz", health)
+
+    # Обработчик регистрируется раньше setup_application: при остановке сначала
+    # дожидаемся текущих обновлений, затем выполняем shutdown диспетчера
+    handler = DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        max_concurrent_updates=int(os.getenv("WEBHOOK_MAX_CONCURRENT_UPDATES", "50")),
+        drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30")),
+    )
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Сервер вебхука слушает {host}:{port}{path}")
+
+    try:
+        # Накопленные за время рестарта обновления не сбрасываем
+        await bot.set_webhook(
+            url=f"{base_url.rstrip('/')}{path}",
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+            drop_pending_updates=False,
+        )
+        logger.info("Вебхук установлен")
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки, завершаю работу вебхука...")
+
+    finally:
+        # Вебхук не удаляем: Telegram копит обновления до следующего запуска
+        await runner.cleanup()
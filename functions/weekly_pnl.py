@@ -0,0 +1,130 @@
+# functions/weekly_pnl.py
+"""
+P&L по артикулам за закрытую неделю на основе сохраненного отчета о реализации.
+Расчет векторный (pandas), результат сохраняется в weekly_article_pnl и больше не пересчитывается.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database.pnl_manager import PnlManager
+from database.realization_manager import RealizationManager
+from functions.realization_report import RealizationReportLoader
+
+logger = logging.getLogger(__name__)
+
+REALIZATION_COLUMNS = [
+    "article", "nm_id", "doc_type_name", "quantity", "retail_amount", "ppvz_for_pay",
+    "delivery_rub", "storage_fee", "penalty", "deduction", "acceptance", "additional_payment",
+]
+
+
+def get_last_closed_week(today: date = None) -> Tuple[date, date]:
+    """Последняя закрытая неделя (понедельник - воскресенье)"""
+    today = today or datetime.now().date()
+    week_start = today - timedelta(days=today.weekday() + 7)
+    return week_start, week_start + timedelta(days=6)
+
+
+def compute_article_pnl(rows: List[tuple]) -> List[Dict]:
+    """
+    Рассчитать P&L по артикулам из строк отчета о реализации.
+
+    Продажи и возвраты различаются по doc_type_name; комиссия WB - разница между
+    розничной суммой и суммой к перечислению. Логистика, хранение, штрафы и прочие
+    удержания вычитаются из суммы к перечислению.
+    """
+    if not rows:
+        return []
+
+    df = pd.DataFrame(rows, columns=REALIZATION_COLUMNS)
+    money = ["retail_amount", "ppvz_for_pay", "delivery_rub", "storage_fee", "penalty",
+             "deduction", "acceptance", "additional_payment"]
+    df[money] = df[money].astype(float)
+    df["article"] = df["article"].fillna("")
+
+    is_sale = (df["doc_type_name"] == "Продажа").to_numpy()
+    is_return = (df["doc_type_name"] == "Возврат").to_numpy()
+    sign = np.where(is_sale, 1.0, np.where(is_return, -1.0, 0.0))
+
+    retail = df["retail_amount"].to_numpy()
+    for_pay = df["ppvz_for_pay"].to_numpy()
+    quantity = df["quantity"].to_numpy()
+
+    frame = pd.DataFrame({
+        "article": df["article"],
+        "nm_id": df["nm_id"],
+        "sold_quantity": np.where(is_sale, quantity, 0),
+        "returned_quantity": np.where(is_return, quantity, 0),
+        "revenue": np.where(is_sale, retail, 0.0),
+        "returns": np.where(is_return, retail, 0.0),
+        "commission": (retail - for_pay) * sign,
+        "logistics": df["delivery_rub"].to_numpy(),
+        "storage": df["storage_fee"].to_numpy(),
+        "penalties": df["penalty"].to_numpy(),
+        "other_deductions": (df["deduction"] + df["acceptance"] - df["additional_payment"]).to_numpy(),
+        "for_pay": for_pay * sign,
+    })
+
+    grouped = frame.groupby("article", sort=False).agg(
+        nm_id=("nm_id", "max"),
+        sold_quantity=("sold_quantity", "sum"),
+        returned_quantity=("returned_quantity", "sum"),
+        revenue=("revenue", "sum"),
+        returns=("returns", "sum"),
+        commission=("commission", "sum"),
+        logistics=("logistics", "sum"),
+        storage=("storage", "sum"),
+        penalties=("penalties", "sum"),
+        other_deductions=("other_deductions", "sum"),
+        for_pay=("for_pay", "sum"),
+    )
+    grouped["payout"] = (grouped["for_pay"] - grouped["logistics"] - grouped["storage"]
+                         - grouped["penalties"] - grouped["other_deductions"])
+    grouped = grouped.drop(columns="for_pay").round(2).reset_index()
+    grouped["nm_id"] = grouped["nm_id"].astype("Int64")
+
+    records = grouped.to_dict("records")
+    for record in records:
+        record["article"] = record["article"][:100]
+        record["nm_id"] = None if pd.isna(record["nm_id"]) else int(record["nm_id"])
+        record["sold_quantity"] = int(record["sold_quantity"])
+        record["returned_quantity"] = int(record["returned_quantity"])
+
+    return records
+
+
+class WeeklyPnlReport:
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def build_week(self, account, week_start: date, week_end: date, priority: int = None) -> bool:
+        """
+        Загрузить отчет о реализации за неделю (если нужно) и сохранить P&L по артикулам.
+        Возвращает True, если расчет за неделю доступен.
+        """
+        async with self.session_maker() as session:
+            if await PnlManager(session).has_week(account.id, week_start):
+                return True
+
+        loader_kwargs = {} if priority is None else {"priority": priority}
+        loader = RealizationReportLoader(account.api_key, **loader_kwargs)
+        await loader.ingest_period(self.session_maker, account.id, week_start, week_end, period="weekly")
+
+        if not await loader.is_period_loaded(self.session_maker, account.id, week_start, week_end):
+            # WB еще не сформировал отчет за неделю
+            return False
+
+        async with self.session_maker() as session:
+            rows = await RealizationManager(session).get_rows_for_pnl(account.id, week_start, week_end)
+            pnl_rows = compute_article_pnl(rows)
+
+            await PnlManager(session).replace_week(account.id, week_start, week_end, pnl_rows)
+            await session.commit()
+
+        logger.info(f"P&L за {week_start} - {week_end} рассчитан для магазина {account.id}: "
+                    f"{len(pnl_rows)} артикулов")
+        return True
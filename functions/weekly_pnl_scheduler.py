@@ -0,0 +1,140 @@
+# functions/weekly_pnl_scheduler.py
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Tuple
+
+import pytz
+from aiogram import Bot
+from aiogram.types import ChatMemberAdministrator, ChatMemberOwner
+
+from database.account_manager import AccountManager
+from database.pnl_manager import PnlManager
+from functions.metrics import mark_scheduler_success
+from functions.weekly_pnl import WeeklyPnlReport, get_last_closed_week
+
+logger = logging.getLogger(__name__)
+
+
+class WeeklyPnlScheduler:
+    def __init__(self, bot: Bot, session_maker, admin_chat_id: int):
+        self.bot = bot
+        self.session_maker = session_maker
+        self.admin_chat_id = admin_chat_id
+        self.report = WeeklyPnlReport(session_maker)
+        # Устанавливаем московскую временную зону
+        self.moscow_tz = pytz.timezone('Europe/Moscow')
+
+    async def get_admin_users_from_chat(self):
+        """Получить список администраторов и владельца группы"""
+        admin_users = []
+
+        try:
+            chat_admins = await self.bot.get_chat_administrators(self.admin_chat_id)
+            for admin in chat_admins:
+                if isinstance(admin, (ChatMemberAdministrator, ChatMemberOwner)) and not admin.user.is_bot:
+                    admin_users.append(admin.user)
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка администраторов для P&L: {e}")
+
+        return admin_users
+
+    async def build_last_week(self, accounts: list) -> Tuple[str, List[int]]:
+        """
+        Загрузить и рассчитать P&L магазинов за последнюю закрытую неделю.
+        Возвращает текст отчета и ID магазинов, вошедших в него (пустой список - ни один отчет не готов)
+        """
+        from handlers.weekly_pnl_handlers import format_store_pnl
+
+        week_start, week_end = get_last_closed_week(self.get_moscow_time().date())
+
+        text = (f"<b>💰 P&L ЗА НЕДЕЛЮ</b>\n"
+                f"📅 {week_start.strftime('%d.%m.%Y')} - {week_end.strftime('%d.%m.%Y')}\n\n")
+        ready_accounts = []
+
+        for account in accounts:
+            account_name = account.account_name or f"Магазин {account.id}"
+
+            try:
+                if not await self.report.build_week(account, week_start, week_end):
+                    logger.info(f"[{account_name}] Отчет о реализации за {week_start} еще не сформирован")
+                    continue
+
+                async with self.session_maker() as session:
+                    totals = await PnlManager(session).get_week_totals(account.id, week_start)
+
+                if totals:
+                    text += format_store_pnl(account_name, totals)
+                    ready_accounts.append(account.id)
+
+            except Exception as e:
+                logger.error(f"[{account_name}] Ошибка при расчете P&L за {week_start}: {e}")
+
+        return text, ready_accounts
+
+    async def send_weekly_report(self):
+        """
+        Подготовить P&L за неделю и разослать администраторам. Каждый магазин отправляется один раз:
+        магазины, отчет о реализации которых будет готов позже, придут следующими рассылками
+        """
+        week_start, _ = get_last_closed_week(self.get_moscow_time().date())
+
+        async with self.session_maker() as session:
+            all_accounts = await AccountManager(session).get_all_accounts()
+            delivered = await PnlManager(session).get_delivered_accounts(week_start)
+
+        pending_accounts = [account for account in all_accounts if account.id not in delivered]
+        if not pending_accounts:
+            return
+
+        text, ready_accounts = await self.build_last_week(pending_accounts)
+        if not ready_accounts:
+            return
+
+        admin_users = await self.get_admin_users_from_chat()
+
+        async def send_to_admin(admin) -> bool:
+            try:
+                await self.bot.send_message(admin.id, text)
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка при отправке P&L пользователю {admin.first_name} (ID: {admin.id}): {e}")
+                return False
+
+        results = await asyncio.gather(*(send_to_admin(admin) for admin in admin_users))
+        if not any(results):
+            # Никому не доставлено - повторим при следующей проверке
+            return
+
+        async with self.session_maker() as session:
+            await PnlManager(session).mark_delivered(ready_accounts, week_start)
+
+        logger.info(f"P&L за неделю с {week_start} ({len(ready_accounts)} магазинов) отправлен "
+                    f"{sum(results)} администраторам")
+        mark_scheduler_success("weekly_pnl")
+
+    def get_moscow_time(self):
+        """Получить текущее московское время"""
+        return datetime.now(self.moscow_tz)
+
+    async def start_scheduler(self):
+        """Запустить ежедневную загрузку отчета о реализации и расчет P&L"""
+        logger.info("Планировщик P&L за неделю запущен")
+
+        # Отчет за неделю WB формирует в понедельник, проверяем каждый день в 10:00 МСК
+        target_hour = 10
+        target_minute = 0
+
+        while True:
+            now = self.get_moscow_time()
+
+            if now.hour == target_hour and now.minute == target_minute:
+                try:
+                    await self.send_weekly_report()
+                except Exception as e:
+                    logger.error(f"Ошибка при подготовке P&L за неделю: {e}")
+
+                # Ждем 61 секунду чтобы не запустить повторно
+                await asyncio.sleep(61)
+
+            await asyncio.sleep(30)
@@ -6,13 +6,22 @@ from typing import List, Dict, Tuple, Optional
 import logging
 from functools import wraps
 
+from functions.account_health import AccountUnavailableError
+from functions.compute_pool import compute_pool
+from functions.deadline import DeadlineExceeded, request_timeout
+from functions.wb_client import wb_sleep, wb_trace_configs
+from functions.report_aggregation import (SALES_ROW_BYTES, aggregate_funnel_products, compact_funnel_rows,
+                                          empty_funnel_snapshot, summarize_sales_page)
+from functions.wb_rate_limiter import wb_rate_limiter
+from functions.wb_endpoints import ANALYTICS_API_URL, STATISTICS_API_URL
+
 logger = logging.getLogger(__name__)
 
 
 class YesterdayProductStatistics:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "https://seller-analytics-api.wildberries.ru"
+        self.base_url = ANALYTICS_API_URL
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -31,13 +40,17 @@ class YesterdayProductStatistics:
                     try:
                         return await func(self, *args, **kwargs)
 
+                    except (AccountUnavailableError, DeadlineExceeded):
+                        # Предохранитель магазина открыт или время отчета истекло: повторы бесполезны
+                        raise
+
                     except asyncio.TimeoutError:
                         logger.warning(f"Таймаут запроса {func.__name__} (попытка {attempt + 1}/{max_retries})")
                         last_error = "Таймаут запроса"
                         if attempt < max_retries - 1:
                             wait_time = initial_delay * (attempt + 1)
                             logger.info(f"Ждем {wait_time} секунд перед повторной попыткой")
-                            await asyncio.sleep(wait_time)
+                            await wb_sleep(wait_time, "wb_retry")
                             continue
                         else:
                             raise ValueError("Таймаут запроса")
@@ -51,13 +64,13 @@ class YesterdayProductStatistics:
                             last_error = "Превышен лимит запросов"
                             wait_time = initial_delay * (attempt + 1)
                             logger.info(f"Ждем {wait_time} секунд перед повторной попыткой")
-                            await asyncio.sleep(wait_time)
+                            await wb_sleep(wait_time, "wb_retry_after")
                             continue
                         else:
                             logger.error(f"Ошибка API: {e.status}")
                             last_error = f"Ошибка сервера: {e.status}"
                             if attempt < max_retries - 1:
-                                await asyncio.sleep(30)
+                                await wb_sleep(30, "wb_retry")
                                 continue
                             else:
                                 raise ValueError(f"Ошибка сервера: {e.status}")
@@ -70,7 +83,7 @@ class YesterdayProductStatistics:
                             f"Неожиданная ошибка при выполнении {func.__name__} (попытка {attempt + 1}): {e}")
                         last_error = "Ошибка подключения"
                         if attempt < max_retries - 1:
-                            await asyncio.sleep(30)
+                            await wb_sleep(30, "wb_retry")
                             continue
                         else:
                             raise ValueError("Ошибка подключения")
@@ -127,12 +140,15 @@ class YesterdayProductStatistics:
         """Выполнить запрос к API воронки продаж"""
         url = f"{self.base_url}/api/analytics/v3/sales-funnel/products"
 
-        async with aiohttp.ClientSession() as session:
+        # Общий бюджет токена с фоновыми задачами (интерактивный приоритет)
+        await wb_rate_limiter.acquire(self.api_key, "analytics")
+
+        async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
             async with session.post(
                     url,
                     headers=self.headers,
                     json=payload,
-                    timeout=60
+                    timeout=request_timeout(60)
             ) as response:
 
                 if response.status == 200:
@@ -199,8 +215,8 @@ class YesterdayProductStatistics:
                 logger.info("Больше нет данных (пустой массив продуктов)")
                 break
 
-            # Добавление продуктов в общий список
-            all_products.extend(products)
+            # Добавление продуктов в общий список (только нужные поля, для передачи в пул вычислений)
+            all_products.extend(compact_funnel_rows(products))
             logger.info(f"Страница {page}: получено {len(products)} записей, всего {len(all_products)}")
 
             # Проверка на последнюю страницу
@@ -213,7 +229,7 @@ class YesterdayProductStatistics:
             page += 1
 
             # Задержка для соблюдения лимитов API
-            await asyncio.sleep(20)
+            await wb_sleep(20, "wb_pacing")
 
         logger.info(f"Извлечение завершено. Всего получено записей за вчера: {len(all_products)}")
         return all_products, date_str_dd_mm_yyyy, date_str_yyyy_mm_dd
@@ -228,135 +244,17 @@ class YesterdayProductStatistics:
 
             if not all_data:
                 logger.info("Нет данных по товарам за вчера")
-                return {
-                    "date": date_str_dd_mm_yyyy,
-                    "total_products": 0,
-                    "total_views": 0,
-                    "total_carts": 0,
-                    "total_orders": 0,
-                    "total_order_sum": 0.0,
-                    "active_products": 0,
-                    "products_with_sales": 0,
-                    "products": [],
-                    "all_products": []
-                }
+                return empty_funnel_snapshot(date_str_dd_mm_yyyy)
 
-            # Рассчитываем статистику
-            product_stats = {}
-            total_views = 0
-            total_carts = 0
-            total_orders = 0
-            total_order_sum = 0.0
-            active_products = 0
-            products_with_sales = 0
-
-            for item in all_data:
-                product = item.get("product", {})
-                statistic = item.get("statistic", {}).get("selected", {})
-
-                nm_id = product.get("nmId")
-                vendor_code = product.get("vendorCode", "")
-                title = product.get("title", "")
-                brand = product.get("brandName", "")
-                category = product.get("subjectName", "")
-
-                # Статистика
-                views = statistic.get("openCount", 0)
-                carts = statistic.get("cartCount", 0)
-                orders = statistic.get("orderCount", 0)
-                order_sum = statistic.get("orderSum", 0)
-
-                # Проверяем активность
-                has_activity = views > 0 or carts > 0 or orders > 0
-                has_sales = orders > 0
-
-                if has_activity:
-                    active_products += 1
-                if has_sales:
-                    products_with_sales += 1
-
-                # Используем vendorCode или nmId как ключ
-                article = vendor_code if vendor_code else str(nm_id)
-
-                if article not in product_stats:
-                    product_stats[article] = {
-                        'nm_id': nm_id,
-                        'vendor_code': vendor_code,
-                        'title': title[:100] if title else "",
-                        'brand': brand,
-                        'category': category,
-                        'views': 0,
-                        'carts': 0,
-                        'orders': 0,
-                        'order_sum': 0.0,
-                        'conversion_to_cart': 0.0,
-                        'conversion_to_order': 0.0
-                    }
-
-                # Обновляем статистику
-                product_stats[article]['views'] += views
-                product_stats[article]['carts'] += carts
-                product_stats[article]['orders'] += orders
-                product_stats[article]['order_sum'] += order_sum
-
-                # Рассчитываем конверсии
-                if views > 0:
-                    product_stats[article]['conversion_to_cart'] = (carts / views) * 100
-                if carts > 0:
-                    product_stats[article]['conversion_to_order'] = (orders / carts) * 100
-
-                # Общая статистика
-                total_views += views
-                total_carts += carts
-                total_orders += orders
-                total_order_sum += order_sum
-
-            # Сортируем товары по сумме заказов
-            sorted_products = sorted(
-                product_stats.items(),
-                key=lambda x: x[1]['order_sum'],
-                reverse=True
-            )
+            # Агрегация больших каталогов выполняется в пуле процессов
+            stats = await compute_pool.run(aggregate_funnel_products, all_data, date_str_dd_mm_yyyy,
+                                           rows=len(all_data))
 
-            # Форматируем продукты для вывода
-            formatted_products = []
-            for article, stats in sorted_products:
-                # Пропускаем товары без продаж (если нужно)
-                if stats['order_sum'] == 0:
-                    continue
-
-                formatted_products.append({
-                    'article': article,
-                    'nm_id': stats['nm_id'],
-                    'title': stats['title'],
-                    'brand': stats['brand'],
-                    'category': stats['category'],
-                    'views': stats['views'],
-                    'carts': stats['carts'],
-                    'orders': stats['orders'],
-                    'order_sum': stats['order_sum'],
-                    'conversion_to_cart': stats['conversion_to_cart'],
-                    'conversion_to_order': stats['conversion_to_order']
-                })
-
-            logger.info(f"Обработано артикулов: {len(product_stats)}")
-            logger.info(f"Товаров с активностью: {active_products}")
-            logger.info(f"Товаров с продажами: {products_with_sales}")
+            logger.info(f"Обработано артикулов: {stats['total_articles']}")
+            logger.info(f"Товаров с активностью: {stats['active_products']}")
+            logger.info(f"Товаров с продажами: {stats['products_with_sales']}")
 
-            return {
-                "date": date_str_dd_mm_yyyy,
-                "total_products": len(all_data),
-                "total_views": total_views,
-                "total_carts": total_carts,
-                "total_orders": total_orders,
-                "total_order_sum": total_order_sum,
-                "active_products": active_products,
-                "products_with_sales": products_with_sales,
-                "products": formatted_products[:50],  # Топ 50 для отображения
-                "all_products": formatted_products,   # Все товары для сохранения в БД
-                "overall_cart_conversion": (total_carts / total_views * 100) if total_views > 0 else 0,
-                "overall_order_conversion": (total_orders / total_carts * 100) if total_carts > 0 else 0
-            }
+            return stats
 
         except Exception as e:
             logger.error(f"Ошибка при получении статистики по товарам: {e}")
@@ -376,8 +274,8 @@ class YesterdayProductStatistics:
 
             logger.info(f"Запрос продаж за вчера ({date_from}) из WB API")
 
-            # Используем statistics-api.wildberries.ru для продаж
-            sales_base_url = "https://statistics-api.wildberries.ru"
+            # Используем statistics-api для продаж
+            sales_base_url = STATISTICS_API_URL
             sales_headers = {
                 "Authorization": self.api_key.replace("Bearer ", ""),  # Убираем Bearer если есть
                 "Content-Type": "application/json"
@@ -388,44 +286,44 @@ class YesterdayProductStatistics:
                 "flag": 1  # flag=1 для получения всех данных за указанную дату
             }
 
-            total_buyouts_quantity = 0
-            total_buyouts_amount = 0.0
-            all_sales_data = []
+            sales_pages = []
             has_more_data = True
 
             # Обрабатываем пагинацию если данных много
             while has_more_data:
-                async with aiohttp.ClientSession() as session:
+                async with aiohttp.ClientSession(trace_configs=wb_trace_configs) as session:
                     async with session.get(
                             f"{sales_base_url}/api/v1/supplier/sales",
                             headers=sales_headers,
                             params=params,
-                            timeout=60
+                            timeout=request_timeout(60)
                     ) as response:
 
                         if response.status == 200:
-                            sales_data = await response.json()
+                            # Страница до 80к строк: разбор JSON и подсчет выкупов - в пуле вычислений
+                            body = await response.read()
+                            sales_page = await compute_pool.run(summarize_sales_page, body,
+                                                                rows=len(body) // SALES_ROW_BYTES)
 
-                            if not sales_data:
+                            if not sales_page["records"]:
                                 logger.info("Нет больше данных о продажах")
                                 has_more_data = False
                                 break
 
-                            logger.info(f"Получено записей о продажах: {len(sales_data)}")
-                            all_sales_data.extend(sales_data)
+                            logger.info(f"Получено записей о продажах: {sales_page['records']}")
+                            sales_pages.append(sales_page)
 
                             # Для пагинации: если данных 80к+, нужно делать следующий запрос
-                            if len(sales_data) >= 80000:
+                            if sales_page["records"] >= 80000:
                                 # Берем последний lastChangeDate для следующего запроса
-                                last_item = sales_data[-1]
-                                last_change_date = last_item.get("lastChangeDate", "")
+                                last_change_date = sales_page["last_change_date"]
 
                                 if last_change_date:
                                     # Обновляем dateFrom для следующего запроса
                                     params["dateFrom"] = last_change_date
                                     params["flag"] = 0  # Для пагинации используем flag=0
                                     logger.info(f"Делаем следующий запрос с lastChangeDate: {last_change_date}")
-                                    await asyncio.sleep(1)  # Задержка между запросами
+                                    await wb_sleep(1, "wb_pacing")  # Задержка между запросами
                                     continue
 
                             has_more_data = False
@@ -435,35 +333,26 @@ class YesterdayProductStatistics:
                             raise ValueError("Неверный API ключ для WB API")
                         elif response.status == 429:
                             logger.warning("Превышен лимит запросов к WB API")
-                            await asyncio.sleep(60)  # Ждем минуту
+                            await wb_sleep(60, "wb_retry_after")  # Ждем минуту
                             continue
                         else:
                             error_text = await response.text()
                             logger.error(f"Ошибка WB API продаж: {response.status}, текст: {error_text[:200]}")
                             has_more_data = False
 
-            # Фильтруем только выкупы (isRealization = True) и считаем статистику
-            buyouts_data = []
-            for sale in all_sales_data:
-                # isRealization = True означает выкуп товара
-                if sale.get("isRealization", True):
-                    buyouts_data.append(sale)
-
-                    quantity = sale.get("quantity", 1)
-                    price_with_disc = float(sale.get("priceWithDisc", 0))
-
-                    total_buyouts_quantity += quantity
-                    total_buyouts_amount += price_with_disc * quantity
+            total_buyouts_quantity = sum(page["total_buyouts_quantity"] for page in sales_pages)
+            total_buyouts_amount = sum(page["total_buyouts_amount"] for page in sales_pages)
+            buyout_records = sum(page["buyout_records"] for page in sales_pages)
 
             logger.info(
-                f"Выкупов за вчера из WB API: {len(buyouts_data)} записей, {total_buyouts_quantity} шт. на {total_buyouts_amount:.2f} руб.")
+                f"Выкупов за вчера из WB API: {buyout_records} записей, {total_buyouts_quantity} шт. на {total_buyouts_amount:.2f} руб.")
 
             return {
                 "date": yesterday.strftime("%d.%m.%Y"),
                 "total_buyouts_quantity": total_buyouts_quantity,
                 "total_buyouts_amount": total_buyouts_amount,
-                "total_records": len(all_sales_data),
-                "buyout_records": len(buyouts_data),
+                "total_records": sum(page["records"] for page in sales_pages),
+                "buyout_records": buyout_records,
                 "data_source": "WB API Sales"
             }
 
@@ -507,7 +396,7 @@ class YesterdayProductStatistics:
             if attempt < max_retries - 1:
                 wait_time = (attempt + 1) * 30
                 logger.info(f"Ждем {wait_time} секунд перед повторной попыткой")
-                await asyncio.sleep(wait_time)
+                await wb_sleep(wait_time, "wb_retry")
 
         # Если все попытки неудачны
         raise ValueError(f"Не удалось получить данные о выкупах после {max_retries} попыток: {last_error}")
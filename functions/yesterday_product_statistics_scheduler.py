@@ -1,13 +1,19 @@
 # functions/yesterday_product_statistics_scheduler.py
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import pytz
 from aiogram import Bot
-from aiogram.types import ChatMemberAdministrator, ChatMemberOwner
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import ChatMemberAdministrator, ChatMemberOwner, Message
 from database.account_manager import AccountManager
-from database.product_manager import ProductManager
-from functions.yesterday_product_statistics import YesterdayProductStatistics
+from functions.message_state import message_state_tracker
+from functions.metrics import mark_scheduler_success, report_run_duration
+from functions.report_jobs import (ReportCancelled, add_custom_names, collect_yesterday_stores, is_successful_store,
+                                   report_budget, run_cancellable)
+from keyboards.statistics_kb import get_cancel_report_keyboard
 
 logger = logging.getLogger(__name__)
 
@@ -47,275 +53,222 @@ class YesterdayProductStatisticsScheduler:
 
     async def prepare_yesterday_auto_report(self, admin_id: int):
         """Подготовить и отправить автоотчет за вчера администратору"""
-        try:
-            logger.info(f"Начало подготовки автоотчета за вчера для пользователя {admin_id}")
-
-            # Импортируем функции хранилища из storage
-            from storage.yesterday_statistics_storage import set_user_data, delete_user_data
-
-            # Создаем структуру данных для пользователя
-            user_data = {
-                "account_index": 0,
-                "store_index": 0,
-                "current_page": {},
-                "store_data": {},
-                "stores_order": [],
-                "total_accounts": 0,
-                "date_str": "",
-                "day_name": "",
-                "successful_accounts": 0,
-                "failed_accounts": 0,
-                "header_message_id": None,
-                "is_auto_report": True  # Флаг автоотчета
-            }
-
-            # Сохраняем данные пользователя
-            set_user_data(admin_id, user_data, is_auto_report=True)
-
-            # Отправляем заголовок статистики
-            header_text = "⏳ <b>Подготовка автоматического отчета за вчерашний день (07:00)...</b>"
-            header_msg = await self.bot.send_message(admin_id, header_text)
-            user_data["header_message_id"] = header_msg.message_id
-            set_user_data(admin_id, user_data, is_auto_report=True)
+        await self.send_auto_report([admin_id])
 
-            async with self.session_maker() as session:
-                account_manager = AccountManager(session)
-                all_accounts = await account_manager.get_all_accounts()
-
-                if not all_accounts:
-                    await self.bot.edit_message_text(
-                        "❌ <b>Нет добавленных магазинов</b>\n\nДобавьте магазины в настройках.",
-                        chat_id=admin_id,
-                        message_id=header_msg.message_id
-                    )
-                    delete_user_data(admin_id, is_auto_report=True)
-                    return
-
-                # Получаем дату вчерашнего дня в московском времени
-                moscow_time = datetime.now(self.moscow_tz)
-                yesterday_date_obj = moscow_time - timedelta(days=1)
-                date_str = yesterday_date_obj.strftime("%d.%m.%Y")
-                days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-                day_name = days[yesterday_date_obj.weekday()]
-
-                user_data["date_str"] = date_str
-                user_data["day_name"] = day_name
-                user_data["total_accounts"] = len(all_accounts)
-
-                successful_accounts = 0
-                failed_accounts = 0
-                stores_order = []
-
-                # Обрабатываем каждый магазин
-                for account_index, account in enumerate(all_accounts, 1):
-                    account_name = account.account_name or f"Магазин {account.id}"
-
-                    # Обновляем сообщение о загрузке
-                    try:
-                        await self.bot.edit_message_text(
-                            f"⏳ <b>Автоотчет за {date_str} (07:00)</b>\n"
-                            f"Обработка магазина {account_index}/{len(all_accounts)}\n"
-                            f"<i>{account_name}</i>",
-                            chat_id=admin_id,
-                            message_id=header_msg.message_id
-                        )
-                    except:
-                        pass
-
-                    try:
-                        # Получаем комбинированную статистику
-                        yesterday_stats = YesterdayProductStatistics(account.api_key)
-                        combined_stats = await yesterday_stats.get_combined_yesterday_stats()
-
-                        funnel_stats = combined_stats.get("funnel_stats", {})
-                        sales_stats = combined_stats.get("sales_stats", {})
-                        recommended_stats = combined_stats.get("recommended_stats", {})
-
-                        # Получаем детальные данные по товарам
-                        try:
-                            stats_obj = YesterdayProductStatistics(account.api_key)
-                            detailed_stats = await stats_obj.get_yesterday_product_stats()
-
-                            # Сохраняем товары в БД
-                            product_manager = ProductManager(session)
-                            all_products_for_save = detailed_stats.get("all_products", [])
-
-                            for product_data in all_products_for_save:
-                                try:
-                                    article = product_data.get('article')
-                                    if article:
-                                        product = await product_manager.get_or_create_product(
-                                            seller_account_id=account.id,
-                                            supplier_article=article
-                                        )
-
-                                        title = product_data.get('title')
-                                        if title and not product.custom_name:
-                                            short_title = title[:100] if len(title) > 100 else title
-                                            await product_manager.update_custom_name(
-                                                seller_account_id=account.id,
-                                                supplier_article=article,
-                                                custom_name=short_title
-                                            )
-                                except Exception as e:
-                                    logger.error(f"Ошибка при сохранении товара: {e}")
-
-                        except Exception as e:
-                            logger.error(f"[{account_name}] Ошибка при получении детальных данных: {e}")
-                            detailed_stats = {}
-
-                        # Получаем кастомные названия из БД
-                        product_manager = ProductManager(session)
-                        custom_names = await product_manager.get_custom_names_dict(account.id)
-
-                        # Получаем товары с активностью
-                        products_with_activity = []
-                        try:
-                            products_with_orders = detailed_stats.get("products", [])
-                            if not products_with_orders:
-                                all_products = detailed_stats.get("all_products", [])
-                                products_with_activity = [p for p in all_products if
-                                                          p.get('orders', 0) > 0 or p.get('buyouts', 0) > 0]
-                            else:
-                                products_with_activity = [p for p in products_with_orders if
-                                                          p.get('orders', 0) > 0 or p.get('buyouts', 0) > 0]
-
-                            products_with_activity.sort(key=lambda x: x.get('orders', 0), reverse=True)
-
-                        except Exception as e:
-                            logger.error(f"[{account_name}] Ошибка при получении товаров с активностью: {e}")
-                            products_with_activity = []
-
-                        # Сохраняем данные магазина
-                        store_data = {
-                            "account_name": account_name,
-                            "account_id": account.id,
-                            "products_with_activity": products_with_activity,
-                            "custom_names": custom_names,
-                            "funnel_stats": funnel_stats,
-                            "sales_stats": sales_stats,
-                            "recommended_stats": recommended_stats,
-                            "detailed_stats": detailed_stats,
-                            "total_views": detailed_stats.get("total_views", 0) if detailed_stats else 0,
-                            "total_carts": detailed_stats.get("total_carts", 0) if detailed_stats else 0,
-                            "overall_cart_conversion": detailed_stats.get("overall_cart_conversion",
-                                                                          0) if detailed_stats else 0,
-                            "overall_order_conversion": detailed_stats.get("overall_order_conversion",
-                                                                           0) if detailed_stats else 0,
-                            "has_activity": len(products_with_activity) > 0
-                        }
-
-                        user_data["store_data"][account_name] = store_data
-                        stores_order.append(account_name)
-
-                        if funnel_stats.get("total_orders", 0) > 0 or recommended_stats.get("total_buyouts", 0) > 0:
-                            successful_accounts += 1
-                        else:
-                            failed_accounts += 1
-
-                    except Exception as e:
-                        error_message = str(e)
-                        logger.error(f"[{account_name}] Ошибка: {error_message}")
-                        failed_accounts += 1
-
-                        error_data = {
-                            "account_name": account_name,
-                            "error": True,
-                            "error_message": error_message,
-                            "display_error": "Неизвестная ошибка"
-                        }
-
-                        if "Неверный API ключ" in error_message:
-                            error_data["display_error"] = "Неверный API ключ"
-                        elif "Превышен лимит запросов" in error_message:
-                            error_data["display_error"] = "Превышен лимит запросов API"
-                        elif "Таймаут запроса" in error_message:
-                            error_data["display_error"] = "Таймаут запроса"
-                        else:
-                            error_data["display_error"] = "Ошибка подключения к API"
-
-                        user_data["store_data"][account_name] = error_data
-                        stores_order.append(account_name)
-
-                    # Обновляем данные пользователя после каждого магазина
-                    set_user_data(admin_id, user_data, is_auto_report=True)
-
-                    # Задержка между запросами
-                    if account_index < len(all_accounts):
-                        await asyncio.sleep(5)
-
-                user_data["stores_order"] = stores_order
-                user_data["successful_accounts"] = successful_accounts
-                user_data["failed_accounts"] = failed_accounts
-                set_user_data(admin_id, user_data, is_auto_report=True)
-
-                # Обновляем заголовок
-                header_text = (f"<b>📊 СТАТИСТИКА ЗА ВЧЕРА (07:00)</b>\n"
-                               f"📅 {date_str} ({day_name})\n"
-                               f"Всего магазинов: {len(all_accounts)}\n"
-                               f"Успешно: {successful_accounts} | Ошибок: {failed_accounts}\n\n"
-                               f"<i>Используйте кнопки для навигации</i>")
+    async def send_auto_report(self, admin_ids: List[int]) -> Tuple[int, int]:
+        """
+        Собрать автоотчет за вчера один раз и разослать его администраторам.
+        У каждого администратора своя кнопка отмены: отмена прекращает ожидание только для него,
+        обход магазинов останавливается, когда отменили все. Возвращает (успешно, ошибок)
+        """
+        # Импортируем функции хранилища из storage
+        from storage.yesterday_statistics_storage import delete_user_data
+
+        # Отправляем заголовки статистики
+        header_text = "⏳ <b>Подготовка автоматического отчета за вчерашний день (07:00)...</b>"
 
+        async def send_header(admin_id: int) -> Optional[Message]:
+            try:
+                header_msg = await self.bot.send_message(admin_id, header_text)
+                await self.bot.edit_message_reply_markup(
+                    chat_id=admin_id, message_id=header_msg.message_id,
+                    reply_markup=get_cancel_report_keyboard(f"{admin_id}:{header_msg.message_id}")
+                )
+                return header_msg
+            except Exception as e:
+                logger.error(f"Ошибка при подготовке автоотчета пользователю {admin_id}: {e}")
+                return None
+
+        header_messages = await asyncio.gather(*(send_header(admin_id) for admin_id in admin_ids))
+        headers: Dict[int, Message] = {admin_id: header_msg for admin_id, header_msg
+                                       in zip(admin_ids, header_messages) if header_msg is not None}
+        if not headers:
+            return 0, len(admin_ids)
+
+        async with self.session_maker() as session:
+            all_accounts = await AccountManager(session).get_all_accounts()
+
+        if not all_accounts:
+            await asyncio.gather(*(self.bot.edit_message_text(
+                "❌ <b>Нет добавленных магазинов</b>\n\nДобавьте магазины в настройках.",
+                chat_id=admin_id,
+                message_id=header_msg.message_id
+            ) for admin_id, header_msg in headers.items()), return_exceptions=True)
+            return 0, len(admin_ids)
+
+        # Получаем дату вчерашнего дня в московском времени
+        moscow_time = datetime.now(self.moscow_tz)
+        yesterday_date_obj = moscow_time - timedelta(days=1)
+        date_str = yesterday_date_obj.strftime("%d.%m.%Y")
+        days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+        day_name = days[yesterday_date_obj.weekday()]
+
+        waiting = set(headers)
+
+        progress_task: Optional[asyncio.Future] = None
+
+        async def edit_progress(admin_id: int, header_msg: Message, done: int, total: int):
+            if admin_id not in waiting:
+                return
+            try:
                 await self.bot.edit_message_text(
-                    header_text,
+                    f"⏳ <b>Автоотчет за {date_str} (07:00)</b>\n"
+                    f"Обработано магазинов: {done}/{total}",
                     chat_id=admin_id,
-                    message_id=header_msg.message_id
+                    message_id=header_msg.message_id,
+                    reply_markup=get_cancel_report_keyboard(f"{admin_id}:{header_msg.message_id}")
                 )
+            except TelegramAPIError as e:
+                logger.debug(f"Не удалось обновить сообщение о загрузке: {e}")
+
+        async def on_progress(done: int, total: int):
+            # Обновляем сообщения о загрузке (не чаще PROGRESS_EDIT_INTERVAL) параллельно и в фоне:
+            # обход магазинов не ждет Telegram. Пока предыдущие правки не отправлены, новые пропускаются
+            nonlocal progress_task
+            if progress_task is not None and not progress_task.done():
+                return
+            edits = [edit_progress(admin_id, headers[admin_id], done, total) for admin_id in list(waiting)
+                     if message_state_tracker.progress_due(admin_id, headers[admin_id].message_id)]
+            if edits:
+                progress_task = asyncio.gather(*edits, return_exceptions=True)
+
+        async def build_stores() -> List[Dict]:
+            run_started = time.perf_counter()
+            stores = await collect_yesterday_stores(self.session_maker, all_accounts, "yesterday_auto_report",
+                                                    report_budget(auto_report=True), on_progress)
+            report_run_duration.observe(time.perf_counter() - run_started, report="yesterday_auto_report")
+            # Последняя правка прогресса не должна прийти после готового отчета
+            if progress_task is not None:
+                await progress_task
+            async with self.session_maker() as session:
+                await add_custom_names(session, stores)
+            return stores
 
-                # Импортируем функции отображения из handlers
-                from handlers.yesterday_product_statistics_handlers import (
-                    show_store_summary, show_error_message
-                )
+        # Магазины обходятся один раз для всех администраторов
+        build_task = asyncio.create_task(build_stores())
 
-                # Показываем первый магазин (итоги)
-                if stores_order:
-                    first_store = stores_order[0]
-                    store_data = user_data["store_data"].get(first_store)
-
-                    if store_data.get("error", False):
-                        # Используем общую функцию show_error_message
-                        await show_error_message(
-                            message=None,  # Будем отправлять новое сообщение
-                            user_id=admin_id,
-                            store_name=first_store,
-                            store_data=store_data,
-                            edit_message=None,
-                            is_auto_report=True,
-                            bot=self.bot  # Добавляем передачу бота
-                        )
-                    else:
-                        # Используем общую функцию show_store_summary
-                        await show_store_summary(
-                            message=None,
-                            user_id=admin_id,
-                            store_name=first_store,
-                            store_data=store_data,
-                            edit_message=None,
-                            is_auto_report=True,
-                            bot=self.bot  # Передаем бота явно
-                        )
-                else:
-                    await self.bot.send_message(
-                        admin_id,
-                        "❌ Не удалось получить данные ни от одного магазина"
-                    )
+        async def wait_stores() -> List[Dict]:
+            return await asyncio.shield(build_task)
 
+        async def deliver(admin_id: int, header_msg: Message) -> bool:
+            try:
+                try:
+                    stores = await run_cancellable(f"{admin_id}:{header_msg.message_id}", wait_stores())
+                except ReportCancelled:
+                    # Отмена одним администратором не влияет на отчеты остальных
+                    logger.info(f"Автоотчет отменен пользователем {admin_id}")
+                    waiting.discard(admin_id)
+                    if not waiting:
+                        build_task.cancel()
+                    await self.bot.edit_message_text("❌ <b>Автоотчет отменен</b>", chat_id=admin_id,
+                                                     message_id=header_msg.message_id)
+                    return False
+
+                waiting.discard(admin_id)
+                await self.show_auto_report(admin_id, header_msg, stores, len(all_accounts), date_str, day_name)
                 logger.info(f"Автоотчет за вчера отправлен пользователю {admin_id}")
+                return True
 
-        except Exception as e:
-            logger.error(f"Ошибка при подготовке автоотчета пользователю {admin_id}: {e}")
-            try:
-                # Очищаем данные при ошибке
-                from storage.yesterday_statistics_storage import delete_user_data
-                delete_user_data(admin_id, is_auto_report=True)
-
-                await self.bot.send_message(
-                    admin_id,
-                    f"❌ <b>Ошибка при подготовке автоотчета</b>\n"
-                    f"<i>{str(e)[:100]}</i>"
+            except Exception as e:
+                logger.error(f"Ошибка при подготовке автоотчета пользователю {admin_id}: {e}")
+                try:
+                    # Очищаем данные при ошибке
+                    delete_user_data(admin_id, is_auto_report=True)
+
+                    await self.bot.send_message(
+                        admin_id,
+                        f"❌ <b>Ошибка при подготовке автоотчета</b>\n"
+                        f"<i>{str(e)[:100]}</i>"
+                    )
+                except:
+                    pass
+                return False
+
+        # Рассылаем параллельно, темп отправки задают лимиты сессии бота
+        results = await asyncio.gather(*(deliver(admin_id, header_msg) for admin_id, header_msg in headers.items()))
+        successful_sends = sum(results)
+        return successful_sends, len(admin_ids) - successful_sends
+
+    async def show_auto_report(self, admin_id: int, header_msg: Message, stores: List[Dict], total_accounts: int,
+                               date_str: str, day_name: str):
+        """Показать администратору готовый автоотчет: заголовок и первый магазин"""
+        # Импортируем функции хранилища из storage
+        from storage.yesterday_statistics_storage import set_user_data
+
+        successful_accounts = sum(1 for store_data in stores if is_successful_store(store_data))
+        failed_accounts = len(stores) - successful_accounts
+        timed_out_accounts = sum(1 for store_data in stores if store_data.get("timed_out", False))
+
+        # Создаем структуру данных для пользователя
+        user_data = {
+            "account_index": 0,
+            "store_index": 0,
+            "current_page": {},
+            "store_data": {store_data["account_name"]: store_data for store_data in stores},
+            "stores_order": [store_data["account_name"] for store_data in stores],
+            "total_accounts": total_accounts,
+            "date_str": date_str,
+            "day_name": day_name,
+            "successful_accounts": successful_accounts,
+            "failed_accounts": failed_accounts,
+            "header_message_id": header_msg.message_id,
+            "is_auto_report": True  # Флаг автоотчета
+        }
+        set_user_data(admin_id, user_data, is_auto_report=True)
+
+        # Обновляем заголовок
+        header_text = (f"<b>📊 СТАТИСТИКА ЗА ВЧЕРА (07:00)</b>\n"
+                       f"📅 {date_str} ({day_name})\n"
+                       f"Всего магазинов: {total_accounts}\n"
+                       f"Успешно: {successful_accounts} | Ошибок: {failed_accounts}\n")
+        if timed_out_accounts:
+            header_text += f"⏱ Не уложились во время: {timed_out_accounts}\n"
+        header_text += "\n<i>Используйте кнопки для навигации</i>"
+
+        await self.bot.edit_message_text(
+            header_text,
+            chat_id=admin_id,
+            message_id=header_msg.message_id
+        )
+
+        # Импортируем функции отображения из handlers
+        from handlers.yesterday_product_statistics_handlers import (
+            show_store_summary, show_error_message
+        )
+
+        # Показываем первый магазин (итоги)
+        stores_order = user_data["stores_order"]
+        if stores_order:
+            first_store = stores_order[0]
+            store_data = user_data["store_data"].get(first_store)
+
+            if store_data.get("error", False):
+                # Используем общую функцию show_error_message
+                await show_error_message(
+                    message=None,  # Будем отправлять новое сообщение
+                    user_id=admin_id,
+                    store_name=first_store,
+                    store_data=store_data,
+                    edit_message=None,
+                    is_auto_report=True,
+                    bot=self.bot  # Добавляем передачу бота
+                )
+            else:
+                # Используем общую функцию show_store_summary
+                await show_store_summary(
+                    message=None,
+                    user_id=admin_id,
+                    store_name=first_store,
+                    store_data=store_data,
+                    edit_message=None,
+                    is_auto_report=True,
+                    bot=self.bot  # Передаем бота явно
                 )
-            except:
-                pass
+        else:
+            await self.bot.send_message(
+                admin_id,
+                "❌ Не удалось получить данные ни от одного магазина"
+            )
 
     async def send_yesterday_auto_reports(self):
         """Отправить автоотчеты за вчера всем администраторам"""
@@ -327,27 +280,11 @@ class YesterdayProductStatisticsScheduler:
                 logger.warning("Не найдено администраторов для отправки автоотчета за вчера")
                 return
 
-            successful_sends = 0
-            failed_sends = 0
-
-            # Отправляем каждому администратору в личный чат
-            for admin in admin_users:
-                try:
-                    await self.prepare_yesterday_auto_report(admin.id)
-                    logger.info(
-                        f"Автоотчет за вчера (07:00) отправлен пользователю {admin.first_name} (ID: {admin.id})")
-                    successful_sends += 1
-
-                    # Задержка между отправками
-                    await asyncio.sleep(1)
-
-                except Exception as e:
-                    logger.error(
-                        f"Ошибка при отправке автоотчета за вчера пользователю {admin.first_name} (ID: {admin.id}): {e}")
-                    failed_sends += 1
+            successful_sends, failed_sends = await self.send_auto_report([admin.id for admin in admin_users])
 
             logger.info(
                 f"Итоги отправки автоотчетов за вчера (07:00): успешно {successful_sends}, ошибок {failed_sends}")
+            mark_scheduler_success("yesterday_statistics")
 
         except Exception as e:
             logger.error(f"Ошибка при подготовке автоотчетов за вчера (07:00): {e}")
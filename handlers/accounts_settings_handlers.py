@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from FSM.account_states import AccountManagementStates, AddAccountStates
 from database.account_manager import AccountManager
+from functions.account_health import account_health, format_health
 from keyboards.account_kb import get_shops_management_keyboard, get_cancel_inline_keyboard
 from keyboards.settings_kb import (
     get_settings_keyboard,
@@ -14,7 +15,7 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-accounts_settings_router = Router()
+accounts_settings_router = Router(name="accounts_settings_router")
 
 
 @accounts_settings_router.callback_query(F.data == "manage_shops")
@@ -22,6 +23,7 @@ async def manage_shops(callback: CallbackQuery, session: AsyncSession):
     """Переход к управлению магазинами"""
     account_manager = AccountManager(session)
     all_accounts = await account_manager.get_all_accounts()
+    health_states = await account_health.get_states()
 
     shops_text = "🏪 <b>Управление магазинами</b>\n\n"
 
@@ -29,7 +31,7 @@ async def manage_shops(callback: CallbackQuery, session: AsyncSession):
         shops_text += f"📋 <b>Ваши магазины:</b>\n"
         for i, account in enumerate(all_accounts, 1):
             account_name = account.account_name or f"Магазин {account.id}"
-            shops_text += f"{i}. {account_name}\n"
+            shops_text += f"{i}. {account_name}{format_health(health_states.get(account.id))}\n"
     else:
         shops_text += "📭 <i>У вас пока нет добавленных магазинов</i>\n"
 
@@ -315,6 +317,124 @@ async def process_new_account_name(message: Message, state: FSMContext, session:
     await state.clear()
 
 
+@accounts_settings_router.callback_query(F.data == "replace_key_shop")
+async def replace_key_shop_callback(callback: CallbackQuery, session: AsyncSession):
+    """Обработчик кнопки замены API ключа магазина"""
+    account_manager = AccountManager(session)
+    all_accounts = await account_manager.get_all_accounts()
+    health_states = await account_health.get_states()
+
+    if not all_accounts:
+        await callback.message.edit_text(
+            "<b>Нет магазинов для замены ключа</b>",
+            reply_markup=get_shops_management_keyboard()
+        )
+        return
+
+    builder = InlineKeyboardBuilder()
+    for account in all_accounts:
+        account_name = account.account_name or f"Магазин {account.id}"
+        builder.add(InlineKeyboardButton(
+            text=f"🔑 {account_name}{format_health(health_states.get(account.id))}",
+            callback_data=f"replace_key_{account.id}"
+        ))
+    builder.add(InlineKeyboardButton(text="⬅️ Назад", callback_data="manage_shops"))
+    builder.adjust(1)
+
+    await callback.message.edit_text(
+        "Выберите магазин для замены API ключа:",
+        reply_markup=builder.as_markup()
+    )
+
+
+@accounts_settings_router.callback_query(F.data.startswith("replace_key_"))
+async def start_replace_api_key(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Начало процесса замены API ключа магазина"""
+    account_id = int(callback.data.split("_")[2])
+
+    account_manager = AccountManager(session)
+    account = await account_manager.get_account_by_id(account_id)
+
+    if not account:
+        await callback.answer("❌ Магазин не найден")
+        return
+
+    # Сохраняем ID магазина в состоянии
+    await state.update_data(account_id=account_id)
+    await state.set_state(AccountManagementStates.waiting_api_key)
+
+    account_name = account.account_name or f"Магазин {account.id}"
+
+    builder = InlineKeyboardBuilder()
+    builder.add(InlineKeyboardButton(text="⬅️ Отмена", callback_data="manage_shops"))
+
+    await callback.message.edit_text(
+        f"🔑 <b>Замена API ключа</b>\n\n"
+        f"Магазин: <b>{account_name}</b>\n\n"
+        f"<b>Введите новый API ключ от Wildberries:</b>\n"
+        f"<i>Или нажмите 'Отмена' для возврата</i>",
+        reply_markup=builder.as_markup()
+    )
+
+
+@accounts_settings_router.message(AccountManagementStates.waiting_api_key)
+async def process_new_api_key(message: Message, state: FSMContext, session: AsyncSession):
+    """Обработка нового API ключа магазина"""
+    if message.text == "❌ Отмена":
+        await handle_cancel(message, state)
+        return
+
+    api_key = message.text.strip()
+
+    # Получаем данные из состояния
+    data = await state.get_data()
+    account_id = data.get("account_id")
+
+    if not account_id:
+        await message.answer(
+            "❌ <b>Ошибка данных</b>\n\n"
+            "Не удалось определить магазин для замены ключа."
+        )
+        await state.clear()
+        return
+
+    account_manager = AccountManager(session)
+    try:
+        updated_account = await account_manager.update_account_api_key(account_id, api_key)
+    except ValueError as e:
+        await message.answer(
+            f"❌ <b>{e}</b>\n\n"
+            "Пожалуйста, введите другой API ключ:\n\n"
+            "<i>Или нажмите \"❌ Отмена\" для выхода</i>",
+            reply_markup=get_cancel_inline_keyboard()
+        )
+        return
+
+    if updated_account:
+        # Запросы к магазину снова разрешены
+        await account_health.reset(account_id)
+
+        builder = InlineKeyboardBuilder()
+        builder.add(InlineKeyboardButton(text="🏪 К управлению магазинами", callback_data="manage_shops"))
+
+        await message.answer(
+            f"✅ <b>API ключ заменен</b>\n\n"
+            f"Магазин <b>{updated_account.account_name or f'Магазин {updated_account.id}'}</b> "
+            f"снова участвует в отчетах.",
+            reply_markup=builder.as_markup()
+        )
+    else:
+        await message.answer(
+            "❌ <b>Ошибка изменения</b>\n\n"
+            "Не удалось заменить API ключ.\n"
+            "Возможно, магазин был удален.",
+            reply_markup=get_settings_keyboard()
+        )
+
+    # Очищаем состояние
+    await state.clear()
+
+
 @accounts_settings_router.callback_query(F.data == "delete_shop")
 async def delete_shop_callback(callback: CallbackQuery, session: AsyncSession):
     """Обработчик кнопки удаления магазина"""
@@ -394,6 +514,7 @@ async def execute_delete_account(callback: CallbackQuery, session: AsyncSession)
     if success:
         # Получаем обновленный список магазинов
         all_accounts = await account_manager.get_all_accounts()
+        health_states = await account_health.get_states()
 
         if all_accounts:
             shops_text = "🏪 <b>Управление магазинами</b>\n\n"
@@ -402,7 +523,7 @@ async def execute_delete_account(callback: CallbackQuery, session: AsyncSession)
 
             for i, acc in enumerate(all_accounts, 1):
                 acc_name = acc.account_name or f"Магазин {acc.id}"
-                shops_text += f"{i}. {acc_name}\n"
+                shops_text += f"{i}. {acc_name}{format_health(health_states.get(acc.id))}\n"
 
             shops_text += "\nВыберите действие:"
 
@@ -435,6 +556,7 @@ async def show_settings(callback_or_message: CallbackQuery | Message, session: A
     """Показать главное меню настроек"""
     account_manager = AccountManager(session)
     all_accounts = await account_manager.get_all_accounts()
+    health_states = await account_health.get_states()
 
     settings_text = f"⚙️ <b>Настройки магазинов</b>\n\n"
 
@@ -442,7 +564,7 @@ async def show_settings(callback_or_message: CallbackQuery | Message, session: A
         settings_text += f"📋 <b>Список магазинов:</b>\n"
         for i, account in enumerate(all_accounts, 1):
             account_name = account.account_name or f"Магазин {account.id}"
-            settings_text += f"{i}. <b>{account_name}</b>\n"
+            settings_text += f"{i}. <b>{account_name}</b>{format_health(health_states.get(account.id))}\n"
         settings_text += f"\n"
     else:
         settings_text += f"📋 <b>Список магазинов:</b>\n"
@@ -1,17 +1,20 @@
 # handlers/current_statistics_handlers.py
-import asyncio
+import time
 from aiogram.types import CallbackQuery, Message
 from aiogram import Router, F
 from datetime import datetime, timedelta
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.account_manager import AccountManager
-from functions.current_statistics import CurrentStatistics
+from database.engine import session_maker
+from functions.metrics import report_run_duration, report_store_duration, report_store_errors
+from functions.orders_sales_sync import get_today_stats, orders_sync_enabled
+from functions.wb_client import wb_sleep
 from keyboards.statistics_kb import get_stats_keyboard
 
 logger = logging.getLogger(__name__)
 
-current_statistics_router = Router()
+current_statistics_router = Router(name="current_statistics_router")
 
 
 @current_statistics_router.callback_query(F.data == "current_stats")
@@ -44,18 +47,19 @@ async def handle_current_stats(callback: CallbackQuery, session: AsyncSession):
         successful_accounts = 0
         failed_accounts = 0
         rate_limited_accounts = 0
+        run_started = time.perf_counter()
 
         # Собираем статистику по каждому магазину с задержками
         for i, account in enumerate(all_accounts):
             account_display_name = account.account_name or f"Магазин {account.id}"
+            store_started = time.perf_counter()
 
             try:
-                # Задержка между запросами к разным аккаунтам
-                if i > 0:
-                    await asyncio.sleep(5)
+                # Задержка между запросами к разным аккаунтам, не нужна при чтении из БД
+                if i > 0 and not orders_sync_enabled():
+                    await wb_sleep(5, "wb_pacing")
 
-                wb_api = CurrentStatistics(account.api_key)
-                stats = await wb_api.get_today_stats_for_message()
+                stats = await get_today_stats(session_maker, account)
 
                 orders_quantity = stats["orders"]["quantity"]
                 orders_amount = stats["orders"]["amount"]
@@ -88,9 +92,14 @@ async def handle_current_stats(callback: CallbackQuery, session: AsyncSession):
                 stats_text += f"<b>{account_display_name}</b>\n"
                 stats_text += f"❌ {display_error}\n\n"
                 failed_accounts += 1
+                report_store_errors.inc(report="current_stats")
 
                 logger.warning(f"Ошибка для {account_display_name}: {error_message}")
 
+            report_store_duration.observe(time.perf_counter() - store_started, report="current_stats")
+
+        report_run_duration.observe(time.perf_counter() - run_started, report="current_stats")
+
         # Добавляем подсказку только если есть ошибки лимита
         if rate_limited_accounts > 0:
             stats_text += "💡 <i>Некоторые данные не получены из-за ограничений API. Попробуйте позже.</i>"
@@ -0,0 +1,29 @@
+# handlers/diagnostics_handlers.py
+from datetime import datetime
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+
+from functions.tracing import slow_updates
+
+diagnostics_router = Router(name="diagnostics_router")
+
+
+@diagnostics_router.message(Command("slow"))
+async def cmd_slow_updates(message: Message, command: CommandObject):
+    """Самые медленные обновления: /slow - сводка, /slow json - полный дамп трасс, /slow reset - очистить"""
+    argument = (command.args or "").strip().lower()
+
+    if argument == "json":
+        dump = slow_updates.to_json().encode()
+        filename = f"slow_updates_{datetime.now():%Y%m%d_%H%M%S}.json"
+        await message.answer_document(BufferedInputFile(dump, filename=filename))
+        return
+
+    if argument == "reset":
+        slow_updates.clear()
+        await message.answer("✅ Буфер медленных обновлений очищен")
+        return
+
+    await message.answer(slow_updates.summary_text())
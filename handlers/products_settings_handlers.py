@@ -1,6 +1,7 @@
 # handlers/products_settings_handlers.py
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
+from aiogram.types import (Message, CallbackQuery, InlineKeyboardButton, InlineQuery,
+                           InlineQueryResultArticle, InputTextMessageContent)
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -13,16 +14,19 @@ from handlers.settings_handlers import show_settings
 from keyboards.account_kb import get_shops_management_keyboard, get_cancel_inline_keyboard
 from keyboards.product_kb import get_products_management_keyboard
 from keyboards.settings_kb import get_settings_keyboard
+import html
 import logging
 import math
 
 logger = logging.getLogger(__name__)
 
-products_settings_router = Router()
+products_settings_router = Router(name="products_settings_router")
 
 # Константы для пагинации
 ACCOUNTS_PER_PAGE = 5  # Максимальное количество магазинов на странице
 PRODUCTS_PER_PAGE = 20  # Увеличил количество товаров на странице для отображения списком
+SEARCH_RESULTS_PER_PAGE = 10  # Результатов поиска на странице
+INLINE_RESULTS_LIMIT = 20  # Результатов на одну порцию инлайн-режима
 
 
 @products_settings_router.callback_query(F.data == "manage_products")
@@ -225,9 +229,9 @@ async def handle_select_account_for_edit(
         return
 
     product_manager = ProductManager(session)
-    products = await product_manager.get_all_products(account_id)
+    total_products = await product_manager.get_products_count(account_id, PRODUCTS_PER_PAGE)
 
-    if not products:
+    if not total_products:
         builder = InlineKeyboardBuilder()
         builder.add(InlineKeyboardButton(text="⬅️ Назад", callback_data="edit_product_name"))
 
@@ -240,7 +244,7 @@ async def handle_select_account_for_edit(
         return
 
     # Показываем товары с пагинацией (если их много)
-    await show_products_page_for_account(callback, session, account, products, page=0, action="edit")
+    await show_products_page_for_account(callback, session, account, page=0, action="edit")
 
 
 async def handle_select_account_for_show(
@@ -257,11 +261,11 @@ async def handle_select_account_for_show(
         return
 
     product_manager = ProductManager(session)
-    products = await product_manager.get_all_products(account_id)
+    total_products = await product_manager.get_products_count(account_id, PRODUCTS_PER_PAGE)
 
     account_name = account.account_name or f"Магазин {account.id}"
 
-    if not products:
+    if not total_products:
         builder = InlineKeyboardBuilder()
         builder.add(InlineKeyboardButton(text="⬅️ Назад", callback_data="show_all_products"))
 
@@ -273,29 +277,24 @@ async def handle_select_account_for_show(
         return
 
     # ПОКАЗЫВАЕМ ТОВАРЫ СПИСКОМ В СООБЩЕНИИ
-    await show_all_products_list(callback, session, account, products, page=0)
+    await show_all_products_list(callback, session, account, page=0)
 
 
 async def show_all_products_list(
         callback: CallbackQuery,
         session: AsyncSession,
         account,
-        products,
         page: int
 ):
     """Показать список всех товаров магазина в сообщении (ИЗМЕНЕННЫЙ КОД)"""
-    total_products = len(products)
+    # Из БД читается только текущая страница (номер страницы проверяется там же)
+    product_manager = ProductManager(session)
+    products, total_products, page = await product_manager.get_products_page(account.id, page, PRODUCTS_PER_PAGE)
     total_pages = math.ceil(total_products / PRODUCTS_PER_PAGE)
 
-    # Проверяем корректность номера страницы
-    if page < 0:
-        page = 0
-    elif page >= total_pages:
-        page = total_pages - 1
-
     # Определяем начало и конец для текущей страницы
     start_idx = page * PRODUCTS_PER_PAGE
-    end_idx = min(start_idx + PRODUCTS_PER_PAGE, total_products)
+    end_idx = start_idx + len(products)
 
     # Формируем текст сообщения со списком товаров
     account_name = account.account_name or f"Магазин {account.id}"
@@ -304,7 +303,7 @@ async def show_all_products_list(
     message_text += f"📦 <b>Список товаров</b> (всего: {total_products})\n\n"
 
     # Добавляем товары с порядковыми номерами
-    for i, product in enumerate(products[start_idx:end_idx], start_idx + 1):
+    for i, product in enumerate(products, start_idx + 1):
         display_name = product.custom_name or product.supplier_article
         message_text += f"{i}. ({product.supplier_article}) {display_name}\n"
 
@@ -365,59 +364,52 @@ async def handle_products_list_pagination(callback: CallbackQuery, session: Asyn
             await callback.answer("❌ Магазин не найден")
             return
 
-        product_manager = ProductManager(session)
-        products = await product_manager.get_all_products(account_id)
-
-        await show_all_products_list(callback, session, account, products, page)
+        await show_all_products_list(callback, session, account, page)
     except Exception as e:
         logger.error(f"Ошибка при пагинации списка товаров: {e}")
         await callback.answer("❌ Ошибка переключения страницы")
 
 
+def get_product_button(product, action: str) -> InlineKeyboardButton:
+    """Кнопка выбора товара в формате: (артикул) название"""
+    display_name = product.custom_name or product.supplier_article
+    # Обрезаем слишком длинные названия
+    if len(display_name) > 25:  # Уменьшил лимит, т.к. добавляем артикул
+        display_name = display_name[:22] + "..."
+
+    button_text = f"({product.supplier_article}) {display_name}"
+
+    # Обрезаем, если вся строка слишком длинная
+    if len(button_text) > 35:
+        button_text = button_text[:32] + "..."
+
+    return InlineKeyboardButton(
+        text=button_text,
+        callback_data=f"select_product_{action}_{product.supplier_article}"
+    )
+
+
 async def show_products_page_for_account(
         callback: CallbackQuery,
         session: AsyncSession,
         account,
-        products,
         page: int,
         action: str
 ):
     """Показать страницу с товарами конкретного магазина (только для редактирования)"""
-    total_products = len(products)
+    product_manager = ProductManager(session)
+    products, total_products, page = await product_manager.get_products_page(account.id, page, PRODUCTS_PER_PAGE)
     total_pages = math.ceil(total_products / PRODUCTS_PER_PAGE)
 
-    # Проверяем корректность номера страницы
-    if page < 0:
-        page = 0
-    elif page >= total_pages:
-        page = total_pages - 1
-
     # Определяем начало и конец для текущей страницы
     start_idx = page * PRODUCTS_PER_PAGE
-    end_idx = min(start_idx + PRODUCTS_PER_PAGE, total_products)
+    end_idx = start_idx + len(products)
 
     builder = InlineKeyboardBuilder()
 
     # Добавляем кнопки товаров для текущей страницы (только для редактирования)
-    for product in products[start_idx:end_idx]:
-        display_name = product.custom_name or product.supplier_article
-        # Обрезаем слишком длинные названия
-        if len(display_name) > 25:  # Уменьшил лимит, т.к. добавляем артикул
-            display_name = display_name[:22] + "..."
-
-        # Добавляем артикул перед названием в формате: (артикул) название
-        button_text = f"({product.supplier_article}) {display_name}"
-
-        # Обрезаем, если вся строка слишком длинная
-        if len(button_text) > 35:
-            button_text = button_text[:32] + "..."
-
-        callback_data = f"select_product_{action}_{product.supplier_article}"
-
-        builder.add(InlineKeyboardButton(
-            text=button_text,
-            callback_data=callback_data
-        ))
+    for product in products:
+        builder.add(get_product_button(product, action))
 
     builder.adjust(1)
 
@@ -444,6 +436,11 @@ async def show_products_page_for_account(
 
         builder.row(*navigation_buttons)
 
+    builder.row(InlineKeyboardButton(
+        text="🔍 Найти товар",
+        callback_data=f"product_search_{account.id}"
+    ))
+
     # Кнопка "Назад" в зависимости от действия
     back_callback = "edit_product_name" if action == "edit" else "show_all_products"
     builder.row(InlineKeyboardButton(
@@ -485,10 +482,7 @@ async def handle_products_pagination(callback: CallbackQuery, session: AsyncSess
             await callback.answer("❌ Магазин не найден")
             return
 
-        product_manager = ProductManager(session)
-        products = await product_manager.get_all_products(account_id)
-
-        await show_products_page_for_account(callback, session, account, products, page, action)
+        await show_products_page_for_account(callback, session, account, page, action)
     except Exception as e:
         logger.error(f"Ошибка при пагинации товаров: {e}")
         await callback.answer("❌ Ошибка переключения страницы")
@@ -543,12 +537,7 @@ async def handle_select_product_for_edit(
     account_name = account.account_name or f"Магазин {account.id}"
 
     # Получаем текущее название товара
-    products = await product_manager.get_all_products(account_id)
-    current_product = None
-    for product in products:
-        if product.supplier_article == supplier_article:
-            current_product = product
-            break
+    current_product = await product_manager.get_product(account_id, supplier_article)
 
     if not current_product:
         await callback.answer("❌ Товар не найден")
@@ -585,13 +574,9 @@ async def handle_select_product_for_show(
     found_product = None
 
     for account in all_accounts:
-        products = await product_manager.get_all_products(account.id)
-        for product in products:
-            if product.supplier_article == supplier_article:
-                found_account = account
-                found_product = product
-                break
+        found_product = await product_manager.get_product(account.id, supplier_article)
         if found_product:
+            found_account = account
             break
 
     if not found_product:
@@ -632,10 +617,192 @@ async def show_products_for_account_from_detail(
         await callback.answer("❌ Магазин не найден")
         return
 
+    await show_products_page_for_account(callback, session, account, page=0, action="edit")
+
+
+@products_settings_router.callback_query(F.data.startswith("product_search_page_"))
+async def handle_product_search_pagination(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Обработка пагинации результатов поиска"""
+    try:
+        # Разбираем callback_data: product_search_page_2
+        page = int(callback.data.split("_")[-1])
+
+        data = await state.get_data()
+        account_id = data.get("account_id")
+        query = data.get("search_query")
+
+        if not account_id or not query:
+            await callback.answer("❌ Поиск устарел, начните заново")
+            return
+
+        await show_search_results(callback.message, session, account_id, query, page, edit=True)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка при пагинации результатов поиска: {e}")
+        await callback.answer("❌ Ошибка переключения страницы")
+
+
+@products_settings_router.callback_query(F.data.startswith("product_search_"))
+async def product_search_start(callback: CallbackQuery, state: FSMContext):
+    """Начало поиска товара в магазине"""
+    account_id = int(callback.data.split("_")[-1])
+
+    await state.update_data(account_id=account_id, search_query=None)
+    await state.set_state(ProductManagementStates.waiting_for_search_query)
+
+    await callback.message.edit_text(
+        "🔍 <b>Поиск товара</b>\n\n"
+        "Введите начало артикула или часть названия товара:\n"
+        "<i>Или нажмите \"❌ Отмена\" для отмены</i>",
+        reply_markup=get_cancel_inline_keyboard()
+    )
+
+
+@products_settings_router.message(ProductManagementStates.waiting_for_search_query)
+async def process_product_search_query(message: Message, state: FSMContext, session: AsyncSession):
+    """Обработка строки поиска товара"""
+    if message.text == "❌ Отмена":
+        await handle_cancel(message, state)
+        return
+
+    query = (message.text or "").strip()
+
+    if not query or len(query) > 100:
+        await message.answer(
+            "❌ <b>Введите от 1 до 100 символов</b>\n\n"
+            "Начало артикула или часть названия товара:\n"
+            "<i>Или нажмите \"❌ Отмена\" для отмены</i>",
+            reply_markup=get_cancel_inline_keyboard()
+        )
+        return
+
+    data = await state.get_data()
+    account_id = data.get("account_id")
+
+    if not account_id:
+        await message.answer(
+            "❌ <b>Ошибка данных</b>\n\n"
+            "Не удалось определить магазин для поиска.",
+            reply_markup=get_products_management_keyboard()
+        )
+        await state.clear()
+        return
+
+    # Магазин и строку поиска оставляем в данных состояния: они нужны для пагинации и выбора товара
+    await state.update_data(search_query=query)
+    await state.set_state(None)
+
+    await show_search_results(message, session, account_id, query, page=0, edit=False)
+
+
+async def show_search_results(
+        message: Message,
+        session: AsyncSession,
+        account_id: int,
+        query: str,
+        page: int,
+        edit: bool
+):
+    """Показать страницу результатов поиска товаров магазина"""
+    page = max(page, 0)
     product_manager = ProductManager(session)
-    products = await product_manager.get_all_products(account_id)
+    products, has_next = await product_manager.search_products(
+        query,
+        offset=page * SEARCH_RESULTS_PER_PAGE,
+        limit=SEARCH_RESULTS_PER_PAGE,
+        seller_account_id=account_id
+    )
+
+    builder = InlineKeyboardBuilder()
+    for product in products:
+        builder.add(get_product_button(product, "edit"))
+    builder.adjust(1)
+
+    if page > 0 or has_next:
+        navigation_buttons = []
+
+        if page > 0:
+            navigation_buttons.append(InlineKeyboardButton(
+                text="◀️ Предыдущая",
+                callback_data=f"product_search_page_{page - 1}"
+            ))
 
-    await show_products_page_for_account(callback, session, account, products, page=0, action="edit")
+        navigation_buttons.append(InlineKeyboardButton(
+            text=f"📄 {page + 1}",
+            callback_data="noop"
+        ))
+
+        if has_next:
+            navigation_buttons.append(InlineKeyboardButton(
+                text="Следующая ▶️",
+                callback_data=f"product_search_page_{page + 1}"
+            ))
+
+        builder.row(*navigation_buttons)
+
+    builder.row(InlineKeyboardButton(
+        text="🔍 Новый поиск",
+        callback_data=f"product_search_{account_id}"
+    ))
+    builder.row(InlineKeyboardButton(
+        text="⬅️ К списку товаров",
+        callback_data=f"show_products_account_{account_id}"
+    ))
+
+    if products:
+        text = (f"🔍 <b>Результаты поиска:</b> {html.escape(query)}\n\n"
+                f"📦 <b>Выберите товар для редактирования</b>\n"
+                f"Страница: {page + 1}")
+    else:
+        text = (f"🔍 <b>Ничего не найдено:</b> {html.escape(query)}\n\n"
+                f"Поиск идет по началу артикула и по части названия (от 3 символов).")
+
+    if edit:
+        await message.edit_text(text, reply_markup=builder.as_markup())
+    else:
+        await message.answer(text, reply_markup=builder.as_markup())
+
+
+@products_settings_router.inline_query()
+async def inline_product_search(inline_query: InlineQuery, session: AsyncSession):
+    """Инлайн-режим: поиск товара во всех магазинах по артикулу или названию"""
+    query = inline_query.query.strip()
+    if not query:
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+
+    product_manager = ProductManager(session)
+    products, has_next = await product_manager.search_products(query[:100], offset=offset,
+                                                               limit=INLINE_RESULTS_LIMIT)
+
+    account_manager = AccountManager(session)
+    account_names = {account.id: account.account_name or f"Магазин {account.id}"
+                     for account in await account_manager.get_all_accounts()}
+
+    results = []
+    for i, product in enumerate(products, offset):
+        account_name = account_names.get(product.seller_account_id, f"Магазин {product.seller_account_id}")
+        display_name = product.custom_name or product.supplier_article
+        results.append(InlineQueryResultArticle(
+            id=str(i),
+            title=f"({product.supplier_article}) {display_name}",
+            description=f"🏪 {account_name}",
+            input_message_content=InputTextMessageContent(
+                message_text=f"📦 <b>Информация о товаре</b>\n\n"
+                             f"🏪 <b>Магазин:</b> {html.escape(account_name)}\n"
+                             f"📋 <b>Артикул поставщика:</b> <code>{html.escape(product.supplier_article)}</code>\n"
+                             f"📝 <b>Название в системе:</b> {html.escape(display_name)}"
+            )
+        ))
+
+    await inline_query.answer(
+        results,
+        cache_time=10,
+        is_personal=True,
+        next_offset=str(offset + INLINE_RESULTS_LIMIT) if has_next else ""
+    )
 
 
 # Остальной код остается без изменений
@@ -11,7 +11,7 @@ from keyboards.settings_kb import (
 
 logger = logging.getLogger(__name__)
 
-settings_router = Router()
+settings_router = Router(name="settings_router")
 
 
 @settings_router.message(F.text == "⚙️ Настройки")
@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.user_manager import UserManager
 from keyboards.main_kb import get_main_keyboard
 
-start_router = Router()
+start_router = Router(name="start_router")
 
 
 @start_router.message(Command("start"))
@@ -7,7 +7,7 @@ from keyboards.statistics_kb import get_stats_keyboard
 
 logger = logging.getLogger(__name__)
 
-statistics_router = Router()
+statistics_router = Router(name="statistics_router")
 
 
 @statistics_router.message(F.text == "📊 Статистика")
@@ -0,0 +1,143 @@
+# handlers/stock_handlers.py
+import logging
+import os
+from typing import Dict, List
+
+from aiogram import Router, F
+from aiogram.types import CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.account_manager import AccountManager
+from database.engine import session_maker
+from functions.orders_sales_sync import orders_sync_enabled
+from functions.stock_forecast import get_store_cover
+from functions.wb_rate_limiter import PRIORITY_INTERACTIVE
+from keyboards.statistics_kb import get_stats_keyboard
+
+logger = logging.getLogger(__name__)
+
+stock_router = Router(name="stock_router")
+
+# Сколько заканчивающихся артикулов показывать по магазину
+LOW_STOCK_LIMIT = 15
+
+# Ограничение Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+# Без синхронизации продаж скорость продаж неизвестна и запас в днях не считается
+NO_SALES_NOTE = "<i>Запас в днях не рассчитывается: синхронизация продаж отключена (ORDERS_SYNC_ENABLED)</i>\n\n"
+
+
+def get_low_stock_days() -> float:
+    return float(os.getenv("STOCK_ALERT_DAYS", "7"))
+
+
+def pack_messages(header: str, blocks: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Разложить блоки магазинов по сообщениям не длиннее limit (блок магазина не разрывается)"""
+    messages = []
+    current = header
+    for block in blocks:
+        if len(current) + len(block) > limit and current != header:
+            messages.append(current)
+            current = ""
+        current += block
+    messages.append(current)
+    return messages
+
+
+def format_store_cover(store_name: str, items: List[Dict], threshold: float,
+                       limit: int = LOW_STOCK_LIMIT) -> str:
+    """Текст с остатками магазина и артикулами, запаса которых хватит меньше чем на threshold дней"""
+    total_quantity = sum(item["quantity"] for item in items)
+    in_way = sum(item["in_way_to_client"] for item in items)
+    low_stock = [item for item in items if item["days_of_cover"] < threshold]
+
+    text = f"<b>🏪 {store_name}</b>\n"
+    text += f"Остаток: <b>{total_quantity}</b> шт. ({len(items)} арт.), в пути к клиентам: {in_way} шт.\n"
+
+    if not orders_sync_enabled():
+        return text + "\n"
+
+    if not low_stock:
+        text += f"✅ Запаса хватит больше чем на {threshold:g} дн. по всем артикулам\n\n"
+        return text
+
+    text += f"⚠️ Заканчиваются (запас меньше {threshold:g} дн.): <b>{len(low_stock)}</b> арт.\n"
+    for item in low_stock[:limit]:
+        article = item["article"] or str(item["nm_id"])
+        if item["quantity"] == 0:
+            text += f"• {article}: <b>нет в наличии</b>, продажи {item['velocity']:g} шт./день\n"
+        else:
+            text += (f"• {article}: {item['quantity']} шт., продажи {item['velocity']:g} шт./день "
+                     f"— ~<b>{item['days_of_cover']:g}</b> дн.\n")
+
+    if len(low_stock) > limit:
+        text += f"<i>...и еще {len(low_stock) - limit} арт.</i>\n"
+
+    return text + "\n"
+
+
+@stock_router.callback_query(F.data == "stock_cover")
+async def handle_stock_cover(callback: CallbackQuery, session: AsyncSession):
+    """Показать остатки и запас в днях по всем магазинам"""
+    await callback.answer()
+    loading_msg = None
+
+    try:
+        loading_msg = await callback.message.answer(
+            "📦 <b>Получение остатков...</b>\n\n"
+            "🔄 Считаем запас в днях по всем магазинам..."
+        )
+
+        all_accounts = await AccountManager(session).get_all_accounts()
+
+        if not all_accounts:
+            await loading_msg.delete()
+            await callback.message.answer(
+                "❌ <b>Нет добавленных магазинов</b>\n\n"
+                "Перейдите в настройки, чтобы добавить первый магазин.",
+                reply_markup=get_stats_keyboard()
+            )
+            return
+
+        threshold = get_low_stock_days()
+        header = "📦 <b>Остатки и запас в днях</b>\n\n"
+        if not orders_sync_enabled():
+            header += NO_SALES_NOTE
+        blocks = []
+
+        for account in all_accounts:
+            account_name = account.account_name or f"Магазин {account.id}"
+
+            try:
+                _, items = await get_store_cover(session_maker, account, priority=PRIORITY_INTERACTIVE)
+                blocks.append(format_store_cover(account_name, items, threshold))
+
+            except Exception as e:
+                error_message = str(e)
+                logger.error(f"[{account_name}] Ошибка при расчете запаса: {error_message}")
+                if "Неверный API ключ" in error_message:
+                    display_error = "Неверный API ключ"
+                else:
+                    display_error = "Ошибка подключения к API"
+                blocks.append(f"<b>🏪 {account_name}</b>\n❌ {display_error}\n\n")
+
+        await loading_msg.delete()
+        messages = pack_messages(header, blocks)
+        for text in messages[:-1]:
+            await callback.message.answer(text)
+        await callback.message.answer(messages[-1], reply_markup=get_stats_keyboard())
+
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при расчете запаса: {e}")
+        if loading_msg:
+            try:
+                await loading_msg.delete()
+            except Exception:
+                pass
+
+        await callback.message.answer(
+            "❌ <b>Произошла непредвиденная ошибка</b>\n\n"
+            "<i>Попробуйте позже</i>",
+            reply_markup=get_stats_keyboard()
+        )
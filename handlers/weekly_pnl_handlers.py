@@ -0,0 +1,241 @@
+# handlers/weekly_pnl_handlers.py
+import logging
+import math
+from datetime import date, datetime
+from typing import Optional
+
+import pytz
+from aiogram import Router, F
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.account_manager import AccountManager
+from database.engine import session_maker
+from database.pnl_manager import PnlManager
+from functions.message_state import message_state_tracker
+from functions.report_jobs import run_in_background
+from functions.wb_rate_limiter import PRIORITY_INTERACTIVE
+from functions.weekly_pnl import WeeklyPnlReport, get_last_closed_week
+from keyboards.statistics_kb import get_stats_keyboard
+
+logger = logging.getLogger(__name__)
+
+weekly_pnl_router = Router(name="weekly_pnl_router")
+
+ARTICLES_PER_PAGE = 10
+
+
+def format_money(value: float) -> str:
+    return f"{value:,.2f} ₽".replace(",", " ").replace(".", ",")
+
+
+def format_store_pnl(store_name: str, totals: dict) -> str:
+    """Текст с итогами P&L магазина за неделю"""
+    text = f"<b>🏪 {store_name}</b>\n"
+    text += f"Выручка: <b>{format_money(totals['revenue'])}</b> ({int(totals['sold_quantity'])} шт.)\n"
+    text += f"Возвраты: {format_money(totals['returns'])} ({int(totals['returned_quantity'])} шт.)\n"
+    text += f"Комиссия WB: {format_money(totals['commission'])}\n"
+    text += f"Логистика: {format_money(totals['logistics'])}\n"
+    text += f"Хранение: {format_money(totals['storage'])}\n"
+    text += f"Штрафы: {format_money(totals['penalties'])}\n"
+    text += f"Прочие удержания: {format_money(totals['other_deductions'])}\n"
+    text += f"<b>К перечислению: {format_money(totals['payout'])}</b>\n\n"
+    return text
+
+
+@weekly_pnl_router.callback_query(F.data == "weekly_pnl")
+async def handle_weekly_pnl(callback: CallbackQuery, session: AsyncSession):
+    """Показать P&L всех магазинов за последнюю закрытую неделю"""
+    await callback.answer()
+
+    # Неделя определяется по московскому времени, как в планировщике P&L
+    week_start, week_end = get_last_closed_week(datetime.now(pytz.timezone('Europe/Moscow')).date())
+    loading_msg = None
+
+    try:
+        loading_msg = await callback.message.answer(
+            "⏳ Подготовка финансового отчета за неделю...\n"
+            "Если отчет о реализации еще не загружен, это может занять несколько минут."
+        )
+
+        account_manager = AccountManager(session)
+        all_accounts = await account_manager.get_all_accounts()
+
+        if not all_accounts:
+            await loading_msg.delete()
+            await callback.message.answer(
+                "❌ Нет добавленных магазинов",
+                reply_markup=get_stats_keyboard()
+            )
+            return
+
+        # Отчет о реализации загружается в фоне (около запроса в минуту на магазин), обработчик сразу освобождается
+        run_in_background(send_weekly_pnl(callback.message, loading_msg, all_accounts, week_start, week_end))
+
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при подготовке P&L: {e}")
+        await send_weekly_pnl_error(callback.message, loading_msg)
+
+
+async def send_weekly_pnl_error(message: Message, loading_msg: Optional[Message]):
+    if loading_msg:
+        try:
+            await loading_msg.delete()
+        except Exception:
+            pass
+
+    await message.answer(
+        "❌ <b>Произошла непредвиденная ошибка</b>\n\n"
+        "<i>Попробуйте позже</i>",
+        reply_markup=get_stats_keyboard()
+    )
+
+
+async def send_weekly_pnl(message: Message, loading_msg: Message, all_accounts: list, week_start: date,
+                          week_end: date):
+    """Загрузить отчеты о реализации, рассчитать P&L магазинов и отправить итоги"""
+    try:
+        report = WeeklyPnlReport(session_maker)
+
+        text = (f"<b>💰 P&L ЗА НЕДЕЛЮ</b>\n"
+                f"📅 {week_start.strftime('%d.%m.%Y')} - {week_end.strftime('%d.%m.%Y')}\n\n")
+        builder = InlineKeyboardBuilder()
+
+        for account_index, account in enumerate(all_accounts, 1):
+            account_name = account.account_name or f"Магазин {account.id}"
+
+            if message_state_tracker.progress_due(loading_msg.chat.id, loading_msg.message_id):
+                try:
+                    await loading_msg.edit_text(
+                        f"⏳ Финансовый отчет за неделю\n"
+                        f"Обработка магазина {account_index}/{len(all_accounts)}\n"
+                        f"<i>{account_name}</i>"
+                    )
+                except TelegramAPIError as e:
+                    logger.debug(f"Не удалось обновить сообщение о загрузке: {e}")
+
+            try:
+                is_ready = await report.build_week(account, week_start, week_end, priority=PRIORITY_INTERACTIVE)
+                totals = None
+                if is_ready:
+                    async with session_maker() as session:
+                        totals = await PnlManager(session).get_week_totals(account.id, week_start)
+
+                if not totals:
+                    text += f"<b>🏪 {account_name}</b>\n<i>Отчет о реализации за неделю еще не сформирован</i>\n\n"
+                    continue
+
+                text += format_store_pnl(account_name, totals)
+                builder.row(InlineKeyboardButton(
+                    text=f"📦 {account_name[:25]}: по артикулам",
+                    callback_data=f"pnl_store:{account.id}:{week_start.strftime('%Y%m%d')}"
+                ))
+
+            except Exception as e:
+                error_message = str(e)
+                logger.error(f"[{account_name}] Ошибка при подготовке P&L: {error_message}")
+                if "Неверный API ключ" in error_message:
+                    display_error = "Неверный API ключ"
+                else:
+                    display_error = "Ошибка подключения к API"
+                text += f"<b>🏪 {account_name}</b>\n❌ {display_error}\n\n"
+
+        try:
+            await loading_msg.delete()
+        except Exception:
+            pass
+
+        await message.answer(text, reply_markup=builder.as_markup())
+
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при подготовке P&L: {e}")
+        await send_weekly_pnl_error(message, loading_msg)
+
+
+async def show_pnl_articles_page(callback: CallbackQuery, session: AsyncSession, account_id: int,
+                                 week_str: str, page: int, edit: bool):
+    """Страница P&L по артикулам магазина"""
+    week_start = datetime.strptime(week_str, "%Y%m%d").date()
+
+    account = await AccountManager(session).get_account_by_id(account_id)
+    if not account:
+        await callback.answer("❌ Магазин не найден")
+        return
+
+    pnl_manager = PnlManager(session)
+    totals = await pnl_manager.get_week_totals(account_id, week_start)
+    if not totals:
+        await callback.answer("❌ Нет данных за эту неделю")
+        return
+
+    total_pages = max(1, math.ceil(totals["articles"] / ARTICLES_PER_PAGE))
+    page = max(0, min(page, total_pages - 1))
+
+    articles = await pnl_manager.get_week_articles(
+        account_id, week_start, limit=ARTICLES_PER_PAGE, offset=page * ARTICLES_PER_PAGE
+    )
+
+    account_name = account.account_name or f"Магазин {account.id}"
+    text = f"<b>🏪 {account_name}</b>\n"
+    text += f"P&L по артикулам, неделя с {week_start.strftime('%d.%m.%Y')}\n\n"
+
+    for i, row in enumerate(articles, page * ARTICLES_PER_PAGE + 1):
+        article = row.article or "Без артикула"
+        text += f"<b>{i}. {article}</b>\n"
+        text += (f"Выручка: {format_money(float(row.revenue))} ({row.sold_quantity} шт.) | "
+                 f"Возвраты: {row.returned_quantity} шт.\n")
+        text += (f"<i>Комиссия: {format_money(float(row.commission))} | "
+                 f"Логистика: {format_money(float(row.logistics))}</i>\n")
+        text += f"К перечислению: <b>{format_money(float(row.payout))}</b>\n\n"
+
+    text += f"Страница {page + 1}/{total_pages}"
+
+    builder = InlineKeyboardBuilder()
+    navigation_buttons = []
+    if page > 0:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="◀️ Назад",
+            callback_data=f"pnl_page:{account_id}:{week_str}:{page - 1}"
+        ))
+    if page < total_pages - 1:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="Вперед ▶️",
+            callback_data=f"pnl_page:{account_id}:{week_str}:{page + 1}"
+        ))
+    if navigation_buttons:
+        builder.row(*navigation_buttons)
+
+    if edit:
+        await callback.message.edit_text(text, reply_markup=builder.as_markup())
+    else:
+        await callback.message.answer(text, reply_markup=builder.as_markup())
+
+
+@weekly_pnl_router.callback_query(F.data.startswith("pnl_store:"))
+async def handle_pnl_store(callback: CallbackQuery, session: AsyncSession):
+    """Открыть P&L по артикулам магазина отдельным сообщением"""
+    await callback.answer()
+
+    try:
+        # Разбираем callback_data: pnl_store:12:20261005
+        _, account_id, week_str = callback.data.split(":")
+        await show_pnl_articles_page(callback, session, int(account_id), week_str, page=0, edit=False)
+    except Exception as e:
+        logger.error(f"Ошибка при показе P&L по артикулам: {e}")
+        await callback.answer("❌ Ошибка при обработке запроса")
+
+
+@weekly_pnl_router.callback_query(F.data.startswith("pnl_page:"))
+async def handle_pnl_page(callback: CallbackQuery, session: AsyncSession):
+    """Пагинация P&L по артикулам"""
+    await callback.answer()
+
+    try:
+        # Разбираем callback_data: pnl_page:12:20261005:2
+        _, account_id, week_str, page = callback.data.split(":")
+        await show_pnl_articles_page(callback, session, int(account_id), week_str, int(page), edit=True)
+    except Exception as e:
+        logger.error(f"Ошибка при пагинации P&L: {e}")
+        await callback.answer("❌ Ошибка переключения страницы")
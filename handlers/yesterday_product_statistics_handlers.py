@@ -1,19 +1,24 @@
 # handlers/yesterday_product_statistics_handlers.py
-import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
+from typing import Optional
 from aiogram import Router, F
+from aiogram.exceptions import TelegramAPIError
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.account_manager import AccountManager
-from database.product_manager import ProductManager
-from functions.yesterday_product_statistics import YesterdayProductStatistics
-from keyboards.statistics_kb import get_stats_keyboard
+from database.engine import session_maker
+from functions.message_state import message_state_tracker
+from functions.metrics import report_run_duration
+from functions.report_jobs import (ReportCancelled, add_custom_names, cancel_report, collect_yesterday_stores,
+                                   is_successful_store, report_budget, run_cancellable, run_in_background)
+from keyboards.statistics_kb import get_cancel_report_keyboard, get_stats_keyboard
 from storage.yesterday_statistics_storage import get_user_data, set_user_data
 
 logger = logging.getLogger(__name__)
 
-yesterday_product_statistics_router = Router()
+yesterday_product_statistics_router = Router(name="yesterday_product_statistics_router")
 
 
 @yesterday_product_statistics_router.callback_query(F.data == "yesterday_stats")
@@ -24,11 +29,13 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
 
     logger.info("Получение статистики за вчера")
 
+    loading_msg = None
     try:
         loading_msg = await callback.message.answer(
             "⏳ Получение статистики по товарам за вчера...\n"
             "Это может занять несколько минут."
         )
+        await loading_msg.edit_reply_markup(reply_markup=get_cancel_report_keyboard(report_key(loading_msg)))
 
         account_manager = AccountManager(session)
         all_accounts = await account_manager.get_all_accounts()
@@ -43,9 +50,47 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
 
         logger.info(f"Найдено магазинов для обработки: {len(all_accounts)}")
 
-        successful_accounts = 0
-        failed_accounts = 0
+        # Магазины обходятся в фоне (или процессами worker.py), обработчик сразу освобождается
+        run_in_background(send_yesterday_stats(callback.message, callback.from_user.id, loading_msg, all_accounts))
 
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка при получении статистики за вчера: {e}")
+        await send_yesterday_stats_error(callback.message, loading_msg, e)
+
+
+def report_key(loading_msg: Message) -> str:
+    """Ключ отчета для кнопки отмены: сообщение о загрузке"""
+    return f"{loading_msg.chat.id}:{loading_msg.message_id}"
+
+
+@yesterday_product_statistics_router.callback_query(F.data.startswith("cancel_report:"))
+async def handle_cancel_report(callback: CallbackQuery):
+    """Отмена отчета: выполняющиеся запросы к WB прерываются, задания в очереди снимаются"""
+    key = callback.data.split(":", 1)[1]
+    if cancel_report(key):
+        logger.info(f"Отчет {key} отменен пользователем {callback.from_user.id}")
+        await callback.answer("Отчет отменяется")
+    else:
+        await callback.answer("Отчет уже завершен")
+
+
+async def send_yesterday_stats_error(message: Message, loading_msg: Optional[Message], error: Exception):
+    try:
+        await loading_msg.delete()
+    except:
+        pass
+
+    await message.answer(
+        f"<b>❌ Произошла непредвиденная ошибка</b>\n"
+        f"<i>Детали: {str(error)[:100]}</i>\n"
+        "Попробуйте позже.",
+        reply_markup=get_stats_keyboard()
+    )
+
+
+async def send_yesterday_stats(message: Message, user_id: int, loading_msg: Message, all_accounts: list):
+    """Собрать снимки магазинов за вчера и показать первый магазин"""
+    try:
         # Получаем дату вчерашнего дня
         yesterday_date_obj = datetime.now() - timedelta(days=1)
         date_str = yesterday_date_obj.strftime("%d.%m.%Y")
@@ -53,7 +98,6 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
         day_name = days[yesterday_date_obj.weekday()]
 
         # Инициализируем хранилище для пользователя
-        user_id = callback.from_user.id
         user_data = {
             "account_index": 0,
             "store_index": 0,
@@ -70,163 +114,43 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
 
         set_user_data(user_id, user_data, is_auto_report=False)
 
-        # Обрабатываем каждый магазин
-        stores_order = []
-
-        for account_index, account in enumerate(all_accounts, 1):
-            account_name = account.account_name or f"Магазин {account.id}"
-            logger.info(f"[{account_index}/{len(all_accounts)}] Обрабатываю магазин: {account_name}")
-
-            try:
-                # Обновляем сообщение о загрузке
+        async def on_progress(done: int, total: int):
+            # Обновляем сообщение о загрузке (не чаще PROGRESS_EDIT_INTERVAL)
+            if message_state_tracker.progress_due(loading_msg.chat.id, loading_msg.message_id):
                 try:
                     await loading_msg.edit_text(
                         f"⏳ Получение статистики...\n"
-                        f"Обработка магазина {account_index}/{len(all_accounts)}\n"
-                        f"<i>{account_name}</i>"
+                        f"Обработано магазинов: {done}/{total}",
+                        reply_markup=get_cancel_report_keyboard(report_key(loading_msg))
                     )
-                except:
-                    pass
+                except TelegramAPIError as e:
+                    logger.debug(f"Не удалось обновить сообщение о загрузке: {e}")
 
-                # Получаем комбинированную статистику для текущего магазина
-                yesterday_stats = YesterdayProductStatistics(account.api_key)
-                combined_stats = await yesterday_stats.get_combined_yesterday_stats()
+        run_started = time.perf_counter()
+        try:
+            stores = await run_cancellable(report_key(loading_msg), collect_yesterday_stores(
+                session_maker, all_accounts, "yesterday_stats", report_budget(), on_progress))
+        except ReportCancelled:
+            try:
+                await loading_msg.edit_text("❌ Отчет отменен", reply_markup=get_stats_keyboard())
+            except TelegramAPIError:
+                await message.answer("❌ Отчет отменен", reply_markup=get_stats_keyboard())
+            return
+        report_run_duration.observe(time.perf_counter() - run_started, report="yesterday_stats")
 
-                # Извлекаем данные из комбинированной статистики
-                funnel_stats = combined_stats.get("funnel_stats", {})
-                sales_stats = combined_stats.get("sales_stats", {})
-                recommended_stats = combined_stats.get("recommended_stats", {})
+        async with session_maker() as session:
+            await add_custom_names(session, stores)
 
-                logger.info(f"[{account_name}] Товаров: {funnel_stats.get('total_products', 0)}")
-                logger.info(f"[{account_name}] Заказов: {funnel_stats.get('total_orders', 0)}")
-                logger.info(
-                    f"[{account_name}] Выкупов: {recommended_stats.get('total_buyouts', 0)} шт. на {recommended_stats.get('total_buyout_sum', 0):.2f} руб.")
+        # Сохраняем данные магазинов и их порядок
+        stores_order = []
+        for store_data in stores:
+            user_data["store_data"][store_data["account_name"]] = store_data
+            stores_order.append(store_data["account_name"])
+
+        successful_accounts = sum(1 for store_data in stores if is_successful_store(store_data))
+        failed_accounts = len(stores) - successful_accounts
+        timed_out_accounts = sum(1 for store_data in stores if store_data.get("timed_out", False))
 
-                # Получаем детальные данные по товарам
-                try:
-                    stats_obj = YesterdayProductStatistics(account.api_key)
-                    detailed_stats = await stats_obj.get_yesterday_product_stats()
-
-                    # Сохраняем товары в БД
-                    product_manager = ProductManager(session)
-                    saved_products_count = 0
-                    all_products_for_save = detailed_stats.get("all_products", [])
-
-                    for product_data in all_products_for_save:
-                        try:
-                            article = product_data.get('article')
-                            if article:
-                                product = await product_manager.get_or_create_product(
-                                    seller_account_id=account.id,
-                                    supplier_article=article
-                                )
-                                saved_products_count += 1
-
-                                title = product_data.get('title')
-                                if title and not product.custom_name:
-                                    short_title = title[:100] if len(title) > 100 else title
-                                    await product_manager.update_custom_name(
-                                        seller_account_id=account.id,
-                                        supplier_article=article,
-                                        custom_name=short_title
-                                    )
-                        except Exception as e:
-                            logger.error(f"Ошибка при сохранении товара: {e}")
-
-                    logger.info(f"[{account_name}] Сохранено товаров: {saved_products_count}")
-
-                except Exception as e:
-                    logger.error(f"[{account_name}] Ошибка при получении детальных данных: {e}")
-                    detailed_stats = {}
-
-                # Получаем кастомные названия из БД
-                product_manager = ProductManager(session)
-                custom_names = await product_manager.get_custom_names_dict(account.id)
-
-                # Получаем товары с активностью
-                products_with_activity = []
-                try:
-                    # Пробуем получить товары из детальной статистики
-                    products_with_orders = detailed_stats.get("products", [])
-                    if not products_with_orders:
-                        # Если нет товаров, пробуем получить из другой структуры данных
-                        all_products = detailed_stats.get("all_products", [])
-                        # Фильтруем товары с заказами или выкупами
-                        products_with_activity = [p for p in all_products if
-                                                  p.get('orders', 0) > 0 or p.get('buyouts', 0) > 0]
-                    else:
-                        # Фильтруем только товары с активностью
-                        products_with_activity = [p for p in products_with_orders if
-                                                  p.get('orders', 0) > 0 or p.get('buyouts', 0) > 0]
-
-                    # СОРТИРУЕМ ТОВАРЫ ПО КОЛИЧЕСТВУ ЗАКАЗОВ (от большего к меньшему)
-                    products_with_activity.sort(key=lambda x: x.get('orders', 0), reverse=True)
-
-                except Exception as e:
-                    logger.error(f"[{account_name}] Ошибка при получении товаров с активностью: {e}")
-                    products_with_activity = []
-
-                # Сохраняем данные магазина
-                store_data = {
-                    "account_name": account_name,
-                    "account_id": account.id,
-                    "products_with_activity": products_with_activity,
-                    "custom_names": custom_names,
-                    "funnel_stats": funnel_stats,
-                    "sales_stats": sales_stats,
-                    "recommended_stats": recommended_stats,
-                    "detailed_stats": detailed_stats,
-                    "total_views": detailed_stats.get("total_views", 0) if detailed_stats else 0,
-                    "total_carts": detailed_stats.get("total_carts", 0) if detailed_stats else 0,
-                    "overall_cart_conversion": detailed_stats.get("overall_cart_conversion",
-                                                                  0) if detailed_stats else 0,
-                    "overall_order_conversion": detailed_stats.get("overall_order_conversion",
-                                                                   0) if detailed_stats else 0,
-                    "has_activity": len(products_with_activity) > 0
-                }
-
-                user_data["store_data"][account_name] = store_data
-                stores_order.append(account_name)
-
-                # Обновляем счетчики
-                if funnel_stats.get("total_orders", 0) > 0 or recommended_stats.get("total_buyouts", 0) > 0:
-                    successful_accounts += 1
-                    user_data["successful_accounts"] = successful_accounts
-                else:
-                    failed_accounts += 1
-                    user_data["failed_accounts"] = failed_accounts
-
-            except Exception as e:
-                error_message = str(e)
-                logger.error(f"[{account_name}] Ошибка при получении статистики: {error_message}")
-                failed_accounts += 1
-                user_data["failed_accounts"] = failed_accounts
-
-                # Сохраняем информацию об ошибке
-                error_data = {
-                    "account_name": account_name,
-                    "error": True,
-                    "error_message": error_message,
-                    "display_error": "Неизвестная ошибка"
-                }
-
-                if "Неверный API ключ" in error_message:
-                    error_data["display_error"] = "Неверный API ключ"
-                elif "Превышен лимит запросов" in error_message:
-                    error_data["display_error"] = "Превышен лимит запросов API"
-                elif "Таймаут запроса" in error_message:
-                    error_data["display_error"] = "Таймаут запроса"
-                else:
-                    error_data["display_error"] = "Ошибка подключения к API"
-
-                user_data["store_data"][account_name] = error_data
-                stores_order.append(account_name)
-
-            # Задержка между запросами к разным магазинам
-            if account_index < len(all_accounts):
-                await asyncio.sleep(5)
-
-        # Сохраняем порядок магазинов
         user_data["stores_order"] = stores_order
         user_data["successful_accounts"] = successful_accounts
         user_data["failed_accounts"] = failed_accounts
@@ -243,10 +167,12 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
         header_text = (f"<b>📊 СТАТИСТИКА ЗА ВЧЕРА</b>\n"
                        f"📅 {date_str} ({day_name})\n"
                        f"Всего магазинов: {len(all_accounts)}\n"
-                       f"Успешно: {successful_accounts} | Ошибок: {failed_accounts}\n\n"
-                       f"<i>Используйте кнопки для навигации</i>")
+                       f"Успешно: {successful_accounts} | Ошибок: {failed_accounts}\n")
+        if timed_out_accounts:
+            header_text += f"⏱ Не уложились во время: {timed_out_accounts}\n"
+        header_text += "\n<i>Используйте кнопки для навигации</i>"
 
-        header_msg = await callback.message.answer(header_text)
+        header_msg = await message.answer(header_text)
 
         # Сохраняем ID сообщения с заголовком для возможного редактирования
         user_data["header_message_id"] = header_msg.message_id
@@ -259,28 +185,18 @@ async def handle_yesterday_stats(callback: CallbackQuery, session: AsyncSession)
 
             if store_data.get("error", False):
                 # Показываем ошибку
-                await show_error_message(callback.message, user_id, first_store, store_data, is_auto_report=False)
+                await show_error_message(message, user_id, first_store, store_data, is_auto_report=False)
             else:
                 # ПОКАЗЫВАЕМ СНАЧАЛА ИТОГОВУЮ СТАТИСТИКУ МАГАЗИНА
-                await show_store_summary(callback.message, user_id, first_store, store_data, is_auto_report=False)
+                await show_store_summary(message, user_id, first_store, store_data, is_auto_report=False)
         else:
-            await callback.message.answer("❌ Не удалось получить данные ни от одного магазина")
+            await message.answer("❌ Не удалось получить данные ни от одного магазина")
 
         logger.info(f"Статистика успешно отправлена для {successful_accounts}/{len(all_accounts)} магазинов")
 
     except Exception as e:
         logger.error(f"Неожиданная ошибка при получении статистики за вчера: {e}")
-        try:
-            await loading_msg.delete()
-        except:
-            pass
-
-        await callback.message.answer(
-            f"<b>❌ Произошла непредвиденная ошибка</b>\n"
-            f"<i>Детали: {str(e)[:100]}</i>\n"
-            "Попробуйте позже.",
-            reply_markup=get_stats_keyboard()
-        )
+        await send_yesterday_stats_error(message, loading_msg, e)
 
 
 async def show_store_page(message: Message, user_id: int, store_name: str, page: int = 1,
@@ -484,6 +400,9 @@ async def show_store_summary(message: Message, user_id: int, store_name: str, st
     text += f"Конверсия в корзину: {store_data.get('overall_cart_conversion', 0):.1f}%\n"
     text += f"Конверсия в заказ: {store_data.get('overall_order_conversion', 0):.1f}%\n\n"
 
+    if store_data.get("timed_out", False):
+        text += "⏱ <i>Данные неполные: время на магазин истекло</i>\n\n"
+
     # Добавляем информацию о магазине в конец сообщения
     text += f"Магазин {current_index + 1}/{total_stores}"
 
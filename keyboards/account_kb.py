@@ -10,6 +10,7 @@ def get_shops_management_keyboard() -> InlineKeyboardMarkup:
     builder.add(
         InlineKeyboardButton(text="➕ Добавить магазин", callback_data="add_shop"),
         InlineKeyboardButton(text="✏️ Изменить название", callback_data="edit_shop"),
+        InlineKeyboardButton(text="🔑 Заменить API ключ", callback_data="replace_key_shop"),
         InlineKeyboardButton(text="🗑 Удалить магазин", callback_data="delete_shop"),
         InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_settings")
     )
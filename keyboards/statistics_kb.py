@@ -19,7 +19,33 @@ def get_stats_keyboard() -> InlineKeyboardMarkup:
                 text="📈 Статистика товаров за вчера",
                 callback_data="yesterday_stats"
             )
+        ],
+        [
+            InlineKeyboardButton(
+                text="💰 P&L за неделю",
+                callback_data="weekly_pnl"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="📦 Остатки и запас в днях",
+                callback_data="stock_cover"
+            )
         ]
     ])
 
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+
+def get_cancel_report_keyboard(report_key: str) -> InlineKeyboardMarkup:
+    """
+    Кнопка отмены отчета под сообщением о загрузке
+    """
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="✖️ Отменить",
+                callback_data=f"cancel_report:{report_key}"
+            )
+        ]
+    ])
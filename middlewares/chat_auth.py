@@ -14,6 +14,22 @@ class ChatAuthMiddleware(BaseMiddleware):
 
     async def __call__(self, handler, event, data):
 
+        # Инлайн-запросы приходят из любых чатов: отвечаем только администраторам
+        if isinstance(event, Update) and event.inline_query:
+            inline_query = event.inline_query
+            try:
+                member = await inline_query.bot.get_chat_member(
+                    chat_id=self.admin_chat_id,
+                    user_id=inline_query.from_user.id
+                )
+            except TelegramAPIError as e:
+                logger.error(f"Ошибка доступа: {e}")
+                return
+            if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR):
+                await inline_query.answer([], cache_time=60, is_personal=True)
+                return
+            return await handler(event, data)
+
         # извлекаем Message
         if isinstance(event, Update):
             message = event.message
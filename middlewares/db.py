@@ -1,7 +1,42 @@
-from typing import Any, Awaitable, Callable, Dict
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
 from aiogram import BaseMiddleware
-from aiogram.types import Message, TelegramObject
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class LazySession:
+    """
+    Заместитель AsyncSession: настоящая сессия создается при первом обращении из хендлера.
+    Для обновлений, хендлеры которых не работают с БД, сессия не создается вовсе.
+    """
+    __slots__ = ("_session_pool", "_session")
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self._session_pool = session_pool
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def is_used(self) -> bool:
+        return self._session is not None
+
+    @property
+    def has_pending_work(self) -> bool:
+        """Есть ли незавершенная транзакция (выполнялись запросы или добавлены объекты)"""
+        return self._session is not None and (self._session.in_transaction() or bool(self._session.new)
+                                              or bool(self._session.dirty) or bool(self._session.deleted))
+
+    def __getattr__(self, name: str):
+        if self._session is None:
+            self._session = self._session_pool()
+            logger.debug("DataBaseSession: сессия создана при первом обращении")
+        return getattr(self._session, name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
 
 
 class DataBaseSession(BaseMiddleware):
@@ -14,17 +49,19 @@ class DataBaseSession(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        print(f"🔍 DataBaseSession: создание новой сессии")
-        async with self.session_pool() as session:
-            print(f"🔍 DataBaseSession: сессия создана {session}")
-            data['session'] = session
-            try:
-                result = await handler(event, data)
-                print(f"🔍 DataBaseSession: коммит сессии")
+        session = LazySession(self.session_pool)
+        data['session'] = session
+        try:
+            result = await handler(event, data)
+            # Коммитим, только если хендлер что-то выполнил и не завершил транзакцию сам
+            if session.has_pending_work:
                 await session.commit()
-                print(f"🔍 DataBaseSession: коммит успешен")
-                return result
-            except Exception as e:
-                print(f"🔍 DataBaseSession: ошибка, откат - {e}")
+                logger.debug("DataBaseSession: коммит выполнен")
+            return result
+        except Exception as e:
+            if session.has_pending_work:
                 await session.rollback()
-                raise e
+                logger.debug(f"DataBaseSession: откат после ошибки - {e}")
+            raise
+        finally:
+            await session.close()
@@ -0,0 +1,59 @@
+# middlewares/message_state.py
+"""
+Middleware сессии бота: не отправляет правку сообщения, если его текст и клавиатура не изменились,
+и считает ответ "message is not modified" успешной правкой.
+"""
+import logging
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import DeleteMessage, EditMessageReplyMarkup, EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import Message
+
+from functions.message_state import MessageStateTracker, content_hash, message_state_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStateMiddleware(BaseRequestMiddleware):
+    def __init__(self, tracker: MessageStateTracker = message_state_tracker):
+        self.tracker = tracker
+
+    async def _edit_text(self, make_request: NextRequestMiddlewareType, bot: Bot, method: EditMessageText):
+        if method.inline_message_id or not isinstance(method.chat_id, int):
+            return await make_request(bot, method)
+
+        digest = content_hash(method.text, method.reply_markup)
+        if self.tracker.is_unchanged(method.chat_id, method.message_id, digest):
+            self.tracker.suppressed_edits += 1
+            logger.debug(f"Правка сообщения {method.message_id} пропущена: содержимое не изменилось")
+            return True
+
+        # Middleware стоит перед очередью лимитов, поэтому содержимое запоминается до отправки:
+        # следующие правки сравниваются с последней запрошенной, в том числе еще ожидающей очереди
+        self.tracker.remember(method.chat_id, method.message_id, digest)
+        try:
+            return await make_request(bot, method)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                self.tracker.forget(method.chat_id, method.message_id)
+                raise
+            return True
+        except BaseException:
+            self.tracker.forget(method.chat_id, method.message_id)
+            raise
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        if isinstance(method, EditMessageText):
+            return await self._edit_text(make_request, bot, method)
+
+        result = await make_request(bot, method)
+
+        if isinstance(method, SendMessage) and isinstance(result, Message):
+            self.tracker.remember(result.chat.id, result.message_id, content_hash(method.text, method.reply_markup))
+        elif isinstance(method, (EditMessageReplyMarkup, DeleteMessage)) and isinstance(method.chat_id, int):
+            # Текст после правки клавиатуры не известен - сравнивать больше не с чем
+            self.tracker.forget(method.chat_id, method.message_id)
+
+        return result
@@ -0,0 +1,154 @@
+# middlewares/telegram_limits.py
+"""
+Очередь исходящих сообщений в Telegram (middleware сессии бота).
+Отправка и правка сообщений ждут токен из общей корзины бота (~30 сообщений в секунду)
+и из корзины конкретного чата, при RetryAfter запрос повторяется после паузы.
+Несколько правок одного сообщения, ожидающих очереди, сливаются: отправляется только последний текст.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (EditMessageCaption, EditMessageReplyMarkup, EditMessageText, Response,
+                             SendDocument, SendMessage, SendPhoto, TelegramMethod)
+
+from functions.metrics import telegram_request_duration, telegram_requests
+from functions.wb_rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Методы, на которые распространяются лимиты Telegram на отправку
+LIMITED_METHODS = (SendMessage, SendDocument, SendPhoto, EditMessageText, EditMessageCaption,
+                   EditMessageReplyMarkup)
+CHAT_BURST = 3
+MAX_CHAT_BUCKETS = 1000
+
+
+class _PendingEdit:
+    """Правка сообщения, ожидающая очереди: хранит последнюю версию и общий результат"""
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: EditMessageText):
+        self.method = method
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class TelegramSendLimiter(BaseRequestMiddleware):
+    def __init__(self, global_rate: float = None, private_chat_rate: float = None,
+                 group_chat_rate: float = None, max_retries: int = None):
+        # Лимиты: сообщений в секунду на бота, сообщений в минуту на личный чат и на группу
+        global_rate = global_rate or float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+        self.private_chat_rate = private_chat_rate or float(os.getenv("TELEGRAM_CHAT_RATE", "60"))
+        self.group_chat_rate = group_chat_rate or float(os.getenv("TELEGRAM_GROUP_RATE", "20"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+        self.global_bucket = TokenBucket(global_rate * 60, max(1, int(global_rate)), background_reserve=0,
+                                         sleep_reason="telegram_limits")
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._pending_edits: Dict[Tuple, _PendingEdit] = {}
+
+    def _get_chat_bucket(self, chat_id) -> Optional[TokenBucket]:
+        if not isinstance(chat_id, int):
+            # Правки инлайн-сообщений и каналы по username ограничены только общим лимитом
+            return None
+
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._drop_idle_buckets()
+            # Отрицательные ID - группы и каналы, для них лимит ниже
+            rate = self.group_chat_rate if chat_id < 0 else self.private_chat_rate
+            bucket = TokenBucket(rate, CHAT_BURST, background_reserve=0, sleep_reason="telegram_limits")
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _drop_idle_buckets(self):
+        """Забыть чаты, корзины которых уже полностью восстановились"""
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket._refill()
+            if bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    async def _acquire(self, chat_id):
+        chat_bucket = self._get_chat_bucket(chat_id)
+        if chat_bucket is not None:
+            await chat_bucket.acquire()
+        await self.global_bucket.acquire()
+
+    async def _send(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod,
+                    acquired: bool = False) -> Response:
+        """Отправить запрос с ожиданием лимитов и повтором после RetryAfter"""
+        chat_id = getattr(method, "chat_id", None)
+        method_name = type(method).__name__
+        attempt = 0
+        while True:
+            if not acquired:
+                await self._acquire(chat_id)
+            acquired = False
+            started = time.perf_counter()
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                telegram_request_duration.observe(time.perf_counter() - started, method=method_name)
+                telegram_requests.inc(method=method_name, result="retry_after")
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"Telegram: {method_name} в чат {chat_id} - RetryAfter {e.retry_after} сек "
+                               f"(попытка {attempt}/{self.max_retries})")
+                # Пауза распространяется на все сообщения в этот чат (или на весь бот),
+                # повтор дождется ее в _acquire
+                bucket = self._get_chat_bucket(chat_id) or self.global_bucket
+                bucket.block_for(e.retry_after)
+                continue
+            except Exception:
+                telegram_request_duration.observe(time.perf_counter() - started, method=method_name)
+                telegram_requests.inc(method=method_name, result="error")
+                raise
+            telegram_request_duration.observe(time.perf_counter() - started, method=method_name)
+            telegram_requests.inc(method=method_name, result="ok")
+            return response
+
+    async def _send_edit(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                         method: EditMessageText) -> Response:
+        key = (bot.id, method.chat_id, method.message_id, method.inline_message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Предыдущая правка еще в очереди: заменяем ее текст на последний и ждем общий результат
+            pending.method = method
+            return await asyncio.shield(pending.future)
+
+        pending = _PendingEdit(method)
+        self._pending_edits[key] = pending
+        try:
+            await self._acquire(method.chat_id)
+            # Дальше правки этого сообщения встают в новую очередь
+            del self._pending_edits[key]
+            if pending.method is not method:
+                logger.debug(f"Telegram: правки сообщения {method.message_id} объединены")
+            response = await self._send(make_request, bot, pending.method, acquired=True)
+            pending.future.set_result(response)
+            return response
+        except BaseException as e:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if not pending.future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    pending.future.cancel()
+                else:
+                    pending.future.set_exception(e)
+                    # Ошибка уже поднимается здесь, ожидающие правки получат ее из future
+                    pending.future.exception()
+            raise
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        if not isinstance(method, LIMITED_METHODS):
+            return await make_request(bot, method)
+        if isinstance(method, EditMessageText):
+            return await self._send_edit(make_request, bot, method)
+        return await self._send(make_request, bot, method)
@@ -0,0 +1,94 @@
+# middlewares/tracing.py
+"""
+Трассировка обновлений: внешний middleware засекает полное время обработки обновления,
+внутренний записывает, какой обработчик его обработал, middleware сессии бота
+добавляет в трассу вызовы Telegram API (вместе с ожиданием лимитов).
+"""
+import os
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from functions.metrics import update_duration
+from functions.tracing import SlowUpdateLog, UpdateTrace, current_trace, slow_updates, trace_span
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений, регистрируется первым"""
+
+    def __init__(self, log: SlowUpdateLog = slow_updates, max_spans: int = None):
+        self.log = log
+        self.max_spans = max_spans or int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        trace = UpdateTrace(
+            update_id=event.update_id if isinstance(event, Update) else None,
+            update_type=event.event_type if isinstance(event, Update) else type(event).__name__,
+            user_id=user.id if user else None,
+            max_spans=self.max_spans,
+        )
+        token = current_trace.set(trace)
+        error = None
+        try:
+            return await handler(event, data)
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            current_trace.reset(token)
+            trace.finish(trace.error or error)
+            update_duration.observe(trace.duration, handler=trace.handler or "unhandled")
+            self.log.record(trace)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Внутренний middleware: имя обработчика (роутер.функция) и его ошибки попадают в трассу"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = current_trace.get()
+        if trace is None:
+            return await handler(event, data)
+
+        handler_object = data.get("handler")
+        router = data.get("event_router")
+        if handler_object is not None:
+            callback = handler_object.callback
+            name = getattr(callback, "__name__", type(callback).__name__)
+            trace.handler = f"{router.name}.{name}" if router is not None else name
+
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            # Ошибку дальше перехватит ErrorMiddleware, до внешнего middleware она не дойдет
+            trace.error = type(e).__name__
+            raise
+
+    @classmethod
+    def register(cls, dispatcher: Dispatcher):
+        """Подключить ко всем типам событий (включая обработчики вложенных роутеров)"""
+        middleware = cls()
+        for name, observer in dispatcher.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(middleware)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота, регистрируется первым, чтобы учитывать ожидание лимитов"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        with trace_span("telegram", type(method).__name__):
+            return await make_request(bot, method)
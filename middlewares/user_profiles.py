@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database.user_manager import UserProfileBuffer
+
+
+class UserProfileMiddleware(BaseMiddleware):
+    """Складывает профиль автора каждого обновления в буфер, запись в БД - пачкой в фоне"""
+
+    def __init__(self, profile_buffer: UserProfileBuffer):
+        self.profile_buffer = profile_buffer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.profile_buffer.add(data.get('event_from_user'))
+        return await handler(event, data)
@@ -1,66 +1,122 @@
 # run.py
 import asyncio
 import logging
+import os
 import subprocess
 import sys
 from pathlib import Path
+from typing import Optional
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from dotenv import load_dotenv
 from config import config
-from database.engine import drop_db, create_db, session_maker
+from database.account_registry import AccountRegistryListener
+from database.engine import drop_db, create_db, engine, session_maker
+from database.user_manager import UserProfileBuffer
+from functions.compute_pool import compute_pool
 from functions.current_statistics_scheduler import CurrentStatisticsScheduler
+from functions.funnel_backfill import FunnelBackfillWorker
+from functions.loop_monitor import LoopMonitor, loop_monitor_enabled
+from functions.metrics_server import metrics_enabled, run_metrics_server
+from functions.orders_sales_sync import OrdersSalesSyncWorker, orders_sync_enabled
+from functions.report_jobs import report_job_events, report_queue_enabled
 from functions.set_bot_commands import set_bot_commands
+from functions.stock_alert_scheduler import StockAlertScheduler
+from functions.stock_forecast import StockSnapshotWorker
+from functions.tracing import install_db_tracing
+from functions.webhook_server import run_webhook, webhook_mode_enabled
+from functions.weekly_pnl_scheduler import WeeklyPnlScheduler
 from functions.yesterday_product_statistics_scheduler import YesterdayProductStatisticsScheduler
 from handlers.accounts_settings_handlers import accounts_settings_router
 from handlers.current_statistics_handlers import current_statistics_router
+from handlers.diagnostics_handlers import diagnostics_router
 from handlers.products_settings_handlers import products_settings_router
 from handlers.settings_handlers import settings_router
 from handlers.start_handlers import start_router
 from handlers.statistics_handlers import statistics_router
+from handlers.stock_handlers import stock_router
+from handlers.weekly_pnl_handlers import weekly_pnl_router
 from handlers.yesterday_product_statistics_handlers import yesterday_product_statistics_router
 from middlewares.chat_auth import ChatAuthMiddleware
 from middlewares.db import DataBaseSession
 from middlewares.errors import ErrorMiddleware
-
-load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+from middlewares.message_state import MessageStateMiddleware
+from middlewares.telegram_limits import TelegramSendLimiter
+from middlewares.tracing import HandlerTracingMiddleware, TelegramTracingMiddleware, UpdateTracingMiddleware
+from middlewares.user_profiles import UserProfileMiddleware
 
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера
-bot = Bot(
-    token=config.BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-)
-dp = Dispatcher()
-
-dp.include_router(start_router)
-dp.include_router(statistics_router)
-dp.include_router(settings_router)
-dp.include_router(yesterday_product_statistics_router)
-dp.include_router(current_statistics_router)
-dp.include_router(accounts_settings_router)
-dp.include_router(products_settings_router)
+# Бот, диспетчер и буфер профилей создаются в setup_bot() и setup_dispatcher(), а не при импорте:
+# процессы пула вычислений (functions/compute_pool.py) импортируют модуль запуска как __mp_main__
+bot: Optional[Bot] = None
+dp: Optional[Dispatcher] = None
+user_profile_buffer: Optional[UserProfileBuffer] = None
+
+
+def setup_logging():
+    """Настройка логирования"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('bot.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def setup_bot():
+    """Инициализация бота"""
+    global bot
+    bot = Bot(
+        token=config.BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    # Все исходящие сообщения проходят через лимиты Telegram (общий и на чат), вызовы API попадают
+    # в трассу обновления. Правки без изменений содержимого отбрасываются до очереди лимитов
+    bot.session.middleware(TelegramTracingMiddleware())
+    bot.session.middleware(MessageStateMiddleware())
+    bot.session.middleware(TelegramSendLimiter())
+
+
+def setup_dispatcher():
+    """Инициализация диспетчера и буфера профилей пользователей"""
+    global dp, user_profile_buffer
+    dp = Dispatcher()
+
+    # Профили пользователей из обновлений пишутся в БД пачками
+    user_profile_buffer = UserProfileBuffer(session_maker, interval=float(os.getenv("USER_PROFILE_FLUSH_INTERVAL", "60")))
+
+    dp.include_router(start_router)
+    dp.include_router(statistics_router)
+    dp.include_router(settings_router)
+    dp.include_router(yesterday_product_statistics_router)
+    dp.include_router(current_statistics_router)
+    dp.include_router(weekly_pnl_router)
+    dp.include_router(stock_router)
+    dp.include_router(accounts_settings_router)
+    dp.include_router(products_settings_router)
+    dp.include_router(diagnostics_router)
+
 
 # Создаем планировщики
 current_scheduler = None
 yesterday_scheduler = None
+funnel_backfill_worker = None
+weekly_pnl_scheduler = None
+orders_sales_sync_worker = None
+stock_snapshot_worker = None
+stock_alert_scheduler = None
+# Сервер метрик (останавливается в on_shutdown)
+metrics_runner = None
 
 
 async def start_schedulers():
     """Запуск планировщиков отчетов"""
-    global current_scheduler, yesterday_scheduler
+    global current_scheduler, yesterday_scheduler, funnel_backfill_worker, weekly_pnl_scheduler, \
+        orders_sales_sync_worker, stock_snapshot_worker, stock_alert_scheduler, metrics_runner
 
     logger.info("Запускаю планировщики отчетов...")
 
@@ -76,10 +132,54 @@ async def start_schedulers():
             session_maker,
             admin_chat_id=config.ADMIN_CHAT_ID
         )
+        weekly_pnl_scheduler = WeeklyPnlScheduler(
+            bot,
+            session_maker,
+            admin_chat_id=config.ADMIN_CHAT_ID
+        )
+        stock_alert_scheduler = StockAlertScheduler(
+            bot,
+            session_maker,
+            admin_chat_id=config.ADMIN_CHAT_ID
+        )
 
         # Запускаем планировщики в фоновом режиме
         asyncio.create_task(current_scheduler.start_scheduler())
         asyncio.create_task(yesterday_scheduler.start_scheduler())
+        asyncio.create_task(weekly_pnl_scheduler.start_scheduler())
+        asyncio.create_task(stock_alert_scheduler.start_scheduler())
+
+        asyncio.create_task(user_profile_buffer.start_worker())
+
+        # Сброс кэша магазинов, когда их изменил другой процесс бота
+        if os.getenv("ACCOUNT_REGISTRY_LISTEN", "true").lower() in ("1", "true", "yes"):
+            asyncio.create_task(AccountRegistryListener().start_listener())
+
+        # Уведомления о выполненных заданиях на отчеты (строят процессы worker.py)
+        if report_queue_enabled():
+            asyncio.create_task(report_job_events.start_listener())
+
+        # Фоновая загрузка истории воронки продаж
+        if os.getenv("FUNNEL_BACKFILL_ENABLED", "true").lower() in ("1", "true", "yes"):
+            funnel_backfill_worker = FunnelBackfillWorker(session_maker)
+            asyncio.create_task(funnel_backfill_worker.start_worker())
+
+        # Фоновая синхронизация заказов и продаж в БД
+        if orders_sync_enabled():
+            orders_sales_sync_worker = OrdersSalesSyncWorker(session_maker)
+            asyncio.create_task(orders_sales_sync_worker.start_worker())
+
+        # Периодические снимки остатков
+        stock_snapshot_worker = StockSnapshotWorker(session_maker)
+        asyncio.create_task(stock_snapshot_worker.start_worker())
+
+        # Задержка цикла событий и стеки блокирующего кода
+        if loop_monitor_enabled():
+            asyncio.create_task(LoopMonitor().start_monitor())
+
+        # Эндпоинт /metrics для Prometheus
+        if metrics_enabled():
+            metrics_runner = await run_metrics_server()
 
         logger.info("Планировщики отчетов запущены")
 
@@ -200,8 +300,25 @@ async def on_startup(bot):
 
 async def on_shutdown(bot):
     """Действия при остановке бота"""
+    global metrics_runner
     logger.info("Остановка бота...")
 
+    # Сохраняем накопленные профили пользователей
+    try:
+        await user_profile_buffer.flush()
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении профилей пользователей: {e}")
+
+    compute_pool.shutdown()
+
+    # Останавливаем сервер метрик
+    if metrics_runner is not None:
+        try:
+            await metrics_runner.cleanup()
+        except Exception as e:
+            logger.error(f"Ошибка при остановке сервера метрик: {e}")
+        metrics_runner = None
+
     # Закрываем все соединения
     try:
         await bot.session.close()
@@ -212,6 +329,17 @@ async def on_shutdown(bot):
     print("\nБот остановлен")
 
 
+def register_middlewares(dispatcher: Dispatcher):
+    """Middleware обновлений (порядок важен: первый зарегистрированный - внешний)"""
+    dispatcher.update.outer_middleware(UpdateTracingMiddleware())  # 1-й
+    dispatcher.update.outer_middleware(ErrorMiddleware())  # 2-й
+    dispatcher.update.outer_middleware(ChatAuthMiddleware(admin_chat_id=config.ADMIN_CHAT_ID))  # 3-й
+    dispatcher.update.outer_middleware(DataBaseSession(session_pool=session_maker))  # 4-й
+    dispatcher.update.outer_middleware(UserProfileMiddleware(user_profile_buffer))  # 5-й
+    HandlerTracingMiddleware.register(dispatcher)
+    install_db_tracing(engine.sync_engine)
+
+
 async def main():
     """Основная функция запуска бота"""
     try:
@@ -220,16 +348,19 @@ async def main():
         dp.shutdown.register(on_shutdown)
 
         # Настраиваем middleware
-        dp.update.outer_middleware(ErrorMiddleware())  # 1-й
-        dp.update.outer_middleware(ChatAuthMiddleware(admin_chat_id=config.ADMIN_CHAT_ID))  # 2-й
-        dp.update.outer_middleware(DataBaseSession(session_pool=session_maker))  # 3-й
+        register_middlewares(dp)
 
-        # Удаляем вебхук и начинаем polling
-        logger.info("Удаляю вебхук и начинаю polling...")
-        await bot.delete_webhook(drop_pending_updates=True)
+        if webhook_mode_enabled():
+            # Продакшен: обновления приходят на встроенный aiohttp-сервер
+            logger.info("Запускаю бота в режиме вебхука...")
+            await run_webhook(dp, bot, allowed_updates=dp.resolve_used_update_types())
+        else:
+            # Локальная разработка: удаляем вебхук и начинаем polling
+            logger.info("Удаляю вебхук и начинаю polling...")
+            await bot.delete_webhook(drop_pending_updates=True)
 
-        logger.info("Начинаю прослушивание сообщений...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+            logger.info("Начинаю прослушивание сообщений...")
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем (Ctrl+C)")
@@ -241,6 +372,9 @@ async def main():
 
 
 if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+
     # Проверяем наличие необходимых переменных окружения
     if not config.BOT_TOKEN:
         logger.error("BOT_TOKEN не найден в переменных окружения")
@@ -249,6 +383,9 @@ if __name__ == "__main__":
     if not config.ADMIN_CHAT_ID:
         logger.warning("ADMIN_CHAT_ID не найден. Некоторые функции могут не работать.")
 
+    setup_bot()
+    setup_dispatcher()
+
     # Запускаем бота с обработкой исключений
     try:
         asyncio.run(main())
@@ -0,0 +1,60 @@
+# worker.py
+"""
+Процесс-исполнитель заданий на отчеты (очередь report_jobs).
+Запускается отдельно от бота, пропускная способность растет с числом процессов:
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+# Переменные окружения из .env должны быть загружены до импорта модулей проекта:
+# database.engine создает подключение к БД при импорте. Процессы пула вычислений импортируют
+# этот модуль как __mp_main__ и получают окружение от родителя
+if __name__ == "__main__":
+    load_dotenv()
+
+from database.account_registry import AccountRegistryListener
+from database.engine import session_maker
+from functions.compute_pool import compute_pool
+from functions.report_jobs import ReportWorker
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging():
+    """Настройка логирования"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('worker.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+async def main():
+    """Основная функция запуска исполнителя"""
+    try:
+        # Сброс кэша магазинов, когда их изменил процесс бота
+        if os.getenv("ACCOUNT_REGISTRY_LISTEN", "true").lower() in ("1", "true", "yes"):
+            asyncio.create_task(AccountRegistryListener().start_listener())
+
+        await ReportWorker(session_maker).start_worker()
+    finally:
+        compute_pool.shutdown()
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nИсполнитель заданий остановлен")
+    except Exception as e:
+        logger.error(f"Непредвиденная ошибка: {e}", exc_info=True)
+        sys.exit(1)